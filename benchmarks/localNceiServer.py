@@ -0,0 +1,294 @@
+##########################################################
+"""
+Local stand-in for the NCEI USCRN hourly02 (or subhourly01) tree (plus the elevation lookup API)
+so the ingest pipeline can be tested and benchmarked without network access.
+
+    server, baseUrl = startLocalNceiServer(years=[2020, 2021], numStations=20)
+    inputData["nceiBaseUrl"] = baseUrl + "/hourly02/"    (baseUrl + "/subhourly01/" with product="subhourly01")
+    inputData["elevationServiceUrl"] = baseUrl + "/api/v1/lookup"
+"""
+import io
+import json
+import time
+import random
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+##########################################################
+def getSyntheticStationName(stationIndex=0):
+    # Every 20th station sits outside the continental US, like the Alaska/Hawaii stations
+    state = "AK" if stationIndex % 20 == 19 else "TX"
+    return f"{state}_Synthetic_{stationIndex}_N"
+
+
+##########################################################
+def generateStationFile(year=2020, stationIndex=0, hours=None):
+    """
+    *** One synthetic hourly02 station file (38 whitespace separated columns, a full year by default)
+    *** Values are random but realistic in size and layout, including -99/-9999 sentinels and QC flags
+    """
+    rng = np.random.default_rng(year * 1000 + stationIndex)
+    if hours is None:
+        utcTimes = pd.date_range(
+            f"{year}-01-01 01:00", f"{year + 1}-01-01 00:00", freq="H"
+        )
+    else:
+        utcTimes = pd.date_range(f"{year}-01-01 01:00", periods=hours, freq="H")
+    n = len(utcTimes)
+    lstTimes = utcTimes - pd.Timedelta(hours=6)
+    longitude = (
+        -150.0 if stationIndex % 20 == 19 else -124.0 + (stationIndex * 7.3) % 57
+    )
+    latitude = 61.0 if stationIndex % 20 == 19 else 26.0 + (stationIndex * 3.1) % 22
+    temperature = np.round(
+        15 + 10 * np.sin(np.arange(n) / 24 * 2 * np.pi) + rng.normal(0, 2, n), 1
+    )
+    temperature[rng.random(n) < 0.02] = -9999.0
+    solarad = np.round(np.clip(rng.normal(200, 150, n), 0, None), 0)
+    flags = np.where(rng.random(n) < 0.01, 3, 0)
+    columns = {
+        "WBANNO": np.full(n, f"{10000 + stationIndex:05d}"),
+        "UTC_DATE": utcTimes.strftime("%Y%m%d"),
+        "UTC_TIME": utcTimes.strftime("%H%M"),
+        "LST_DATE": lstTimes.strftime("%Y%m%d"),
+        "LST_TIME": lstTimes.strftime("%H%M"),
+        "CRX_VN": np.full(n, "2.622"),
+        "LONGITUDE": np.full(n, f"{longitude:.2f}"),
+        "LATITUDE": np.full(n, f"{latitude:.2f}"),
+        "T_CALC": temperature,
+        "T_HR_AVG": temperature,
+        "T_MAX": np.round(temperature + 0.5, 1),
+        "T_MIN": np.round(temperature - 0.5, 1),
+        "P_CALC": np.round(
+            np.where(rng.random(n) < 0.1, rng.exponential(1.0, n), 0.0), 1
+        ),
+        "SOLARAD": solarad,
+        "SOLARAD_FLAG": flags,
+        "SOLARAD_MAX": solarad + 20,
+        "SOLARAD_MAX_FLAG": flags,
+        "SOLARAD_MIN": np.clip(solarad - 20, 0, None),
+        "SOLARAD_MIN_FLAG": flags,
+        "SUR_TEMP_TYPE": rng.choice(["C", "R"], n),
+        "SUR_TEMP": temperature,
+        "SUR_TEMP_FLAG": flags,
+        "SUR_TEMP_MAX": temperature,
+        "SUR_TEMP_MAX_FLAG": flags,
+        "SUR_TEMP_MIN": temperature,
+        "SUR_TEMP_MIN_FLAG": flags,
+        "RH_HR_AVG": np.round(np.clip(rng.normal(60, 15, n), 0, 100), 0),
+        "RH_HR_AVG_FLAG": flags,
+    }
+    for depth in [5, 10, 20, 50, 100]:
+        columns[f"SOIL_MOISTURE_{depth}"] = np.where(
+            depth == 100, -99.0, np.round(rng.uniform(0.05, 0.4, n), 3)
+        )
+    for depth in [5, 10, 20, 50, 100]:
+        columns[f"SOIL_TEMP_{depth}"] = np.where(
+            depth == 100, -9999.0, np.round(temperature / (1 + depth / 50), 1)
+        )
+    buffer = io.StringIO()
+    pd.DataFrame(columns).to_csv(buffer, sep=" ", header=False, index=False)
+    return buffer.getvalue().encode("utf-8")
+
+
+##########################################################
+def generateSubhourlyStationFile(year=2020, stationIndex=0, hours=None):
+    """
+    *** One synthetic subhourly01 station file (23 columns, 12 five-minute rows per hour)
+    """
+    rng = np.random.default_rng(year * 1000 + stationIndex)
+    if hours is None:
+        utcTimes = pd.date_range(
+            f"{year}-01-01 00:05", f"{year + 1}-01-01 00:00", freq="5min"
+        )
+    else:
+        utcTimes = pd.date_range(f"{year}-01-01 00:05", periods=hours * 12, freq="5min")
+    n = len(utcTimes)
+    lstTimes = utcTimes - pd.Timedelta(hours=6)
+    longitude = (
+        -150.0 if stationIndex % 20 == 19 else -124.0 + (stationIndex * 7.3) % 57
+    )
+    latitude = 61.0 if stationIndex % 20 == 19 else 26.0 + (stationIndex * 3.1) % 22
+    temperature = np.round(
+        15 + 10 * np.sin(np.arange(n) / 288 * 2 * np.pi) + rng.normal(0, 1, n), 1
+    )
+    temperature[rng.random(n) < 0.02] = -9999.0
+    flags = np.where(rng.random(n) < 0.01, 3, 0)
+    columns = {
+        "WBANNO": np.full(n, f"{10000 + stationIndex:05d}"),
+        "UTC_DATE": utcTimes.strftime("%Y%m%d"),
+        "UTC_TIME": utcTimes.strftime("%H%M"),
+        "LST_DATE": lstTimes.strftime("%Y%m%d"),
+        "LST_TIME": lstTimes.strftime("%H%M"),
+        "CRX_VN": np.full(n, "2.622"),
+        "LONGITUDE": np.full(n, f"{longitude:.2f}"),
+        "LATITUDE": np.full(n, f"{latitude:.2f}"),
+        "AIR_TEMPERATURE": temperature,
+        "PRECIPITATION": np.round(
+            np.where(rng.random(n) < 0.05, rng.exponential(0.2, n), 0.0), 2
+        ),
+        "SOLAR_RADIATION": np.round(np.clip(rng.normal(200, 150, n), 0, None), 0),
+        "SR_FLAG": flags,
+        "SURFACE_TEMPERATURE": temperature,
+        "ST_TYPE": rng.choice(["C", "R"], n),
+        "ST_FLAG": flags,
+        "RELATIVE_HUMIDITY": np.round(np.clip(rng.normal(60, 15, n), 0, 100), 0),
+        "RH_FLAG": flags,
+        "SOIL_MOISTURE_5": np.round(rng.uniform(0.05, 0.4, n), 3),
+        "SOIL_TEMPERATURE_5": np.round(temperature / 1.1, 1),
+        "WETNESS": np.full(n, -9999.0),
+        "WET_FLAG": np.zeros(n, int),
+        "WIND_1_5": np.round(rng.gamma(2.0, 1.5, n), 2),
+        "WIND_FLAG": np.zeros(n, int),
+    }
+    buffer = io.StringIO()
+    pd.DataFrame(columns).to_csv(buffer, sep=" ", header=False, index=False)
+    return buffer.getvalue().encode("utf-8")
+
+
+##########################################################
+def generateYearListing(year=2020, stationFiles={}):
+    """
+    *** Apache style directory listing, like https://www.ncei.noaa.gov/pub/data/uscrn/products/hourly02/{year}/
+    """
+    rows = []
+    for stationFile, body in stationFiles.items():
+        size = f"{len(body) / 1e6:.1f}M"
+        rows.append(
+            f'<a href="{stationFile}">{stationFile}</a>{" " * 8}{year + 1}-01-06 10:34  {size}'
+        )
+    body = "<html><body><h1>Index of /hourly02/{}</h1><pre>\n{}\n</pre></body></html>".format(
+        year, "\n".join(rows)
+    )
+    return body.encode("utf-8")
+
+
+##########################################################
+class LocalNceiHandler(BaseHTTPRequestHandler):
+    """
+    *** Serves /hourly02/{year}/ listings and station files (ETag + Range aware) and the batched
+    *** elevation lookup at /api/v1/lookup, with configurable latency and error rate
+    """
+
+    files = {}
+    latency = 0.0
+    errorRate = 0.0
+    stats = {"requests": 0, "bytesServed": 0, "errors": 0}
+    statsLock = threading.Lock()
+
+    def do_GET(self):
+        if self.injectLatencyAndErrors():
+            return
+        body = self.files.get(self.path)
+        if body is None:
+            self.reply(404, b"not found")
+            return
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.reply(304, b"", headers={"ETag": etag})
+            return
+        rangeHeader = self.headers.get("Range")
+        if rangeHeader:
+            offset = int(rangeHeader.replace("bytes=", "").split("-")[0])
+            if offset >= len(body):
+                self.reply(416, b"")
+                return
+            self.reply(206, body[offset:], headers={"ETag": etag})
+            return
+        self.reply(200, body, headers={"ETag": etag})
+
+    def do_POST(self):
+        if self.injectLatencyAndErrors():
+            return
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        results = [
+            {**location, "elevation": round(abs(location["latitude"]) * 30.0, 1)}
+            for location in payload["locations"]
+        ]
+        self.reply(200, json.dumps({"results": results}).encode("utf-8"))
+
+    def injectLatencyAndErrors(self):
+        if self.latency > 0:
+            time.sleep(self.latency)
+        if self.errorRate > 0 and random.random() < self.errorRate:
+            with self.statsLock:
+                self.stats["errors"] += 1
+            self.reply(503, b"service unavailable")
+            return True
+        return False
+
+    def reply(self, status=200, body=b"", headers={}):
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with self.statsLock:
+            self.stats["requests"] += 1
+            self.stats["bytesServed"] += len(body)
+
+    def log_message(self, *args):
+        pass
+
+
+##########################################################
+def startLocalNceiServer(
+    years=[2020],
+    numStations=10,
+    hours=None,
+    latency=0.0,
+    errorRate=0.0,
+    product="hourly02",
+):
+    """
+    *** Start the stand-in in a background thread, returns (server, "http://127.0.0.1:port")
+    *** Files are served under /{product}/, hourly02 or subhourly01
+    """
+    filePrefix, generateFile = {
+        "hourly02": ("CRNH0203", generateStationFile),
+        "subhourly01": ("CRNS0101-05", generateSubhourlyStationFile),
+    }[product]
+    files = {}
+    for year in years:
+        stationFiles = {}
+        for i in range(numStations):
+            stationFile = (
+                f"{filePrefix}-{year}-{getSyntheticStationName(stationIndex=i)}.txt"
+            )
+            stationFiles[stationFile] = generateFile(
+                year=year, stationIndex=i, hours=hours
+            )
+            files[f"/{product}/{year}/{stationFile}"] = stationFiles[stationFile]
+        files[f"/{product}/{year}/"] = generateYearListing(
+            year=year, stationFiles=stationFiles
+        )
+    handler = type(
+        "ConfiguredLocalNceiHandler",
+        (LocalNceiHandler,),
+        {
+            "files": files,
+            "latency": latency,
+            "errorRate": errorRate,
+            "stats": {"requests": 0, "bytesServed": 0, "errors": 0},
+            "statsLock": threading.Lock(),
+        },
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    server.handlerClass = handler
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+##########################################################
+def stopLocalNceiServer(server=None):
+    server.shutdown()
+    server.server_close()
+
+
+##########################################################
@@ -0,0 +1,347 @@
+##########################################################
+"""
+Offline ingest benchmarks against the local NCEI stand-in (benchmarks/localNceiServer.py),
+plus the point-in-time and range query latency of utils/queryEngine.py
+
+    python benchmarks/runBenchmarks.py                  # run and print results
+    python benchmarks/runBenchmarks.py --saveBaseline   # store results in benchmarks/baselines.json
+    python benchmarks/runBenchmarks.py --compare        # fail (exit 1) on regressions vs the baseline
+                                                        # (wall times relative to a calibration stage)
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "weatherForcastingCalculator"))
+sys.path.insert(0, BENCHMARK_DIR)
+
+from localNceiServer import (  # noqa: E402
+    generateStationFile,
+    getSyntheticStationName,
+    startLocalNceiServer,
+    stopLocalNceiServer,
+)
+from utils.dataCleaning import cleanData  # noqa: E402
+from utils.dataPrepAndParser import (  # noqa: E402
+    getCleanedDataStructure,
+    parserFunParallelized,
+    parserFunSlowAndInSeries,
+    verticallyStackObjectsInDict,
+)
+from utils.queryEngine import StationQueryEngine  # noqa: E402
+from utils.stationFileParser import parseHourly02Bytes  # noqa: E402
+from utils.utils import readFromJson  # noqa: E402
+
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, "baselines.json")
+# Absolute slack on top of the relative tolerance so tiny stages do not flag on noise
+REGRESSION_SLACK = {"wallSeconds": 0.5, "peakMemoryMB": 50.0}
+# Fixed CPU-bound stage timed on every run; wall times are compared relative to it, so a slower
+# (shared CI) machine does not read as a regression
+CALIBRATION_STAGE = "calibration"
+CALIBRATION_REPEATS = 3
+# Query stages time this many calls, so the gate (tolerance x baseline + slack) trips once a call
+# takes more than about half a millisecond
+QUERY_REPEATS = 1000
+
+
+##########################################################
+def getResidentMemoryBytes():
+    # Linux only; tracemalloc is not used because it slows the asyncio/aiohttp path ~8x
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+##########################################################
+def measureStage(name="", stageFunction=None, numBytes=0, numRows=0):
+    """
+    *** Wall time, peak resident memory above the starting point and throughput of one stage
+    *** (memory is sampled every 10 ms in this process, parse workers are not included)
+    """
+    startMemory = getResidentMemoryBytes()
+    peakMemory = [startMemory]
+    stageDone = threading.Event()
+
+    def sampleMemory():
+        while not stageDone.wait(0.01):
+            peakMemory[0] = max(peakMemory[0], getResidentMemoryBytes())
+
+    sampler = threading.Thread(target=sampleMemory, daemon=True)
+    sampler.start()
+    startTime = time.perf_counter()
+    result = stageFunction()
+    wallSeconds = time.perf_counter() - startTime
+    stageDone.set()
+    sampler.join()
+    peakMemory[0] = max(peakMemory[0], getResidentMemoryBytes())
+    metrics = {
+        "wallSeconds": round(wallSeconds, 4),
+        "peakMemoryMB": round((peakMemory[0] - startMemory) / 1e6, 2),
+    }
+    if numBytes:
+        metrics["throughputMBps"] = round(numBytes / 1e6 / wallSeconds, 2)
+    if numRows:
+        metrics["rowsPerSecond"] = round(numRows / wallSeconds, 1)
+    print(f"{name:28s} {metrics}")
+    return result, metrics
+
+
+##########################################################
+def makeRunDirectory(rootDir=None):
+    """
+    *** Fresh Data/Figures directory for one stage, inside rootDir (removed after the run)
+    """
+    dirname = tempfile.mkdtemp(prefix="weatherBenchmark", dir=rootDir)
+    os.makedirs(os.path.join(dirname, "Data"))
+    os.makedirs(os.path.join(dirname, "Figures"))
+    return dirname
+
+
+##########################################################
+def calibrate(stationFiles=[]):
+    """
+    *** Best of CALIBRATION_REPEATS timings of parsing the same station files: a yardstick of this
+    *** machine's speed that does not depend on the network, disk or code paths under test
+    """
+    timings = []
+    for _ in range(CALIBRATION_REPEATS):
+        startTime = time.perf_counter()
+        for rawBytes in stationFiles:
+            parseHourly02Bytes(rawBytes=rawBytes)
+        timings.append(time.perf_counter() - startTime)
+    wallSeconds = min(timings)
+    print(f"{CALIBRATION_STAGE:28s} {{'wallSeconds': {wallSeconds:.4f}}}")
+    return {"wallSeconds": round(wallSeconds, 4)}
+
+
+##########################################################
+def runQueries(engine=None, years=[], kind="pointInTime", repeats=QUERY_REPEATS):
+    """
+    *** repeats point-in-time snapshots of every station, or one-week range queries of one station,
+    *** at hours spread over the benchmark years
+    """
+    firstHour = np.datetime64(f"{years[0]}-01-01T00", "h")
+    numHours = (np.datetime64(f"{years[-1] + 1}-01-01T00", "h") - firstHour).astype(int)
+    for i in range(repeats):
+        stamp = firstHour + (i * 7919) % (numHours - 168)
+        if kind == "pointInTime":
+            engine.pointInTime(stamp=stamp, variables=["T_HR_AVG"])
+        else:
+            engine.query(
+                stations=engine.stations[i % len(engine.stations)],
+                variables=["T_HR_AVG"],
+                start=stamp,
+                end=stamp + 168,
+            )
+
+
+##########################################################
+def runBenchmarks(years=[2020, 2021], numStations=20, latency=0.005, errorRate=0.0):
+    server, serverUrl = startLocalNceiServer(
+        years=years, numStations=numStations, latency=latency, errorRate=errorRate
+    )
+    inputData = {
+        "idealDates": years,
+        "batchSize": 20,
+        "parseWorkers": 2,
+        "maxRetries": 4,
+        "retryBaseDelay": 0.05,
+        "nceiBaseUrl": serverUrl + "/hourly02/",
+        "elevationServiceUrl": serverUrl + "/api/v1/lookup",
+    }
+    stationFileBytes = {
+        (year, i): generateStationFile(year=year, stationIndex=i)
+        for year in years
+        for i in range(numStations)
+    }
+    numBytes = sum(len(body) for body in stationFileBytes.values())
+    numRows = sum(body.count(b"\n") for body in stationFileBytes.values())
+    results = {}
+    # Every stage directory lives under one temporary root, removed however the run ends
+    tempRoot = tempfile.TemporaryDirectory(prefix="weatherBenchmarks")
+    try:
+        results[CALIBRATION_STAGE] = calibrate(
+            stationFiles=[stationFileBytes[(years[0], i)] for i in range(numStations)]
+        )
+        ##################################################
+        # Both ingest paths write the json object and the store, so their times compare
+        dirname = makeRunDirectory(rootDir=tempRoot.name)
+        _, results["parserFunParallelized"] = measureStage(
+            name="parserFunParallelized",
+            stageFunction=lambda: asyncio.run(
+                parserFunParallelized(
+                    inputData=inputData,
+                    dirname=dirname,
+                    writeJson=True,
+                    writeStore=True,
+                )
+            ),
+            numBytes=numBytes,
+            numRows=numRows,
+        )
+        ##################################################
+        _, results["parserFunSlowAndInSeries"] = measureStage(
+            name="parserFunSlowAndInSeries",
+            stageFunction=lambda: parserFunSlowAndInSeries(
+                inputData=inputData,
+                dirname=makeRunDirectory(rootDir=tempRoot.name),
+                writeJson=True,
+                writeStore=True,
+            ),
+            numBytes=numBytes,
+            numRows=numRows,
+        )
+        ##################################################
+        dictAllData = {
+            str(year): {
+                getSyntheticStationName(stationIndex=i): parseHourly02Bytes(
+                    rawBytes=stationFileBytes[(year, i)]
+                )
+                for i in range(numStations)
+            }
+            for year in years
+        }
+        stackedData = verticallyStackObjectsInDict(dictAllData=dictAllData)
+        engine = StationQueryEngine(weatherDataDictObjectAll=stackedData)
+        for kind in ["pointInTime", "stationRange"]:
+            _, results[kind] = measureStage(
+                name=f"{kind} x{QUERY_REPEATS}",
+                stageFunction=lambda: runQueries(engine=engine, years=years, kind=kind),
+            )
+        _, results["cleanData"] = measureStage(
+            name="cleanData",
+            stageFunction=lambda: cleanData(
+                weatherDataDictObjectAll=stackedData,
+                dirname=makeRunDirectory(rootDir=tempRoot.name),
+                inputData=inputData,
+            ),
+            numRows=numRows,
+        )
+        ##################################################
+        jsonPath = os.path.join(dirname, "Data", "weatherDataJSONObject.json")
+        _, results["jsonLoad"] = measureStage(
+            name="jsonLoad",
+            stageFunction=lambda: json.load(open(jsonPath, "r")),
+            numBytes=os.path.getsize(jsonPath),
+        )
+        _, results["jsonStreamLoad"] = measureStage(
+            name="jsonStreamLoad",
+            stageFunction=lambda: readFromJson(fileName=jsonPath),
+            numBytes=os.path.getsize(jsonPath),
+        )
+        _, results["cachedLoad"] = measureStage(
+            name="cachedLoad (parseDataBool=0)",
+            stageFunction=lambda: asyncio.run(
+                getCleanedDataStructure(inputData={"parseDataBool": 0}, dirname=dirname)
+            ),
+        )
+    finally:
+        stopLocalNceiServer(server=server)
+        tempRoot.cleanup()
+    config = {
+        "years": years,
+        "numStations": numStations,
+        "latency": latency,
+        "errorRate": errorRate,
+        "stationBytes": numBytes,
+        "rows": numRows,
+    }
+    return {"config": config, "results": results}
+
+
+##########################################################
+def compareWithBaseline(report={}, baseline={}, tolerance=2.0, memoryOnly=False):
+    """
+    *** A stage regresses when its wall time or peak memory exceeds tolerance x the baseline value
+    *** (plus REGRESSION_SLACK); wall times are first scaled by how much slower the calibration stage
+    *** ran than in the baseline, memoryOnly skips them altogether
+    *** A stage without a baseline counts as a regression too, otherwise a new stage is never gated
+    """
+    regressions = [
+        f"{stage}: no baseline, rerun with --saveBaseline"
+        for stage in report["results"]
+        if stage not in baseline["results"]
+    ]
+    speedFactor = 1.0
+    if CALIBRATION_STAGE in baseline["results"]:
+        speedFactor = max(
+            1.0,
+            report["results"][CALIBRATION_STAGE]["wallSeconds"]
+            / baseline["results"][CALIBRATION_STAGE]["wallSeconds"],
+        )
+    for stage, baselineMetrics in baseline["results"].items():
+        if stage == CALIBRATION_STAGE:
+            continue
+        metrics = report["results"].get(stage, {})
+        for key, slack in REGRESSION_SLACK.items():
+            if key == "wallSeconds" and memoryOnly:
+                continue
+            scale = speedFactor if key == "wallSeconds" else 1.0
+            limit = tolerance * baselineMetrics[key] * scale + slack
+            if key in metrics and metrics[key] > limit:
+                regressions.append(
+                    f"{stage}.{key}: {metrics[key]} > {tolerance} x {baselineMetrics[key]}"
+                    + (f" x {speedFactor:.2f} (calibration)" if scale != 1.0 else "")
+                )
+    return regressions
+
+
+##########################################################
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--years", type=int, nargs="+", default=[2020, 2021])
+    parser.add_argument("--stations", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--errorRate", type=float, default=0.0)
+    parser.add_argument("--saveBaseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=2.0)
+    parser.add_argument(
+        "--memoryOnly", action="store_true", help="compare peak memory only"
+    )
+    args = parser.parse_args()
+    ######################################################
+    report = runBenchmarks(
+        years=args.years,
+        numStations=args.stations,
+        latency=args.latency,
+        errorRate=args.errorRate,
+    )
+    if args.saveBaseline:
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(report, f, indent=2)
+        print("Saved baseline to", BASELINE_PATH)
+    if args.compare:
+        with open(BASELINE_PATH, "r") as f:
+            baseline = json.load(f)
+        if baseline["config"] != report["config"]:
+            print("Benchmark config differs from the baseline, comparison skipped")
+            return 0
+        regressions = compareWithBaseline(
+            report=report,
+            baseline=baseline,
+            tolerance=args.tolerance,
+            memoryOnly=args.memoryOnly,
+        )
+        for regression in regressions:
+            print("REGRESSION", regression)
+        return 1 if regressions else 0
+    return 0
+
+
+##########################################################
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,37 @@
+"""
+Shared fixtures: ingest inputs pointed at the local NCEI stand-in and run directories
+"""
+import pytest
+
+
+@pytest.fixture
+def makeInputData():
+    """
+    Ingest inputData against a localNceiServer at serverUrl, extra options override the defaults
+    """
+
+    def makeInputData(serverUrl="", years=(2020, 2021), product="hourly02", **options):
+        return {
+            "idealDates": list(years),
+            "batchSize": 4,
+            "parseWorkers": 0,
+            "product": product,
+            "nceiBaseUrl": f"{serverUrl}/{product}/",
+            "elevationServiceUrl": serverUrl + "/api/v1/lookup",
+            **options,
+        }
+
+    return makeInputData
+
+
+@pytest.fixture
+def makeDataDir():
+    """
+    Run directory (with its Data/ folder) at path, returned as the dirname string the pipeline takes
+    """
+
+    def makeDataDir(path):
+        (path / "Data").mkdir(parents=True)
+        return str(path)
+
+    return makeDataDir
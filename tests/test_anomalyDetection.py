@@ -0,0 +1,137 @@
+"""
+Tests for the rolling-window/spatial anomaly checks and their bitmask in utils/anomalyDetection.py
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "weatherForcastingCalculator")
+)
+
+from utils.anomalyDetection import (  # noqa: E402
+    ANOMALY_FLAGS,
+    detectAnomalies,
+    detectVariableAnomalies,
+    loadAnomalyMasks,
+    maskAnomalies,
+    writeAnomalyMasks,
+)
+
+HOURS = 24 * 30
+
+
+def makeNetwork(numStations=6):
+    """
+    *** Stations a few km apart sharing one diurnal temperature cycle plus a little noise
+    """
+    rng = np.random.default_rng(0)
+    stamps = pd.date_range("2021-06-01 00:00", periods=HOURS, freq="H")
+    utcDate = stamps.strftime("%Y%m%d").astype(np.int32).values
+    utcTime = stamps.strftime("%H%M").astype(np.int16).values
+    cycle = 10 * np.sin(2 * np.pi * np.arange(HOURS) / 24)
+    stations = {}
+    for i in range(numStations):
+        stations[f"S{i}"] = {
+            "UTC_DATE": utcDate,
+            "UTC_TIME": utcTime,
+            "T_HR_AVG": 20 + i + cycle + rng.normal(0, 0.3, HOURS),
+            "RH_HR_AVG": 60 - cycle + rng.normal(0, 2.0, HOURS),
+        }
+    dfStations = pd.DataFrame(
+        {
+            "City": list(stations),
+            "Longitude": -100.0 + 0.1 * np.arange(numStations),
+            "Latitude": 35.0 + 0.05 * np.arange(numStations),
+            "Elevation": np.full(numStations, 500.0),
+        }
+    )
+    return stations, dfStations
+
+
+def test_detects_spike_stuck_step_and_spatial_outliers():
+    stations, dfStations = makeNetwork()
+    temperature = stations["S0"]["T_HR_AVG"]
+    temperature[100] += 15
+    temperature[300:312] = temperature[300]
+    stations["S1"]["T_HR_AVG"][400:] += 8
+    # Offset only S2 for half a day: its own series stays smooth, only the neighbors disagree
+    stations["S2"]["T_HR_AVG"][600:612] += np.linspace(0, 6, 12)
+    stations["S3"]["T_HR_AVG"][200:210] = np.nan
+    masks, dfCounts = detectAnomalies(
+        weatherDataDictObjectAll=stations, dfStations=dfStations
+    )
+    assert set(masks["S0"]) == {"T_HR_AVG", "RH_HR_AVG"}
+    mask = masks["S0"]["T_HR_AVG"]
+    assert mask.dtype == np.uint8 and len(mask) == HOURS
+    assert mask[100] & ANOMALY_FLAGS["spike"]
+    assert (mask[300:312] & ANOMALY_FLAGS["stuck"]).all()
+    assert not (mask[:299] & ANOMALY_FLAGS["stuck"]).any()
+    step = masks["S1"]["T_HR_AVG"] & ANOMALY_FLAGS["step"]
+    assert step[398:403].any() and step.sum() <= 4
+    assert (masks["S2"]["T_HR_AVG"][604:612] & ANOMALY_FLAGS["spatial"]).any()
+    # Missing values are never flagged, clean stations stay clean
+    assert (masks["S3"]["T_HR_AVG"][200:210] == 0).all()
+    assert not masks["S5"]["T_HR_AVG"].any()
+    assert dfCounts.loc["S0", ("T_HR_AVG", "spike")] >= 1
+    assert dfCounts.loc["S5", ("T_HR_AVG", "stuck")] == 0
+
+
+def test_clean_diurnal_data_is_not_flagged():
+    rng = np.random.default_rng(1)
+    hours = np.arange(24 * 365)
+    # Daily cycle whose amplitude changes with the season, plus noise
+    amplitude = 8 + 4 * np.sin(2 * np.pi * hours / len(hours))
+    cycle = amplitude * np.sin(2 * np.pi * hours / 24)
+    values = cycle[:, None] + rng.normal(0, 0.5, (len(hours), 20))
+    mask = detectVariableAnomalies(values=values, variable="T_HR_AVG", firstHourOfDay=5)
+    assert not mask.any()
+    # A spike well inside the daily range is still found
+    values[1000, 3] += 6
+    mask = detectVariableAnomalies(values=values, variable="T_HR_AVG", firstHourOfDay=5)
+    assert mask[1000, 3] & ANOMALY_FLAGS["spike"]
+    assert (mask & ANOMALY_FLAGS["spike"]).sum() == 1
+
+
+def test_stations_on_different_hours_and_without_coordinates():
+    stations, _ = makeNetwork(numStations=3)
+    for column in ["UTC_DATE", "UTC_TIME", "T_HR_AVG", "RH_HR_AVG"]:
+        stations["S2"][column] = stations["S2"][column][48:]
+    stations["S2"]["T_HR_AVG"][10] -= 20
+    masks, _ = detectAnomalies(
+        weatherDataDictObjectAll=stations, variables=["T_HR_AVG"]
+    )
+    assert len(masks["S2"]["T_HR_AVG"]) == HOURS - 48
+    assert masks["S2"]["T_HR_AVG"][10] & ANOMALY_FLAGS["spike"]
+    # Without dfStations there are no neighbors, so the spatial bit is never set
+    assert not any(
+        (m["T_HR_AVG"] & ANOMALY_FLAGS["spatial"]).any() for m in masks.values()
+    )
+
+
+def test_masks_round_trip_and_mask_values(tmp_path):
+    masks = {
+        "S0": {"T_HR_AVG": np.array([0, 1, 2, 8], np.uint8)},
+        "S1": {
+            "T_HR_AVG": np.zeros(3, np.uint8),
+            "SOLARAD": np.array([4, 0, 0], np.uint8),
+        },
+    }
+    fileName = str(tmp_path / "anomalyMasks.npz")
+    writeAnomalyMasks(masks=masks, outFileName=fileName)
+    loaded = loadAnomalyMasks(fileName=fileName)
+    assert set(loaded) == {"S0", "S1"}
+    np.testing.assert_array_equal(loaded["S1"]["SOLARAD"], [4, 0, 0])
+    values = np.array([1.0, 2.0, 3.0, 4.0])
+    np.testing.assert_array_equal(
+        maskAnomalies(values=values, mask=masks["S0"]["T_HR_AVG"]),
+        [1.0, np.nan, np.nan, np.nan],
+    )
+    np.testing.assert_array_equal(
+        maskAnomalies(values=values, mask=masks["S0"]["T_HR_AVG"], flags=["stuck"]),
+        [1.0, 2.0, np.nan, 4.0],
+    )
+    # The input is left untouched
+    assert not np.isnan(values).any()
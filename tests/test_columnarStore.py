@@ -0,0 +1,74 @@
+"""
+Tests for the memory-mapped columnar station store
+"""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "weatherForcastingCalculator")
+)
+
+from utils.columnarStore import (  # noqa: E402
+    columnarStoreExists,
+    openColumnarStore,
+    writeColumnarStore,
+)
+
+
+def test_columnar_store_round_trip(tmp_path):
+    data = {
+        "TX_Austin_33_NW": {
+            "T_HR_AVG": np.array([1.5, np.nan, -3.25]),
+            "SUR_TEMP_TYPE": np.array(["C", "R", "U"]),
+            "UTC_DATE": np.array([20200101, 20200101, 20200101], dtype=np.int32),
+        },
+        "AK_Barrow_4_ENE": {
+            "T_HR_AVG": np.array([], dtype=float),
+            "SUR_TEMP_TYPE": ["R"],
+            "UTC_DATE": np.array([20200102], dtype=np.int32),
+        },
+    }
+    storeDir = str(tmp_path / "store")
+    writeColumnarStore(data=data, storeDir=storeDir)
+    assert columnarStoreExists(storeDir=storeDir)
+    store = openColumnarStore(storeDir=storeDir)
+    assert list(store.keys()) == list(data.keys())
+    assert store["TX_Austin_33_NW"].openColumns == {}
+    np.testing.assert_array_equal(
+        store["TX_Austin_33_NW"]["T_HR_AVG"], data["TX_Austin_33_NW"]["T_HR_AVG"]
+    )
+    assert list(store["TX_Austin_33_NW"].openColumns) == ["T_HR_AVG"]
+    assert store["TX_Austin_33_NW"]["UTC_DATE"].dtype == np.int32
+    assert store["AK_Barrow_4_ENE"]["SUR_TEMP_TYPE"].tolist() == ["R"]
+    assert len(store["AK_Barrow_4_ENE"]["T_HR_AVG"]) == 0
+    # Copy-on-write: in-memory edits never reach the files on disk
+    store["TX_Austin_33_NW"]["T_HR_AVG"][0] = 99.0
+    reopened = openColumnarStore(storeDir=storeDir)
+    assert reopened["TX_Austin_33_NW"]["T_HR_AVG"][0] == 1.5
+
+
+def test_rewrite_swaps_in_a_new_store_without_touching_open_columns(tmp_path):
+    storeDir = str(tmp_path / "store")
+    writeColumnarStore(
+        data={
+            "A": {"T_HR_AVG": np.array([1.0, 2.0])},
+            "B": {"T_HR_AVG": np.array([3.0])},
+        },
+        storeDir=storeDir,
+    )
+    oldStore = openColumnarStore(storeDir=storeDir)
+    oldColumn = oldStore["A"]["T_HR_AVG"]
+    # Stations are renumbered on rewrite, so the new A lands where B was
+    writeColumnarStore(
+        data={"C": {"T_HR_AVG": np.array([7.0])}, "A": {"T_HR_AVG": np.array([5.0])}},
+        storeDir=storeDir,
+    )
+    np.testing.assert_array_equal(oldColumn, [1.0, 2.0])
+    store = openColumnarStore(storeDir=storeDir)
+    assert list(store) == ["C", "A"]
+    np.testing.assert_array_equal(store["A"]["T_HR_AVG"], [5.0])
+    # The dropped station's directory is gone, nothing is left next to the store
+    assert sorted(os.listdir(storeDir)) == ["manifest.json", "s0000", "s0001"]
+    assert sorted(os.listdir(tmp_path)) == ["store"]
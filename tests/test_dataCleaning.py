@@ -0,0 +1,157 @@
+"""
+Tests for station cleaning and the cached elevation lookups
+"""
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "weatherForcastingCalculator")
+)
+
+from utils.dataCleaning import (  # noqa: E402
+    getElevationAndDataFrameOfDesiredWeatherStations,
+)
+
+
+class ElevationStandIn(BaseHTTPRequestHandler):
+    """Local stand-in for the open-elevation batched lookup (elevation = 10 * latitude)"""
+
+    requestedLocations = []
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        ElevationStandIn.requestedLocations.append(payload["locations"])
+        results = [
+            {**location, "elevation": 10 * location["latitude"]}
+            for location in payload["locations"]
+        ]
+        body = json.dumps({"results": results}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def elevationServiceUrl():
+    ElevationStandIn.requestedLocations = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ElevationStandIn)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/api/v1/lookup"
+    server.shutdown()
+    server.server_close()
+
+
+def test_elevations_are_batched_filtered_and_cached(tmp_path, elevationServiceUrl):
+    (tmp_path / "Data").mkdir()
+    (tmp_path / "Figures").mkdir()
+    data = {
+        "TX_Austin_33_NW": {"LONGITUDE": np.array([-97.9]), "LATITUDE": [30.6]},
+        "CO_Boulder_14_W": {"LONGITUDE": np.array([-105.5]), "LATITUDE": [40.0]},
+        "AK_Barrow_4_ENE": {"LONGITUDE": np.array([-156.6]), "LATITUDE": [71.3]},
+    }
+    for _ in range(2):
+        dfStations = getElevationAndDataFrameOfDesiredWeatherStations(
+            weatherDataDictObjectAll=data,
+            dirname=str(tmp_path),
+            elevationServiceUrl=elevationServiceUrl,
+        )
+    # One batched request, only for stations that pass the continental filter
+    assert len(ElevationStandIn.requestedLocations) == 1
+    assert len(ElevationStandIn.requestedLocations[0]) == 2
+    assert dfStations["City"].tolist() == ["TX_Austin_33_NW", "CO_Boulder_14_W"]
+    np.testing.assert_allclose(np.float64(dfStations["Elevation"]), [306.0, 400.0])
+    assert (
+        dfStations[["Longitude", "Latitude", "Elevation"]].dtypes == np.float64
+    ).all()
+    assert (tmp_path / "Data" / "elevationCache.json").exists()
+
+
+def test_clean_all_stations_masks_sentinels_and_flags_in_one_pass():
+    from utils.dataCleaning import cleanAllStations
+
+    data = {
+        "A": {
+            "LONGITUDE": np.array([-99.0, -99.0, -99.0]),
+            "T_HR_AVG": np.array([1.0, -9999.0, 3.0]),
+            "RH_HR_AVG": np.array([50.0, 60.0, 70.0]),
+            "RH_HR_AVG_FLAG": np.array([0, 3, 0], dtype=np.int8),
+            "SUR_TEMP_TYPE": np.array(["C", "C", "R"]),
+        },
+        "B": {
+            "LONGITUDE": np.array([-97.0]),
+            "T_HR_AVG": np.array([-99.0]),
+            "RH_HR_AVG": np.array([-9999.0]),
+            "RH_HR_AVG_FLAG": np.array([0], dtype=np.int8),
+            "SUR_TEMP_TYPE": np.array(["U"]),
+        },
+    }
+    originalTemperature = data["A"]["T_HR_AVG"]
+    cleaned, dfMaskedCounts = cleanAllStations(weatherDataDictObjectAll=data)
+    np.testing.assert_array_equal(cleaned["A"]["T_HR_AVG"], [1.0, np.nan, 3.0])
+    assert cleaned["A"]["T_HR_AVG"] is originalTemperature  # written in place
+    np.testing.assert_array_equal(cleaned["A"]["RH_HR_AVG"], [50.0, np.nan, 70.0])
+    np.testing.assert_array_equal(cleaned["A"]["LONGITUDE"], [-99.0, -99.0, -99.0])
+    assert np.isnan(cleaned["B"]["T_HR_AVG"][0])
+    assert cleaned["B"]["SUR_TEMP_TYPE"].tolist() == ["U"]
+    assert dfMaskedCounts.loc["A", "RH_HR_AVG"] == 1
+    assert dfMaskedCounts.loc["B", "RH_HR_AVG"] == 1
+    assert dfMaskedCounts["LONGITUDE"].sum() == 0
+
+
+def test_clean_all_stations_leaves_the_input_untouched_unless_in_place():
+    from utils.dataCleaning import cleanAllStations
+    from utils.stationTable import StationTable
+
+    data = {
+        "A": {
+            "T_HR_AVG": np.array([1.0, -9999.0, 3.0]),
+            "SUR_TEMP_TYPE": np.array(["C", "C", "R"]),
+        },
+        "B": {"T_HR_AVG": np.array([-99.0]), "SUR_TEMP_TYPE": np.array(["U"])},
+    }
+    original = {s: dict(columns) for s, columns in data.items()}
+    cleaned, dfMaskedCounts = cleanAllStations(
+        weatherDataDictObjectAll=data, inPlace=False
+    )
+    assert cleaned is not data and cleaned["A"] is not data["A"]
+    np.testing.assert_array_equal(cleaned["A"]["T_HR_AVG"], [1.0, np.nan, 3.0])
+    assert dfMaskedCounts["T_HR_AVG"].sum() == 2
+    for station, columns in original.items():
+        for column, values in columns.items():
+            assert data[station][column] is values
+    np.testing.assert_array_equal(data["A"]["T_HR_AVG"], [1.0, -9999.0, 3.0])
+    # Same for the shared buffers of a StationTable
+    table = StationTable.fromStationDict(weatherDataDictObjectAll=data)
+    cleanedTable, _ = cleanAllStations(weatherDataDictObjectAll=table, inPlace=False)
+    assert np.isnan(cleanedTable["B"]["T_HR_AVG"][0])
+    assert table["B"]["T_HR_AVG"][0] == -99.0
+    assert cleanedTable["A"]["SUR_TEMP_TYPE"].tolist() == ["C", "C", "R"]
+
+
+def test_cleaning_keeps_the_parsed_column_dtypes():
+    from utils.dataCleaning import cleanStationColumns
+    from utils.stationFileParser import parseHourly02Bytes
+
+    values = ["03047", "20200101", "0100", "20191231", "1800", "2.622"]
+    values += ["-102.81", "30.62"] + ["3.1"] * 6
+    values += ["0"] * 5 + ["C", "0.8", "0", "1.2", "0", "0.4", "0", "62", "3"]
+    values += ["-99.000"] * 5 + ["-9999.0"] * 5
+    parsed = parseHourly02Bytes((" ".join(values) + "\n").encode())
+    dtypes = {column: values.dtype for column, values in parsed.items()}
+    cleaned = cleanStationColumns(stationDict=parsed)
+    assert {column: values.dtype for column, values in cleaned.items()} == dtypes
+    assert cleaned["CRX_VN"].tolist() == ["2.622"]
+    assert cleaned["RH_HR_AVG_FLAG"].tolist() == [3]
+    assert np.isnan(cleaned["RH_HR_AVG"][0]) and np.isnan(cleaned["SOIL_TEMP_5"][0])
@@ -0,0 +1,204 @@
+"""
+Tests for the async ingest helpers in dataPrepAndParser
+"""
+import asyncio
+import os
+import random
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import aiohttp
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "weatherForcastingCalculator")
+)
+
+import utils.dataPrepAndParser as dataPrepAndParser  # noqa: E402
+
+SAMPLE_LINE = b"03047 20200101 0100 20191231 1800 2.622 -102.81 30.62" + b" 3.1" * 6
+SAMPLE_LINE += b" 0" * 5 + b" C 0.8 0 1.2 0 0.4 0 62 0" + b" -99.0" * 5
+SAMPLE_LINE += b" -9999.0" * 5 + b"\n"
+
+
+def test_stream_station_downloads_keeps_bounded_concurrency(monkeypatch):
+    inFlight = {"now": 0, "max": 0}
+
+    async def fakeProcessStationData(session, year, stationFile, **kwargs):
+        inFlight["now"] += 1
+        inFlight["max"] = max(inFlight["max"], inFlight["now"])
+        await asyncio.sleep(random.uniform(0, 0.005))
+        inFlight["now"] -= 1
+        if stationFile == "bad.txt":
+            raise ValueError("broken file")
+        return stationFile.replace(".txt", ""), {"T_HR_AVG": [1.0]}
+
+    monkeypatch.setattr(dataPrepAndParser, "processStationData", fakeProcessStationData)
+    jobs = [(year, f"s{i}.txt") for year in ["2020", "2021"] for i in range(25)]
+    jobs.append(("2021", "bad.txt"))
+    results = []
+    asyncio.run(
+        dataPrepAndParser.streamStationDownloads(
+            inputData={"batchSize": 4},
+            jobs=jobs,
+            onResult=lambda *result: results.append(result),
+        )
+    )
+    assert inFlight["max"] == 4
+    assert len(results) == len(jobs)
+    assert ("2021", "bad.txt", "", {}) in results
+
+
+def test_process_station_data_parses_in_process_pool(monkeypatch):
+    from concurrent.futures import ProcessPoolExecutor
+
+    rawBytes = SAMPLE_LINE
+
+    async def fakeFetchURLContent(session="", url="", **kwargs):
+        return rawBytes
+
+    monkeypatch.setattr(dataPrepAndParser, "fetchURLContent", fakeFetchURLContent)
+
+    async def run():
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            return await dataPrepAndParser.processStationData(
+                year="2020",
+                stationFile="CRNH0203-2020-TX_Test_1_N.txt",
+                executor=executor,
+            )
+
+    stationLabel, stationData = asyncio.run(run())
+    assert stationLabel == "TX_Test_1_N"
+    assert stationData["UTC_DATE"].dtype.name == "int32"
+    assert stationData["T_HR_AVG"].tolist() == [3.1]
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    requests = 0
+
+    def do_GET(self):
+        FlakyHandler.requests += 1
+        if self.path.endswith("missing.txt"):
+            status, body = 404, b"not found"
+        elif FlakyHandler.requests < 3:
+            status, body = 503, b"busy"
+        else:
+            status, body = 200, b"ok"
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_fetch_url_content_retries_with_backoff():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/2020/"
+
+    async def fetch(retryPolicy, url=url):
+        async with aiohttp.ClientSession() as session:
+            return await dataPrepAndParser.fetchURLContent(
+                session=session, url=url, retryPolicy=retryPolicy
+            )
+
+    try:
+        FlakyHandler.requests = 0
+        assert asyncio.run(fetch({"maxRetries": 0})) is None
+        FlakyHandler.requests = 0
+        assert asyncio.run(fetch({"maxRetries": 3, "retryBaseDelay": 0.01})) == "ok"
+        assert FlakyHandler.requests == 3
+        # A missing file is not retried
+        FlakyHandler.requests = 0
+        missingUrl = url + "missing.txt"
+        assert asyncio.run(fetch({"maxRetries": 3}, url=missingUrl)) is None
+        assert FlakyHandler.requests == 1
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_resumed_manifest_reads_completed_files_from_cache(tmp_path):
+    from utils.httpCache import HttpCache
+    from utils.ingestManifest import IngestManifest
+
+    stationFile = "CRNH0203-2020-TX_Test_1_N.txt"
+    url = dataPrepAndParser.getStationFileUrl(year="2020", stationFile=stationFile)
+    cache = HttpCache(cacheDir=str(tmp_path / "httpCache"))
+    cache.store(url=url, body=SAMPLE_LINE)
+    manifest = IngestManifest(manifestPath=str(tmp_path / "ingestManifest.json"))
+    manifest.markCompleted(url=url, year="2020", stationFile=stationFile)
+    manifest.save()
+    resumed = IngestManifest(manifestPath=manifest.manifestPath, resume=True)
+    # No session: any network access would fail
+    stationLabel, stationData = asyncio.run(
+        dataPrepAndParser.processStationData(
+            year="2020", stationFile=stationFile, cache=cache, manifest=resumed
+        )
+    )
+    assert stationLabel == "TX_Test_1_N"
+    assert stationData["T_HR_AVG"].tolist() == [3.1]
+
+
+def test_legacy_json_is_migrated_into_the_store(tmp_path):
+    import numpy as np
+    import pandas as pd
+    from utils.utils import writeToJson
+
+    (tmp_path / "Data").mkdir()
+    stations = {
+        f"TX_Station_{i}": {
+            "UTC_DATE": np.full(30, 20200101 + i),
+            "T_HR_AVG": np.linspace(0, 1, 30) + i,
+        }
+        for i in range(3)
+    }
+    writeToJson(
+        data=stations, outFileName=str(tmp_path / "Data" / "weatherDataJSONObject.json")
+    )
+    pd.DataFrame({"City": list(stations)}).to_csv(
+        tmp_path / "Data" / "Weather Stations Info.csv", index=False
+    )
+    store, dfStations = asyncio.run(
+        dataPrepAndParser.getCleanedDataStructure(
+            inputData={"parseDataBool": 0}, dirname=str(tmp_path)
+        )
+    )
+    assert list(store) == list(stations) == dfStations["City"].tolist()
+    for station, columns in stations.items():
+        for column, values in columns.items():
+            np.testing.assert_array_equal(store[station][column], values)
+
+
+def test_incremental_year_stacker_matches_stacking_all_years():
+    import numpy as np
+
+    years = ["2020", "2021"]
+    jobs = [(year, f"CRNH0203-{year}-S{i}.txt") for year in years for i in range(4)]
+    # S3 is only listed in 2020, S2 fails in 2021
+    jobs.remove(("2021", "CRNH0203-2021-S3.txt"))
+    dictAllData = {year: {} for year in years}
+    stacker = dataPrepAndParser.IncrementalYearStacker(years=years, jobs=jobs)
+    # Results arrive out of order, as they do from the download queue
+    for year, stationFile in reversed(jobs):
+        station = stationFile.rsplit("-", 1)[1].replace(".txt", "")
+        stationData = {"T_HR_AVG": np.full(3, float(year)) + int(station[1])}
+        if (year, station) == ("2021", "S2"):
+            stationData = {}
+        else:
+            dictAllData[year][station] = stationData
+        stacker.add(year=year, stationFile=stationFile, stationData=stationData)
+    expected = dataPrepAndParser.verticallyStackObjectsInDict(
+        dictAllData=dataPrepAndParser.updateAndCleanUpDictionaryWithStats(
+            weatherDataDictObjectAll=dictAllData
+        )
+    )
+    assert sorted(stacker.stackedData) == sorted(expected) == ["S0", "S1"]
+    for station, columns in expected.items():
+        np.testing.assert_array_equal(
+            stacker.stackedData[station]["T_HR_AVG"], columns["T_HR_AVG"]
+        )
+    # Yearly columns are released once a station is complete
+    assert stacker.pending == {}
@@ -0,0 +1,166 @@
+"""
+Tests for the FastAPI data service, run with uvicorn on a local port
+"""
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import numpy as np
+import pandas as pd
+import uvicorn
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "weatherForcastingCalculator")
+)
+
+from dataService import createApp  # noqa: E402
+from utils.columnarStore import writeColumnarStore  # noqa: E402
+from utils.rollups import buildRollups, getRollupDir  # noqa: E402
+
+
+def makeDataDir(tmp_path, numStations=3, numHours=24 * 20):
+    (tmp_path / "Data").mkdir()
+    stamps = pd.date_range("2021-01-01 00:00", periods=numHours, freq="H")
+    data = {}
+    for i in range(numStations):
+        temperature = np.arange(numHours, dtype=np.float64) + i
+        temperature[5] = np.nan
+        data[f"S{i}"] = {
+            "UTC_DATE": stamps.strftime("%Y%m%d").astype(np.int32).values,
+            "UTC_TIME": stamps.strftime("%H%M").astype(np.int16).values,
+            "T_HR_AVG": temperature,
+        }
+    writeColumnarStore(data=data, storeDir=str(tmp_path / "Data" / "weatherDataStore"))
+    pd.DataFrame(
+        {
+            "City": list(data),
+            "Longitude": [-100.0, -101.0, -102.0][:numStations],
+            "Latitude": [30.0, 31.0, 32.0][:numStations],
+            "Elevation": [100.0, 200.0, np.nan][:numStations],
+        }
+    ).to_csv(tmp_path / "Data" / "Weather Stations Info.csv", index=False)
+    return data
+
+
+def startService(dataDir=""):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(
+        uvicorn.Config(
+            createApp(dataDir=dataDir),
+            host="127.0.0.1",
+            port=port,
+            log_level="error",
+            ws="none",
+        )
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def getJson(url):
+    with urlopen(url) as response:
+        return json.loads(response.read())
+
+
+def test_service_serves_metadata_slices_snapshots_and_aggregates(tmp_path):
+    data = makeDataDir(tmp_path)
+    server, baseUrl = startService(dataDir=str(tmp_path))
+    try:
+        assert getJson(baseUrl + "/health") == {"status": "ok", "stations": 3}
+        stations = getJson(baseUrl + "/stations")
+        assert stations[0]["firstHour"] == "2021-01-01T00"
+        assert stations[0]["latitude"] == 30.0 and stations[2]["elevation"] is None
+        ######################################################
+        url = baseUrl + "/stations/S1/series?start=2021-01-01T00&end=2021-01-01T10"
+        with urlopen(url) as response:
+            assert response.headers["content-type"] == "application/x-ndjson"
+            lines = response.read().decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+        assert len(rows) == 10 and rows[5]["T_HR_AVG"] is None
+        assert rows[9] == {"UTC_HOUR": "2021-01-01T09", "T_HR_AVG": 10.0}
+        with urlopen(url + "&format=binary") as response:
+            numRows = int(response.headers["X-Rows"])
+            body = response.read()
+        hours = np.frombuffer(body[: 8 * numRows], dtype="<i8")
+        values = np.frombuffer(body[8 * numRows :], dtype="<f8")
+        assert hours[0] == np.datetime64("2021-01-01T00", "h").astype(np.int64)
+        np.testing.assert_array_equal(values, data["S1"]["T_HR_AVG"][:10])
+        ######################################################
+        snapshot = getJson(baseUrl + "/snapshot?time=2021-01-02T00")
+        assert snapshot["T_HR_AVG"] == [24.0, 25.0, 26.0]
+        aggregate = getJson(
+            baseUrl + "/aggregate?start=2021-01-01T00&end=2021-01-02T00"
+        )
+        assert aggregate["stations"][0]["count"] == 23
+        assert aggregate["stations"][0]["max"] == 23.0
+        getJson(baseUrl + "/aggregate?start=2021-01-01T00&end=2021-01-02T00")
+        assert getJson(baseUrl + "/cache")["hits"] >= 1
+        try:
+            urlopen(baseUrl + "/stations/NOPE/series")
+            assert False
+        except HTTPError as e:
+            assert e.code == 404
+    finally:
+        server.should_exit = True
+
+
+def test_whole_day_aggregates_and_rollup_series_come_from_the_rollups(tmp_path):
+    data = makeDataDir(tmp_path)
+    buildRollups(
+        weatherDataDictObjectAll=data,
+        rollupDir=getRollupDir(dirname=str(tmp_path)),
+        variables=["T_HR_AVG"],
+    )
+    server, baseUrl = startService(dataDir=str(tmp_path))
+    try:
+        aggregate = getJson(baseUrl + "/aggregate?start=2021-01-01&end=2021-01-03")
+        hourly = getJson(
+            baseUrl + "/aggregate?start=2021-01-01T00&end=2021-01-02T23&stations=S0"
+        )
+        assert aggregate["stations"][0]["count"] == 47
+        assert aggregate["stations"][0]["max"] == 47.0
+        assert hourly["stations"][0]["min"] == aggregate["stations"][0]["min"]
+        series = getJson(baseUrl + "/rollups/S2?level=daily&stat=max&end=2021-01-03")
+        assert series["periods"] == ["2021-01-01", "2021-01-02"]
+        assert series["values"] == [25.0, 49.0]
+    finally:
+        server.should_exit = True
+
+
+def getStatus(url):
+    try:
+        with urlopen(url) as response:
+            response.read()
+            return response.status
+    except HTTPError as e:
+        return e.code
+
+
+def test_unknown_variables_and_invalid_times_are_rejected_up_front(tmp_path):
+    makeDataDir(tmp_path)
+    server, baseUrl = startService(dataDir=str(tmp_path))
+    try:
+        assert getStatus(baseUrl + "/snapshot?time=2021-01-02T00&variables=FOO") == 404
+        assert getStatus(baseUrl + "/snapshot?time=garbage") == 422
+        assert getStatus(baseUrl + "/stations/S1/series?variables=FOO") == 404
+        assert getStatus(baseUrl + "/stations/S1/series?variables=,") == 422
+        assert getStatus(baseUrl + "/stations/S1/series?start=yesterday") == 422
+        assert (
+            getStatus(baseUrl + "/stations/S1/series?format=binary&variables=FOO")
+            == 404
+        )
+        assert getStatus(baseUrl + "/aggregate?variable=FOO") == 404
+        assert getStatus(baseUrl + "/aggregate?end=2021-99-01") == 422
+        # Valid requests still go through after the rejected ones
+        assert getStatus(baseUrl + "/stations/S1/series?variables=T_HR_AVG") == 200
+    finally:
+        server.should_exit = True
@@ -0,0 +1,81 @@
+"""
+Tests for the mergeable statistics in utils/featureAnalysis.py
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "weatherForcastingCalculator")
+)
+
+from utils.featureAnalysis import (  # noqa: E402
+    analyzeFeatures,
+    computeChunkComoments,
+    getCorrelationMatrix,
+    getMomentSummary,
+    mergeComoments,
+)
+
+
+def makeStations(numStations=4, numRows=500, seed=0):
+    rng = np.random.default_rng(seed)
+    stations = {}
+    for i in range(numStations):
+        humidity = rng.normal(60 + i, 10, numRows)
+        solar = np.clip(rng.normal(200, 80, numRows), 0, None)
+        temperature = 30 - 0.2 * humidity + 0.02 * solar + rng.normal(0, 1, numRows)
+        temperature[rng.random(numRows) < 0.1] = np.nan
+        solar[rng.random(numRows) < 0.2] = np.nan
+        stations[f"S{i}"] = {
+            "T_HR_AVG": temperature,
+            "T_MAX": temperature + 0.5,
+            "RH_HR_AVG": humidity,
+            "SOLARAD": solar,
+            "SOIL_MOISTURE_100": np.full(numRows, np.nan),
+        }
+    return stations
+
+
+def test_merged_chunks_match_pandas_pairwise_statistics():
+    stations = makeStations()
+    variables = ["T_HR_AVG", "RH_HR_AVG", "SOLARAD", "SOIL_MOISTURE_100"]
+    df = pd.concat([pd.DataFrame(s)[variables] for s in stations.values()])
+    merged = None
+    for start in range(0, len(df), 137):  # uneven chunks across station boundaries
+        chunk = computeChunkComoments(values=df.values[start : start + 137])
+        merged = mergeComoments(a=merged, b=chunk)
+    dfMoments = getMomentSummary(comoments=merged, variables=variables)
+    np.testing.assert_allclose(dfMoments["mean"].values[:3], df.mean().values[:3])
+    np.testing.assert_allclose(dfMoments["variance"].values[:3], df.var().values[:3])
+    assert dfMoments["count"].tolist() == df.count().tolist()
+    dfCorrelation = getCorrelationMatrix(comoments=merged, variables=variables)
+    np.testing.assert_allclose(
+        dfCorrelation.values[:3, :3], df.corr().values[:3, :3], atol=1e-10
+    )
+    assert dfCorrelation["SOIL_MOISTURE_100"].isna().all()
+
+
+def test_analyze_features_in_worker_pool_matches_in_process():
+    stations = makeStations()
+    inProcess = analyzeFeatures(weatherDataDictObjectAll=stations, inputData={})
+    pooled = analyzeFeatures(
+        weatherDataDictObjectAll=stations,
+        inputData={"analysisWorkers": 2, "analysisChunkRows": 64},
+    )
+    pd.testing.assert_frame_equal(
+        inProcess["networkSummary"], pooled["networkSummary"], rtol=1e-9
+    )
+    dfStation = inProcess["stationSummary"]
+    s1 = dfStation[(dfStation.station == "S1") & (dfStation.variable == "RH_HR_AVG")]
+    assert np.isclose(s1["q50"].iloc[0], np.median(stations["S1"]["RH_HR_AVG"]))
+    allHumidity = np.concatenate([s["RH_HR_AVG"] for s in stations.values()])
+    networkMedian = inProcess["networkSummary"].loc["RH_HR_AVG", "q50"]
+    assert abs(networkMedian - np.median(allHumidity)) < 0.5
+    # T_MAX is the same sensor as the target and is left out, humidity drives the target
+    dfImportance = inProcess["featureImportance"]
+    assert "T_MAX" not in dfImportance.index
+    assert dfImportance.index[0] == "RH_HR_AVG"
+    assert dfImportance.loc["RH_HR_AVG", "standardizedCoefficient"] < 0
@@ -0,0 +1,93 @@
+"""
+Tests for the deferred, cached figure step and the lazy imports of the cached-data path
+"""
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "weatherForcastingCalculator")
+)
+
+from utils import figures  # noqa: E402
+from utils.figures import generateFigures, startFigureGeneration  # noqa: E402
+from utils.metrics import configurePipelineMetrics  # noqa: E402
+
+
+def makeStationTable():
+    return pd.DataFrame(
+        {
+            "City": ["TX_Austin_33_NW", "CO_Boulder_14_W"],
+            "Longitude": np.array([-97.9, -105.5]),
+            "Latitude": np.array([30.6, 40.0]),
+            "Elevation": np.array([306.0, 400.0]),
+        }
+    )
+
+
+def test_cached_path_imports_no_network_plotting_or_gridding_modules():
+    code = (
+        "import sys; import Calculator; "
+        "print([m for m in ['aiohttp', 'bs4', 'urllib.request', 'requests', "
+        "'matplotlib', 'scipy.spatial'] if m in sys.modules])"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.join(
+            os.path.dirname(__file__), "..", "weatherForcastingCalculator"
+        ),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    assert output.strip() == "[]"
+
+
+def test_figures_are_only_redrawn_when_the_station_table_changes(tmp_path):
+    (tmp_path / "Data").mkdir()
+    (tmp_path / "Figures").mkdir()
+    dfStations = makeStationTable()
+    assert generateFigures(dfStations=dfStations, dirname=str(tmp_path)) == [
+        "Weather Stations Map.png"
+    ]
+    assert (tmp_path / "Figures" / "Weather Stations Map.png").exists()
+    assert generateFigures(dfStations=dfStations, dirname=str(tmp_path)) == []
+    dfStations.loc[1, "Elevation"] = 401.0
+    assert len(generateFigures(dfStations=dfStations, dirname=str(tmp_path))) == 1
+
+
+def test_background_figure_generation_returns_a_future(tmp_path):
+    (tmp_path / "Data").mkdir()
+    (tmp_path / "Figures").mkdir()
+    metrics = configurePipelineMetrics(inputData={"collectMetrics": 1})
+    try:
+        future = startFigureGeneration(
+            dfStations=makeStationTable(),
+            dirname=str(tmp_path),
+            inputData={"plotsInBackground": 1},
+        )
+        assert future.result(timeout=120) == ["Weather Stations Map.png"]
+    finally:
+        configurePipelineMetrics(inputData={})
+    assert (tmp_path / "Data" / "figureCache.json").exists()
+    # The worker's plot timer is merged into the metrics of the run
+    assert metrics.timers["plot"]["count"] == 1
+
+
+def test_up_to_date_figures_start_no_worker_process(tmp_path, monkeypatch):
+    (tmp_path / "Data").mkdir()
+    (tmp_path / "Figures").mkdir()
+    dfStations = makeStationTable()
+    generateFigures(dfStations=dfStations, dirname=str(tmp_path))
+
+    def failingExecutor(*args, **kwargs):
+        raise AssertionError("a worker process was started for cached figures")
+
+    monkeypatch.setattr(figures, "ProcessPoolExecutor", failingExecutor)
+    future = startFigureGeneration(
+        dfStations=dfStations, dirname=str(tmp_path), inputData={"plotsInBackground": 1}
+    )
+    assert future.result(timeout=0) == []
@@ -0,0 +1,91 @@
+"""
+Tests for the lag features, ridge backtests and budgeted station loop in utils/forecasting.py
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "weatherForcastingCalculator")
+)
+
+from utils.forecasting import (  # noqa: E402
+    DEFAULT_FORECAST_SETTINGS,
+    LagFeatures,
+    forecastAllStations,
+    getRollingMeans,
+)
+
+
+def makeStation(numHours=24 * 120, seed=0):
+    rng = np.random.default_rng(seed)
+    hours = np.arange(
+        np.datetime64("2021-01-01T00"), np.datetime64("2021-01-01T00") + numHours
+    )
+    daily = 10 * np.sin(2 * np.pi * np.arange(numHours) / 24)
+    noise = np.zeros(numHours)
+    for t in range(1, numHours):  # AR(1) weather on top of the daily cycle
+        noise[t] = 0.9 * noise[t - 1] + rng.normal(0, 1)
+    temperature = 15 + daily + noise
+    temperature[rng.random(numHours) < 0.01] = np.nan
+    stamps = pd.to_datetime(hours)
+    return {
+        "UTC_DATE": stamps.strftime("%Y%m%d").astype(int).values,
+        "UTC_TIME": stamps.strftime("%H%M").astype(int).values,
+        "T_HR_AVG": temperature,
+    }
+
+
+def test_lag_block_is_a_view_and_rolling_means_match_pandas():
+    series = np.arange(500, dtype=np.float64)
+    series[::7] = np.nan
+    features = LagFeatures(
+        series=series,
+        startHour=np.datetime64("2021-01-01T05"),
+        settings=DEFAULT_FORECAST_SETTINGS,
+    )
+    assert np.shares_memory(features.lagWindows, series)
+    rows = features.getRows(start=200, stop=210)
+    np.testing.assert_array_equal(rows[3, 1:25], series[180:204])
+    expected = pd.Series(series).rolling(24, min_periods=1).mean().values
+    np.testing.assert_allclose(
+        getRollingMeans(series=series, window=24)[23:], expected[23:]
+    )
+
+
+def test_backtest_beats_persistence_and_budget_skips_stations():
+    stations = {f"S{i}": makeStation(seed=i) for i in range(3)}
+    dfBacktest, dfForecast, dfStatus = forecastAllStations(
+        weatherDataDictObjectAll=stations, inputData={"forecastWorkers": 2}
+    )
+    assert (dfStatus["status"] == "ok").all()
+    assert len(dfBacktest) == 3 * len(DEFAULT_FORECAST_SETTINGS["forecastHorizons"])
+    assert (dfBacktest["numPoints"] > 0).all()
+    assert (dfBacktest.loc[dfBacktest.horizon <= 12, "skill"] > 0).all()
+    first = dfForecast[dfForecast.station == "S0"].iloc[0]
+    assert first["forecastHour"] == np.datetime64("2021-05-01T00")
+    _, _, dfStatus = forecastAllStations(
+        weatherDataDictObjectAll=stations, inputData={"forecastTimeBudget": 0}
+    )
+    assert (dfStatus["status"] == "skipped").all()
+
+
+def test_empty_stations_and_budget_with_worker_pool():
+    stations = {f"S{i}": makeStation(numHours=24 * 60, seed=i) for i in range(3)}
+    stations["Empty"] = {
+        column: values[:0] for column, values in stations["S0"].items()
+    }
+    _, dfForecast, dfStatus = forecastAllStations(
+        weatherDataDictObjectAll=stations, inputData={"forecastWorkers": 2}
+    )
+    status = dfStatus.set_index("station")["status"]
+    assert status["Empty"] == "insufficient data"
+    assert (status.drop("Empty") == "ok").all()
+    assert "Empty" not in set(dfForecast["station"])
+    _, _, dfStatus = forecastAllStations(
+        weatherDataDictObjectAll=stations,
+        inputData={"forecastWorkers": 2, "forecastTimeBudget": 0},
+    )
+    assert (dfStatus.set_index("station")["status"].drop("Empty") == "skipped").all()
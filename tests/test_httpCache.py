@@ -0,0 +1,75 @@
+"""
+Tests for the on-disk HTTP cache used by the NCEI fetches
+"""
+import asyncio
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import aiohttp
+import pytest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "weatherForcastingCalculator")
+)
+
+from utils.httpCache import HttpCache  # noqa: E402
+
+PAYLOAD = b"03047 20200101 0100\n"
+
+
+class EtagHandler(BaseHTTPRequestHandler):
+    fullResponses = 0
+
+    def do_GET(self):
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        EtagHandler.fullResponses += 1
+        self.send_response(200)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(PAYLOAD)))
+        self.end_headers()
+        self.wfile.write(PAYLOAD)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def serverUrl():
+    EtagHandler.fullResponses = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), EtagHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/2020/station.txt"
+    server.shutdown()
+    server.server_close()
+
+
+def test_sync_fetch_revalidates_with_etag(tmp_path, serverUrl):
+    cache = HttpCache(cacheDir=str(tmp_path))
+    assert cache.fetchSync(url=serverUrl) == PAYLOAD
+    assert cache.fetchSync(url=serverUrl) == PAYLOAD
+    assert EtagHandler.fullResponses == 1
+    assert cache.stats["downloaded"] == 1
+    assert cache.stats["revalidated"] == 1
+
+
+def test_async_fetch_and_offline_mode(tmp_path, serverUrl):
+    async def fetchTwice():
+        cache = HttpCache(cacheDir=str(tmp_path))
+        async with aiohttp.ClientSession() as session:
+            first = await cache.fetch(session=session, url=serverUrl)
+            second = await cache.fetch(session=session, url=serverUrl)
+        return first, second, cache
+
+    first, second, cache = asyncio.run(fetchTwice())
+    assert first == second == PAYLOAD
+    assert cache.stats["revalidated"] == 1
+    offlineCache = HttpCache(cacheDir=str(tmp_path), offline=True)
+    assert offlineCache.fetchSync(url=serverUrl) == PAYLOAD
+    assert offlineCache.fetchSync(url=serverUrl + ".missing") is None
+    assert EtagHandler.fullResponses == 1
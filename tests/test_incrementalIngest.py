@@ -0,0 +1,163 @@
+"""
+Tests for the append-only incremental refresh of the columnar store
+"""
+import asyncio
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "weatherForcastingCalculator")
+)
+
+from utils.columnarStore import openColumnarStore, writeColumnarStore  # noqa: E402
+from utils.dataCleaning import cleanStationColumns  # noqa: E402
+from utils.incrementalIngest import updateStoreIncrementally  # noqa: E402
+from utils.rollups import RollupPyramid, buildRollups, getRollupDir  # noqa: E402
+from utils.stationFileParser import parseHourly02Bytes  # noqa: E402
+
+STATION_FILE = "CRNH0203-2020-TX_Test_1_N.txt"
+
+
+def makeLine(hour=1, temperature=1.0):
+    values = ["03047", "20200101", f"{hour:02d}00", "20191231", "1800", "2.622"]
+    values += ["-102.81", "30.62"] + [f"{temperature:.1f}"] * 6
+    values += ["0"] * 5 + ["C", "0.8", "0", "1.2", "0", "0.4", "0", "62", "0"]
+    values += ["-99.000"] * 5 + ["-9999.0"] * 5
+    return (" ".join(values) + "\n").encode()
+
+
+class GrowingFileHandler(BaseHTTPRequestHandler):
+    body = b""
+    rangeRequests = 0
+
+    def do_GET(self):
+        if self.path.endswith("/2020/"):
+            listing = f'<a href="{STATION_FILE}">{STATION_FILE}</a> 2020-01-01 01:00 1K'
+            self.reply(200, listing.encode())
+            return
+        body = GrowingFileHandler.body
+        rangeHeader = self.headers.get("Range")
+        if rangeHeader:
+            GrowingFileHandler.rangeRequests += 1
+            offset = int(rangeHeader.replace("bytes=", "").rstrip("-"))
+            if offset >= len(body):
+                self.reply(416, b"")
+                return
+            self.reply(206, body[offset:])
+            return
+        self.reply(200, body)
+
+    def reply(self, status, payload):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def baseUrl():
+    GrowingFileHandler.rangeRequests = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), GrowingFileHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+
+
+def test_incremental_update_appends_only_new_hours(tmp_path, baseUrl):
+    firstRows = makeLine(hour=1, temperature=1.0)
+    stationData = cleanStationColumns(stationDict=parseHourly02Bytes(firstRows))
+    writeColumnarStore(
+        data={"TX_Test_1_N": stationData},
+        storeDir=str(tmp_path / "Data" / "weatherDataStore"),
+    )
+    buildRollups(
+        weatherDataDictObjectAll={"TX_Test_1_N": stationData},
+        rollupDir=getRollupDir(dirname=str(tmp_path)),
+    )
+    inputData = {"nceiBaseUrl": baseUrl, "currentYear": 2020, "batchSize": 4}
+    # First refresh: full fetch, only the hour after the stored one is appended
+    GrowingFileHandler.body = firstRows + makeLine(hour=2, temperature=2.0)
+    rowsAdded = asyncio.run(
+        updateStoreIncrementally(inputData=inputData, dirname=str(tmp_path))
+    )
+    assert rowsAdded == 1
+    # Second refresh: Range request for the appended bytes only, partial last line ignored
+    GrowingFileHandler.body += makeLine(hour=3, temperature=-9999.0) + b"03047 2020"
+    rowsAdded = asyncio.run(
+        updateStoreIncrementally(inputData=inputData, dirname=str(tmp_path))
+    )
+    assert rowsAdded == 1
+    assert GrowingFileHandler.rangeRequests == 1
+    store = openColumnarStore(storeDir=str(tmp_path / "Data" / "weatherDataStore"))
+    np.testing.assert_array_equal(store["TX_Test_1_N"]["UTC_TIME"], [100, 200, 300])
+    np.testing.assert_array_equal(store["TX_Test_1_N"]["T_HR_AVG"], [1.0, 2.0, np.nan])
+    assert store["TX_Test_1_N"]["SUR_TEMP_TYPE"].tolist() == ["C", "C", "C"]
+    # The saved rollups picked up the appended hours
+    rollups = RollupPyramid.load(rollupDir=getRollupDir(dirname=str(tmp_path)))
+    _, counts = rollups.query(variable="T_HR_AVG", stat="count", level="daily")[
+        "TX_Test_1_N"
+    ]
+    _, means = rollups.query(variable="T_HR_AVG", stat="mean", level="yearly")[
+        "TX_Test_1_N"
+    ]
+    assert counts.tolist() == [2] and means.tolist() == [1.5]
+
+
+def test_a_failing_station_is_skipped_and_refetched_later(tmp_path, monkeypatch):
+    import utils.incrementalIngest as incrementalIngest
+
+    stations = ["TX_Test_1_N", "TX_Test_2_N"]
+    firstRows = makeLine(hour=1, temperature=1.0)
+    writeColumnarStore(
+        data={
+            station: cleanStationColumns(stationDict=parseHourly02Bytes(firstRows))
+            for station in stations
+        },
+        storeDir=str(tmp_path / "Data" / "weatherDataStore"),
+    )
+
+    async def fakeFetchURLContent(session="", url="", **kwargs):
+        stationFiles = [f"CRNH0203-2020-{station}.txt" for station in stations]
+        return "\n".join(f'<a href="{name}">{name}</a>' for name in stationFiles)
+
+    failing = {"TX_Test_2_N"}
+
+    async def fakeFetchNewStationRows(url="", lastUtc=0, **kwargs):
+        if any(station in url for station in failing):
+            raise ValueError("broken file")
+        rows = firstRows + makeLine(hour=2, temperature=2.0)
+        return incrementalIngest.selectRowsAfter(
+            stationData=parseHourly02Bytes(rows), lastUtc=lastUtc
+        ), len(rows)
+
+    monkeypatch.setattr(incrementalIngest, "fetchURLContent", fakeFetchURLContent)
+    monkeypatch.setattr(
+        incrementalIngest, "fetchNewStationRows", fakeFetchNewStationRows
+    )
+    inputData = {"nceiBaseUrl": "http://ncei.invalid/", "currentYear": 2020}
+    rowsAdded = asyncio.run(
+        updateStoreIncrementally(inputData=inputData, dirname=str(tmp_path))
+    )
+    assert rowsAdded == 1
+    store = openColumnarStore(storeDir=str(tmp_path / "Data" / "weatherDataStore"))
+    assert store["TX_Test_1_N"]["UTC_TIME"].tolist() == [100, 200]
+    assert store["TX_Test_2_N"]["UTC_TIME"].tolist() == [100]
+    # The failed station kept its state, so the next refresh picks up the same rows
+    assert store.manifest["ingestState"]["TX_Test_2_N"]["files"] == {}
+    failing.clear()
+    rowsAdded = asyncio.run(
+        updateStoreIncrementally(inputData=inputData, dirname=str(tmp_path))
+    )
+    assert rowsAdded == 1
+    store = openColumnarStore(storeDir=str(tmp_path / "Data" / "weatherDataStore"))
+    assert store["TX_Test_2_N"]["UTC_TIME"].tolist() == [100, 200]
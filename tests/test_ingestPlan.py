@@ -0,0 +1,136 @@
+"""
+Tests for planning the ingest from the year listings in utils/ingestPlan.py
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "weatherForcastingCalculator")
+)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+from localNceiServer import (  # noqa: E402
+    generateYearListing,
+    startLocalNceiServer,
+    stopLocalNceiServer,
+)
+from utils.dataPrepAndParser import fetchAndParseYears  # noqa: E402
+from utils.ingestPlan import (  # noqa: E402
+    buildIngestPlan,
+    formatIngestPlanReport,
+    parseListingSizes,
+)
+
+
+def test_listing_sizes_from_pre_and_table_layouts():
+    html = generateYearListing(
+        year=2020,
+        stationFiles={
+            "CRNH0203-2020-AK_Aleknagik_1_NNE.txt": b"x" * 3_600_000,
+            "CRNH0203-2020-TX_Austin_33_NW.txt": b"x" * 1_000,
+        },
+    ).decode("utf-8")
+    assert parseListingSizes(htmlContent=html) == [
+        ("CRNH0203-2020-AK_Aleknagik_1_NNE.txt", int(3.6 * 1024**2)),
+        ("CRNH0203-2020-TX_Austin_33_NW.txt", 0),
+    ]
+    table = (
+        "<table><tr><td><a href='CRNH0203-2021-TX_Austin_33_NW.txt'>"
+        "CRNH0203-2021-TX_Austin_33_NW.txt</a></td><td>2022-01-06 10:34</td>"
+        "<td>512K</td></tr><tr><td><a href='CRNH0203-2021-AK_Sitka_1_NE.txt'>"
+        "CRNH0203-2021-AK_Sitka_1_NE.txt</a></td></tr></table>"
+    )
+    assert parseListingSizes(htmlContent=table) == [
+        ("CRNH0203-2021-TX_Austin_33_NW.txt", 512 * 1024),
+        ("CRNH0203-2021-AK_Sitka_1_NE.txt", None),
+    ]
+
+
+def test_plan_keeps_only_stations_listed_in_every_year():
+    listings = {
+        2020: [
+            ("CRNH0203-2020-TX_Austin_33_NW.txt", 100),
+            ("CRNH0203-2020-AK_Sitka_1_NE.txt", 50),
+        ],
+        2021: [
+            ("CRNH0203-2021-TX_Austin_33_NW.txt", 200),
+            ("CRNH0203-2021-CO_Boulder_14_W.txt", None),
+        ],
+    }
+    plan = buildIngestPlan(listings=listings)
+    assert plan["commonStations"] == ["TX_Austin_33_NW"]
+    assert plan["droppedStations"] == {
+        "AK_Sitka_1_NE": ["2021"],
+        "CO_Boulder_14_W": ["2020"],
+    }
+    assert plan["jobs"] == [
+        ("2020", "CRNH0203-2020-TX_Austin_33_NW.txt"),
+        ("2021", "CRNH0203-2021-TX_Austin_33_NW.txt"),
+    ]
+    assert plan["totals"]["plannedBytes"] == 300
+    assert plan["totals"]["skippedFiles"] == 2
+    assert plan["totals"]["skippedBytes"] == 50
+    # Only fetching 2021, still planned against both years
+    plan = buildIngestPlan(listings=listings, fetchYears=[2021])
+    assert plan["jobs"] == [("2021", "CRNH0203-2021-TX_Austin_33_NW.txt")]
+    assert "Common stations:       1" in formatIngestPlanReport(plan=plan)
+
+
+def test_ingest_skips_stations_missing_from_a_year(tmp_path):
+    server, serverUrl = startLocalNceiServer(
+        years=[2020, 2021], numStations=4, hours=24
+    )
+    try:
+        files = server.RequestHandlerClass.files
+        # The last station is not listed in 2021
+        stationFiles2021 = {
+            path.rsplit("/", 1)[1]: body
+            for path, body in files.items()
+            if path.startswith("/hourly02/2021/") and path.endswith(".txt")
+        }
+        droppedFile = sorted(stationFiles2021)[-1]
+        del stationFiles2021[droppedFile]
+        files["/hourly02/2021/"] = generateYearListing(
+            year=2021, stationFiles=stationFiles2021
+        )
+        inputData = {
+            "idealDates": [2020, 2021],
+            "batchSize": 4,
+            "parseWorkers": 0,
+            "nceiBaseUrl": serverUrl + "/hourly02/",
+        }
+        (tmp_path / "Data").mkdir()
+        dictAllData = asyncio.run(
+            fetchAndParseYears(inputData=inputData, dirname=str(tmp_path))
+        )
+        assert [len(dictAllData[year]) for year in ["2020", "2021"]] == [3, 3]
+        requested = server.RequestHandlerClass.stats["requests"]
+        # 2 listings + 3 station files per year
+        assert requested == 2 + 6
+    finally:
+        stopLocalNceiServer(server=server)
+
+
+def test_ingest_stops_when_a_listing_cannot_be_fetched(tmp_path):
+    server, serverUrl = startLocalNceiServer(
+        years=[2020, 2021], numStations=2, hours=24
+    )
+    try:
+        del server.RequestHandlerClass.files["/hourly02/2021/"]
+        inputData = {
+            "idealDates": [2020, 2021],
+            "batchSize": 2,
+            "parseWorkers": 0,
+            "nceiBaseUrl": serverUrl + "/hourly02/",
+        }
+        (tmp_path / "Data").mkdir()
+        with pytest.raises(RuntimeError, match="listing of 2021"):
+            asyncio.run(fetchAndParseYears(inputData=inputData, dirname=str(tmp_path)))
+        # Nothing was planned over the missing year, so no station file was requested (the
+        # other listing may have been cut off when the error closed the session)
+        assert server.RequestHandlerClass.stats["requests"] <= 2
+    finally:
+        stopLocalNceiServer(server=server)
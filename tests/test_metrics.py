@@ -0,0 +1,102 @@
+"""
+Tests for the pipeline instrumentation in utils/metrics.py
+"""
+import asyncio
+import json
+import os
+import sys
+from urllib.request import urlopen
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "weatherForcastingCalculator")
+)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+from localNceiServer import startLocalNceiServer, stopLocalNceiServer  # noqa: E402
+from utils.dataPrepAndParser import parserFunParallelized  # noqa: E402
+from utils.metrics import (  # noqa: E402
+    PipelineMetrics,
+    configurePipelineMetrics,
+    getPipelineMetrics,
+)
+
+
+def test_disabled_metrics_record_nothing():
+    metrics = PipelineMetrics(enabled=False)
+    with metrics.stage("parse"), metrics.trackConcurrency("parsesInFlight"):
+        metrics.incrementCounter("rowsParsed", 10)
+        metrics.observe("requestLatencySeconds", 0.2)
+    data = metrics.toDict()
+    assert data["timers"] == {} and data["counters"] == {}
+    assert data["histograms"] == {} and data["gauges"] == {}
+
+
+def test_timers_counters_histograms_and_gauges():
+    metrics = PipelineMetrics(latencyBuckets=[0.1, 1.0])
+    for _ in range(3):
+        with metrics.stage("parse"):
+            pass
+    metrics.incrementCounter("rowsParsed", 5)
+    metrics.incrementCounter("rowsParsed", 7)
+    for latency in [0.05, 0.5, 0.7, 3.0]:
+        metrics.observe("requestLatencySeconds", latency)
+    with metrics.trackConcurrency("stationsInFlight"):
+        with metrics.trackConcurrency("stationsInFlight"):
+            pass
+    data = metrics.toDict()
+    assert data["timers"]["parse"]["count"] == 3
+    assert data["counters"]["rowsParsed"] == 12
+    assert data["histograms"]["requestLatencySeconds"]["counts"] == [1, 2, 1]
+    assert data["gauges"]["stationsInFlight"] == {"value": 0, "max": 2}
+    text = metrics.toPrometheusText()
+    assert 'weather_pipeline_stage_calls_total{stage="parse"} 3' in text
+    assert "weather_pipeline_rows_parsed_total 12" in text
+    assert 'weather_pipeline_request_latency_seconds_bucket{le="1.0"} 3' in text
+    assert 'weather_pipeline_request_latency_seconds_bucket{le="+Inf"} 4' in text
+
+
+def test_prometheus_endpoint_serves_metrics():
+    metrics = PipelineMetrics()
+    metrics.incrementCounter("bytesFetched", 1024)
+    port = metrics.startPrometheusEndpoint(port=0)
+    try:
+        # Bound to the loopback interface unless a host is given
+        assert metrics.server.server_address[0] == "127.0.0.1"
+        body = urlopen(f"http://127.0.0.1:{port}/metrics").read().decode()
+    finally:
+        metrics.stopPrometheusEndpoint()
+    assert "weather_pipeline_bytes_fetched_total 1024" in body
+
+
+def test_ingest_run_fills_every_stage(tmp_path):
+    (tmp_path / "Data").mkdir()
+    (tmp_path / "Figures").mkdir()
+    server, serverUrl = startLocalNceiServer(years=[2020], numStations=5, hours=24)
+    inputData = {
+        "idealDates": [2020],
+        "batchSize": 4,
+        "nceiBaseUrl": serverUrl + "/hourly02/",
+        "elevationServiceUrl": serverUrl + "/api/v1/lookup",
+        "collectMetrics": 1,
+    }
+    configurePipelineMetrics(inputData=inputData)
+    try:
+        asyncio.run(
+            parserFunParallelized(
+                inputData=inputData, dirname=str(tmp_path), writeStore=True
+            )
+        )
+    finally:
+        stopLocalNceiServer(server=server)
+    metrics = getPipelineMetrics()
+    metrics.writeJson(outFileName=str(tmp_path / "pipelineMetrics.json"))
+    configurePipelineMetrics(inputData={})
+    with open(tmp_path / "pipelineMetrics.json") as f:
+        data = json.load(f)
+    stages = ["listingFetch", "stationFetch", "parse", "stack", "clean"]
+    stages += ["elevation", "write"]
+    assert set(stages) <= set(data["timers"])
+    assert data["counters"]["rowsParsed"] == 5 * 24
+    assert data["counters"]["stationsParsed"] == 5
+    assert data["histograms"]["requestLatencySeconds"]["count"] == 6
+    assert data["gauges"]["stationsInFlight"]["max"] <= 4
@@ -0,0 +1,81 @@
+"""
+End-to-end ingest against the local NCEI stand-in in benchmarks/localNceiServer.py
+"""
+import asyncio
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "weatherForcastingCalculator")
+)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+from localNceiServer import startLocalNceiServer, stopLocalNceiServer  # noqa: E402
+from utils.dataPrepAndParser import (  # noqa: E402
+    parserFunParallelized,
+    parserFunSlowAndInSeries,
+)
+
+
+def test_parallel_ingest_runs_offline_against_the_stand_in(tmp_path):
+    (tmp_path / "Data").mkdir()
+    (tmp_path / "Figures").mkdir()
+    server, serverUrl = startLocalNceiServer(
+        years=[2020, 2021], numStations=20, hours=48
+    )
+    inputData = {
+        "idealDates": [2020, 2021],
+        "batchSize": 8,
+        "parseWorkers": 0,
+        "maxRetries": 2,
+        "retryBaseDelay": 0.01,
+        "nceiBaseUrl": serverUrl + "/hourly02/",
+        "elevationServiceUrl": serverUrl + "/api/v1/lookup",
+    }
+    try:
+        weatherData, dfStations = asyncio.run(
+            parserFunParallelized(
+                inputData=inputData, dirname=str(tmp_path), writeStore=True
+            )
+        )
+    finally:
+        stopLocalNceiServer(server=server)
+    assert len(weatherData) == 20
+    # The AK station is left out of the continental US station table
+    assert len(dfStations) == 19
+    station = weatherData["TX_Synthetic_0_N"]
+    assert len(station["T_HR_AVG"]) == 96
+    assert np.isnan(station["SOIL_TEMP_100"]).all()
+    assert server.handlerClass.stats["requests"] > 40
+    assert (tmp_path / "Data" / "weatherDataStore" / "manifest.json").exists()
+
+
+def test_serial_ingest_skips_missing_stations_and_stops_on_missing_listings(tmp_path):
+    (tmp_path / "Data").mkdir()
+    (tmp_path / "Figures").mkdir()
+    server, serverUrl = startLocalNceiServer(years=[2020], numStations=3, hours=24)
+    inputData = {
+        "idealDates": [2020],
+        "useHttpCache": 1,
+        "nceiBaseUrl": serverUrl + "/hourly02/",
+        "elevationServiceUrl": serverUrl + "/api/v1/lookup",
+    }
+    try:
+        del server.handlerClass.files[
+            "/hourly02/2020/CRNH0203-2020-TX_Synthetic_1_N.txt"
+        ]
+        weatherData, _ = parserFunSlowAndInSeries(
+            inputData=inputData, dirname=str(tmp_path)
+        )
+        assert sorted(weatherData) == ["TX_Synthetic_0_N", "TX_Synthetic_2_N"]
+        # Offline, a year that was never cached cannot be listed
+        with pytest.raises(RuntimeError, match="listing of 2021"):
+            parserFunSlowAndInSeries(
+                inputData={**inputData, "idealDates": [2021], "offlineMode": 1},
+                dirname=str(tmp_path),
+            )
+    finally:
+        stopLocalNceiServer(server=server)
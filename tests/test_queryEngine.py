@@ -0,0 +1,87 @@
+"""
+Tests for the sorted UTC index and range/point lookups in utils/queryEngine.py
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "weatherForcastingCalculator")
+)
+
+from utils.queryEngine import StationQueryEngine  # noqa: E402
+from utils.stationTable import StationTable  # noqa: E402
+
+
+def makeStations(numStations=100, numHours=24 * 365, seed=0):
+    rng = np.random.default_rng(seed)
+    stamps = pd.date_range("2021-01-01 00:00", periods=numHours, freq="H")
+    utcDate = stamps.strftime("%Y%m%d").astype(np.int32).values
+    utcTime = stamps.strftime("%H%M").astype(np.int16).values
+    stations = {}
+    for i in range(numStations):
+        keep = np.sort(rng.choice(numHours, numHours - 50 * i, replace=False))
+        stations[f"S{i:03d}"] = {
+            "UTC_DATE": utcDate[keep],
+            "UTC_TIME": utcTime[keep],
+            "T_HR_AVG": rng.normal(10, 5, len(keep)),
+        }
+    return stations
+
+
+def test_range_query_returns_views_of_the_requested_week():
+    stations = makeStations(numStations=3)
+    engine = StationQueryEngine(weatherDataDictObjectAll=stations)
+    result = engine.query(
+        stations=["S001"],
+        variables=["T_HR_AVG"],
+        start="2021-03-01T00",
+        end="2021-03-08T00",
+    )["S001"]
+    assert result["UTC_HOUR"][0] >= np.datetime64("2021-03-01T00")
+    assert result["UTC_HOUR"][-1] < np.datetime64("2021-03-08T00")
+    assert np.shares_memory(result["T_HR_AVG"], stations["S001"]["T_HR_AVG"])
+    stamps = pd.to_datetime(
+        stations["S001"]["UTC_DATE"].astype(str), format="%Y%m%d"
+    ) + pd.to_timedelta(stations["S001"]["UTC_TIME"] // 100, unit="h")
+    inWeek = (stamps >= "2021-03-01") & (stamps < "2021-03-08")
+    np.testing.assert_array_equal(
+        result["T_HR_AVG"], stations["S001"]["T_HR_AVG"][inWeek]
+    )
+
+
+def test_out_of_order_station_is_sorted_through_a_permutation():
+    stations = makeStations(numStations=1, numHours=100)
+    station = stations["S000"]
+    reversedStation = {column: values[::-1] for column, values in station.items()}
+    engine = StationQueryEngine(weatherDataDictObjectAll={"S000": reversedStation})
+    result = engine.query(start="2021-01-01T10", end="2021-01-01T13")["S000"]
+    np.testing.assert_array_equal(result["T_HR_AVG"], station["T_HR_AVG"][10:13])
+
+
+def test_point_in_time_across_all_stations():
+    stations = makeStations()
+    table = StationTable.fromStationDict(weatherDataDictObjectAll=stations)
+    for data in [stations, table]:
+        engine = StationQueryEngine(weatherDataDictObjectAll=data)
+        snapshot = engine.pointInTime(stamp="2021-06-01T12", variables=["T_HR_AVG"])
+        for i, station in enumerate(engine.stations):
+            rows = engine.query(
+                stations=[station], start="2021-06-01T12", end="2021-06-01T13"
+            )[station]
+            assert snapshot["found"][i] == (len(rows["T_HR_AVG"]) == 1)
+            if snapshot["found"][i]:
+                assert snapshot["T_HR_AVG"][i] == rows["T_HR_AVG"][0]
+    # An engine without rows finds nothing instead of indexing an empty key array
+    for data in [
+        {},
+        {"S000": {column: values[:0] for column, values in stations["S000"].items()}},
+    ]:
+        snapshot = StationQueryEngine(weatherDataDictObjectAll=data).pointInTime(
+            stamp="2021-06-01T12", variables=["T_HR_AVG"]
+        )
+        assert not snapshot["found"].any()
+        assert np.isnan(snapshot["T_HR_AVG"]).all()
+        assert len(snapshot["T_HR_AVG"]) == len(data)
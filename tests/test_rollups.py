@@ -0,0 +1,140 @@
+"""
+Tests for the daily/monthly/yearly rollup pyramid in utils/rollups.py
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "weatherForcastingCalculator")
+)
+
+from utils.rollups import (  # noqa: E402
+    RollupPyramid,
+    buildRollups,
+    rollupsExist,
+    splitDayRange,
+    updateRollups,
+)
+
+
+def makeStations(numStations=3, numHours=24 * 800, seed=0):
+    rng = np.random.default_rng(seed)
+    stamps = pd.date_range("2020-11-01 00:00", periods=numHours, freq="H")
+    utcDate = stamps.strftime("%Y%m%d").astype(np.int32).values
+    utcTime = stamps.strftime("%H%M").astype(np.int16).values
+    stations = {}
+    for i in range(numStations):
+        temperature = rng.normal(10, 5, numHours)
+        temperature[rng.random(numHours) < 0.1] = np.nan
+        precipitation = rng.exponential(0.2, numHours)
+        # A fully missing month
+        precipitation[(stamps >= "2021-06-01") & (stamps < "2021-07-01")] = np.nan
+        stations[f"S{i}"] = {
+            "UTC_DATE": utcDate,
+            "UTC_TIME": utcTime,
+            "T_HR_AVG": temperature,
+            "P_CALC": precipitation,
+        }
+    return stations
+
+
+def getHourlyFrame(stationData={}):
+    return pd.DataFrame(
+        {"T_HR_AVG": stationData["T_HR_AVG"], "P_CALC": stationData["P_CALC"]},
+        index=pd.to_datetime(stationData["UTC_DATE"].astype(str), format="%Y%m%d")
+        + pd.to_timedelta(stationData["UTC_TIME"] // 100, unit="h"),
+    )
+
+
+def test_monthly_level_matches_a_groupby_over_hours():
+    stations = makeStations()
+    pyramid = RollupPyramid.fromStationData(
+        weatherDataDictObjectAll=stations, variables=["T_HR_AVG", "P_CALC"]
+    )
+    dfHourly = getHourlyFrame(stationData=stations["S1"])
+    grouped = dfHourly.groupby(dfHourly.index.to_period("M"))
+    for stat in ["mean", "min", "max", "count", "sum"]:
+        periods, values = pyramid.query(
+            variable="P_CALC", stat=stat, level="monthly", stations=["S1"]
+        )["S1"]
+        expected = getattr(grouped["P_CALC"], stat)()
+        if stat == "sum":
+            expected[grouped["P_CALC"].count() == 0] = 0.0
+        assert [str(p) for p in periods] == [str(p) for p in expected.index]
+        np.testing.assert_allclose(values, expected.values, equal_nan=True)
+
+
+def test_summarize_tiles_the_range_with_the_coarsest_buckets():
+    assert [
+        (u, str(lo), str(hi)) for u, lo, hi in splitDayRange("2020-11-15", "2022-02-03")
+    ] == [
+        ("D", "2020-11-15", "2020-12-01"),
+        ("M", "2020-12", "2021-01"),
+        ("Y", "2021", "2022"),
+        ("M", "2022-01", "2022-02"),
+        ("D", "2022-02-01", "2022-02-03"),
+    ]
+    stations = makeStations()
+    pyramid = RollupPyramid.fromStationData(weatherDataDictObjectAll=stations)
+    dfSummary = pyramid.summarize(
+        variable="T_HR_AVG", start="2020-11-15", end="2022-02-03"
+    ).set_index("station")
+    for station, stationData in stations.items():
+        dfHourly = getHourlyFrame(stationData=stationData)
+        values = dfHourly.loc["2020-11-15":"2022-02-02", "T_HR_AVG"]
+        assert dfSummary.loc[station, "count"] == values.count()
+        np.testing.assert_allclose(dfSummary.loc[station, "mean"], values.mean())
+        np.testing.assert_allclose(dfSummary.loc[station, "min"], values.min())
+        np.testing.assert_allclose(dfSummary.loc[station, "max"], values.max())
+
+
+def test_incremental_update_equals_a_full_rebuild(tmp_path):
+    stations = makeStations()
+    split = 24 * 500 + 7  # mid day, the boundary day is shared by both parts
+    firstPart = {
+        s: {c: v[:split] for c, v in data.items()} for s, data in stations.items()
+    }
+    newPart = {
+        s: {c: v[split:] for c, v in data.items()}
+        for s, data in stations.items()
+        if s != "S0"
+    }
+    rollupDir = str(tmp_path / "rollups")
+    buildRollups(weatherDataDictObjectAll=firstPart, rollupDir=rollupDir)
+    assert rollupsExist(rollupDir=rollupDir)
+    updated = updateRollups(rollupDir=rollupDir, newData=newPart)
+    reloaded = RollupPyramid.load(rollupDir=rollupDir)
+    expected = RollupPyramid.fromStationData(
+        weatherDataDictObjectAll={
+            "S0": firstPart["S0"],
+            "S1": stations["S1"],
+            "S2": stations["S2"],
+        }
+    )
+    for pyramid in [updated, reloaded]:
+        for level in ["daily", "monthly", "yearly"]:
+            keys, stats = pyramid.levels[level]
+            np.testing.assert_array_equal(keys, expected.levels[level][0])
+            for stat, values in stats["T_HR_AVG"].items():
+                np.testing.assert_allclose(
+                    values, expected.levels[level][1]["T_HR_AVG"][stat], equal_nan=True
+                )
+
+
+def test_station_by_station_build_equals_the_one_pass_build():
+    stations = makeStations(numHours=24 * 400)
+    expected = RollupPyramid.fromStationData(weatherDataDictObjectAll=stations)
+    pyramid = RollupPyramid.fromStationDataByStation(weatherDataDictObjectAll=stations)
+    assert pyramid.stations == expected.stations
+    assert pyramid.variables == expected.variables
+    for level in ["daily", "monthly", "yearly"]:
+        keys, stats = pyramid.levels[level]
+        np.testing.assert_array_equal(keys, expected.levels[level][0])
+        for variable in pyramid.variables:
+            for stat, values in stats[variable].items():
+                np.testing.assert_allclose(
+                    values, expected.levels[level][1][variable][stat], equal_nan=True
+                )
@@ -0,0 +1,160 @@
+"""
+Tests for the sharded ingest (year-range / station-hash shards) and its deterministic merge
+"""
+import asyncio
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "weatherForcastingCalculator")
+)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+from localNceiServer import startLocalNceiServer, stopLocalNceiServer  # noqa: E402
+from utils.columnarStore import openColumnarStore  # noqa: E402
+from utils.dataPrepAndParser import parserFunParallelized  # noqa: E402
+from utils.shardedIngest import (  # noqa: E402
+    getShardSpecs,
+    mergeIngestShards,
+    parseShardSpec,
+    runIngestShard,
+    runShardedIngest,
+)
+
+
+YEARS = [2020, 2021, 2022]
+
+
+@pytest.fixture
+def serverUrl():
+    server, serverUrl = startLocalNceiServer(years=YEARS, numStations=8, hours=24)
+    yield serverUrl
+    stopLocalNceiServer(server=server)
+
+
+def test_shard_specs():
+    assert parseShardSpec("years:2015-2019") == {
+        "kind": "years",
+        "first": 2015,
+        "last": 2019,
+    }
+    assert parseShardSpec("hash:2/4") == {"kind": "hash", "index": 2, "count": 4}
+    with pytest.raises(ValueError):
+        parseShardSpec("hash:4/4")
+    inputData = {"idealDates": [2020, 2021, 2022, 2023, 2024]}
+    assert getShardSpecs(inputData=inputData, numShards=2, mode="years") == [
+        "years:2020-2022",
+        "years:2023-2024",
+    ]
+    assert getShardSpecs(inputData=inputData, numShards=3) == [
+        "hash:0/3",
+        "hash:1/3",
+        "hash:2/3",
+    ]
+
+
+def test_sharded_ingest_matches_the_single_process_ingest(
+    tmp_path, serverUrl, makeInputData, makeDataDir
+):
+    inputData = makeInputData(serverUrl=serverUrl, years=YEARS)
+    expected, dfExpected = asyncio.run(
+        parserFunParallelized(
+            inputData=inputData, dirname=makeDataDir(tmp_path / "single")
+        )
+    )
+    sharded, dfStations = runShardedIngest(
+        inputData=inputData,
+        dirname=makeDataDir(tmp_path / "sharded"),
+        shardDir=str(tmp_path / "shards"),
+        numShards=3,
+        mode="hash",
+    )
+    assert sorted(sharded) == sorted(expected)
+    assert list(sharded) == sorted(sharded)
+    for station in expected:
+        assert list(sharded[station]) == list(expected[station])
+        for column, values in expected[station].items():
+            np.testing.assert_array_equal(sharded[station][column], values)
+    assert sorted(dfStations["City"]) == sorted(dfExpected["City"])
+    store = openColumnarStore(
+        storeDir=str(tmp_path / "sharded" / "Data" / "weatherDataStore")
+    )
+    assert len(store["TX_Synthetic_0_N"]["UTC_DATE"]) == 3 * 24
+
+
+def test_year_shards_merge_the_same_whatever_order_they_finish(
+    tmp_path, serverUrl, makeInputData, makeDataDir
+):
+    inputData = makeInputData(serverUrl=serverUrl, years=YEARS)
+    shardDir = str(tmp_path / "shards")
+    # Later years first: the merge still stacks 2020, 2021, 2022
+    for spec in ["years:2022-2022", "years:2020-2021"]:
+        asyncio.run(
+            runIngestShard(
+                inputData=inputData,
+                dirname=makeDataDir(tmp_path / spec.replace(":", "-")),
+                shardDir=shardDir,
+                spec=spec,
+            )
+        )
+    merged, _ = mergeIngestShards(
+        inputData=inputData,
+        dirname=makeDataDir(tmp_path / "merged"),
+        shardDir=shardDir,
+        specs=["years:2020-2021", "years:2022-2022"],
+        writeStore=False,
+    )
+    utcDate = merged["TX_Synthetic_3_N"]["UTC_DATE"]
+    assert len(utcDate) == 3 * 24 and (np.diff(utcDate.astype(np.int64)) >= 0).all()
+    assert len(merged) == 8
+
+
+def test_merge_reads_only_the_shards_of_the_current_run(
+    tmp_path, serverUrl, makeInputData, makeDataDir
+):
+    inputData = makeInputData(serverUrl=serverUrl, years=YEARS)
+    shardDir = tmp_path / "shards"
+    specs = ["hash:0/2", "hash:1/2"]
+    for spec in specs:
+        asyncio.run(
+            runIngestShard(
+                inputData=inputData,
+                dirname=makeDataDir(
+                    tmp_path / spec.replace(":", "-").replace("/", "-")
+                ),
+                shardDir=str(shardDir),
+                spec=spec,
+            )
+        )
+    # Finished shard of an earlier 4-way split, sorting before the fresh ones
+    staleDir = shardDir / "hash-0-of-4"
+    staleDir.mkdir()
+    np.savez(
+        staleDir / "2020.npz",
+        **{"TX_Synthetic_0_N/UTC_DATE": np.zeros(24, np.int32) - 1},
+    )
+    (staleDir / "shard.json").write_text(
+        '{"version": 1, "spec": "hash:0/4", "years": {"2020": '
+        '{"file": "2020.npz", "stations": ["TX_Synthetic_0_N"]}}}'
+    )
+    merged, _ = mergeIngestShards(
+        inputData=inputData,
+        dirname=makeDataDir(tmp_path / "merged"),
+        shardDir=str(shardDir),
+        specs=specs,
+        writeStore=False,
+    )
+    assert len(merged) == 8
+    assert (np.asarray(merged["TX_Synthetic_0_N"]["UTC_DATE"]) > 0).all()
+    # A shard of the run that has not finished fails the merge instead of dropping its stations
+    with pytest.raises(RuntimeError, match="hash-2-of-3"):
+        mergeIngestShards(
+            inputData=inputData,
+            dirname=makeDataDir(tmp_path / "partial"),
+            shardDir=str(shardDir),
+            specs=["hash:0/3", "hash:1/3", "hash:2/3"],
+            writeStore=False,
+        )
@@ -0,0 +1,125 @@
+"""
+Tests for the station registry, cached IDW weights and the hourly time index
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "weatherForcastingCalculator")
+)
+
+from utils.spatialInterpolation import (  # noqa: E402
+    EARTH_RADIUS_KM,
+    IdwInterpolator,
+    StationRegistry,
+    getIdwInterpolator,
+    getTargetGrid,
+)
+from utils.timeIndex import alignStationsOnHours, getUtcHours  # noqa: E402
+
+
+def haversineKm(lon1, lat1, lon2, lat2):
+    lon1, lat1, lon2, lat2 = map(np.radians, [lon1, lat1, lon2, lat2])
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def makeRegistry(numStations=40, seed=1):
+    rng = np.random.default_rng(seed)
+    dfStations = pd.DataFrame(
+        {
+            "City": [f"S{i}" for i in range(numStations)],
+            "Longitude": rng.uniform(-120, -70, numStations),
+            "Latitude": rng.uniform(25, 48, numStations),
+            "Elevation": rng.uniform(0, 2000, numStations),
+        }
+    )
+    return StationRegistry.fromDataFrame(dfStations=dfStations)
+
+
+def test_registry_neighbors_match_brute_force_great_circle():
+    registry = makeRegistry()
+    distances, indices = registry.query(
+        longitude=[-100.0], latitude=[35.0], numNeighbors=5
+    )
+    bruteForce = haversineKm(-100.0, 35.0, registry.longitude, registry.latitude)
+    np.testing.assert_array_equal(indices[0], np.argsort(bruteForce)[:5])
+    np.testing.assert_allclose(distances[0], np.sort(bruteForce)[:5], rtol=1e-9)
+
+
+def test_batched_idw_renormalizes_over_missing_stations():
+    registry = makeRegistry()
+    gridLon, gridLat = getTargetGrid(registry=registry, resolution=2.0)
+    interpolator = IdwInterpolator(
+        registry=registry,
+        targetLongitude=gridLon,
+        targetLatitude=gridLat,
+        numNeighbors=6,
+    )
+    rng = np.random.default_rng(2)
+    values = rng.normal(15, 5, (50, len(registry)))
+    values[rng.random(values.shape) < 0.3] = np.nan
+    field = interpolator.interpolate(values=values)
+    assert field.shape == (50,) + gridLon.shape
+    # Reference: per timestep and target, IDW over the reporting stations among the 6 nearest
+    distances, indices = registry.query(
+        longitude=gridLon.ravel(), latitude=gridLat.ravel(), numNeighbors=6
+    )
+    for t in [0, 17, 49]:
+        neighborValues = values[t][indices]
+        weights = np.where(np.isnan(neighborValues), 0.0, 1.0 / distances**2)
+        with np.errstate(invalid="ignore"):
+            expected = np.nansum(weights * np.nan_to_num(neighborValues), axis=1)
+            expected = expected / weights.sum(axis=1)
+        np.testing.assert_allclose(field[t].ravel(), expected, rtol=1e-10)
+
+
+def test_target_on_a_station_takes_its_value_and_weights_are_cached():
+    registry = makeRegistry()
+    interpolator = getIdwInterpolator(
+        registry=registry,
+        targetLongitude=registry.longitude[:3],
+        targetLatitude=registry.latitude[:3],
+    )
+    values = np.arange(len(registry), dtype=np.float64)
+    np.testing.assert_allclose(
+        interpolator.interpolate(values=values)[0], [0, 1, 2], atol=1e-9
+    )
+    sameInterpolator = getIdwInterpolator(
+        registry=makeRegistry(),
+        targetLongitude=registry.longitude[:3].copy(),
+        targetLatitude=registry.latitude[:3].copy(),
+    )
+    assert sameInterpolator is interpolator
+
+
+def test_stations_align_on_a_common_hourly_axis():
+    stationA = {
+        "UTC_DATE": np.array([20201231, 20201231, 20210101]),
+        "UTC_TIME": np.array([2200, 2300, 0], dtype=np.int16),
+        "T_HR_AVG": np.array([1.0, 2.0, 3.0]),
+    }
+    stationB = {
+        "UTC_DATE": np.array([20210101.0]),
+        "UTC_TIME": np.array([100.0]),
+        "T_HR_AVG": np.array([9.0]),
+    }
+    assert getUtcHours(stationData=stationA)[-1] == np.datetime64("2021-01-01T00")
+    hours = np.arange(
+        np.datetime64("2020-12-31T23"),
+        np.datetime64("2021-01-01T02"),
+        dtype="datetime64[h]",
+    )
+    matrix = alignStationsOnHours(
+        weatherDataDictObjectAll={"A": stationA, "B": stationB},
+        stations=["A", "B"],
+        variable="T_HR_AVG",
+        hours=hours,
+    )
+    np.testing.assert_array_equal(matrix, [[2.0, np.nan], [3.0, np.nan], [np.nan, 9.0]])
@@ -0,0 +1,85 @@
+"""
+Tests for the station x time cube and its chunked NetCDF export in utils/stationCube.py
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "weatherForcastingCalculator")
+)
+
+from utils.stationCube import (  # noqa: E402
+    buildStationCube,
+    openStationCube,
+    writeStationCube,
+)
+
+
+def makeStations():
+    stamps = pd.date_range("2021-01-01 00:00", periods=24 * 10, freq="H")
+    utcDate = stamps.strftime("%Y%m%d").astype(np.int32).values
+    utcTime = stamps.strftime("%H%M").astype(np.int16).values
+    stations = {}
+    for i, rows in enumerate([slice(0, 240), slice(24, 120), slice(100, 240)]):
+        temperature = np.arange(240, dtype=np.float64)[rows] + 1000 * i
+        stations[f"S{i}"] = {
+            "UTC_DATE": utcDate[rows],
+            "UTC_TIME": utcTime[rows],
+            "LONGITUDE": np.full(len(temperature), -100.0 - i),
+            "LATITUDE": np.full(len(temperature), 30.0 + i),
+            "T_HR_AVG": temperature,
+            "P_CALC": temperature / 100,
+        }
+    return stations
+
+
+def test_cube_aligns_stations_on_one_hourly_axis():
+    stations = makeStations()
+    dfStations = pd.DataFrame(
+        {
+            "City": ["S2", "S0"],
+            "Longitude": [-102.0, -100.0],
+            "Latitude": [32.0, 30.0],
+            "Elevation": [12.5, np.nan],
+        }
+    )
+    cube = buildStationCube(weatherDataDictObjectAll=stations, dfStations=dfStations)
+    assert list(cube["station"].values) == ["S2", "S0"]
+    assert cube["elevation"].dtype == np.float64
+    assert cube.sizes["time"] == 240
+    assert cube["time"].values[0] == np.datetime64("2021-01-01T00")
+    s2 = cube["T_HR_AVG"].sel(station="S2").values
+    assert np.isnan(s2[:100]).all() and s2[100] == 2100.0
+    assert cube.to_array("variable").dims == ("variable", "station", "time")
+    # Without dfStations every station is kept, coordinates come from the station columns
+    cube = buildStationCube(weatherDataDictObjectAll=stations, variables=["P_CALC"])
+    assert list(cube.data_vars) == ["P_CALC"]
+    np.testing.assert_array_equal(cube["latitude"].values, [30.0, 31.0, 32.0])
+    assert np.isnan(cube["P_CALC"].sel(station="S1").values[:24]).all()
+
+
+def test_netcdf_export_is_chunked_compressed_and_read_lazily(tmp_path):
+    stations = makeStations()
+    fileName = str(tmp_path / "cube.nc")
+    writeStationCube(
+        weatherDataDictObjectAll=stations,
+        outFileName=fileName,
+        chunkStations=2,
+        chunkHours=48,
+    )
+    expected = buildStationCube(weatherDataDictObjectAll=stations)
+    with openStationCube(fileName=fileName) as cube:
+        encoding = cube["T_HR_AVG"].encoding
+        assert encoding["zlib"] and encoding["chunksizes"] == (2, 48)
+        assert cube["T_HR_AVG"].dtype == np.float32
+        assert set(cube.data_vars) == {"T_HR_AVG", "P_CALC"}
+        window = cube["T_HR_AVG"].sel(
+            station="S1", time=slice("2021-01-02T00", "2021-01-02T05")
+        )
+        np.testing.assert_array_equal(window.values, np.arange(24, 30) + 1000)
+        np.testing.assert_allclose(
+            cube["P_CALC"].values, expected["P_CALC"].values, rtol=1e-6
+        )
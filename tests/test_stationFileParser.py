@@ -0,0 +1,52 @@
+"""
+Tests for the typed hourly02 station file parser
+"""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "weatherForcastingCalculator")
+)
+
+from utils.stationFileParser import (  # noqa: E402
+    HOURLY02_COLUMNS,
+    getStationLabel,
+    parseHourly02Bytes,
+)
+
+SAMPLE_LINES = (
+    b"03047 20200101 0100 20191231 1800  2.622 -102.81   30.62     3.3     3.1"
+    b"     3.8     2.8     0.0      0 0      0 0      0 0 C     0.8 0     1.2 0"
+    b"     0.4 0   62 0  -99.000  -99.000  -99.000  -99.000  -99.000 -9999.0"
+    b" -9999.0 -9999.0 -9999.0 -9999.0\n"
+    b"03047 20200101 0200 20191231 1900  2.622 -102.81   30.62     2.1     2.6"
+    b"     3.1     2.1     0.4     12 0     15 3      0 0 R    -0.5 3     0.2 0"
+    b"    -1.0 0   71 0    0.150    0.160  -99.000  -99.000  -99.000    12.4"
+    b"    12.8 -9999.0 -9999.0 -9999.0\n"
+)
+
+
+def test_parse_hourly02_columns_and_dtypes():
+    stationData = parseHourly02Bytes(rawBytes=SAMPLE_LINES)
+    assert list(stationData.keys()) == HOURLY02_COLUMNS
+    assert len(HOURLY02_COLUMNS) == 38
+    assert stationData["UTC_DATE"].dtype == np.int32
+    assert stationData["UTC_TIME"].tolist() == [100, 200]
+    assert stationData["SOLARAD_MAX_FLAG"].dtype == np.int8
+    assert stationData["SOLARAD_MAX_FLAG"].tolist() == [0, 3]
+    assert stationData["T_HR_AVG"].dtype == np.float64
+    np.testing.assert_allclose(stationData["T_HR_AVG"], [3.1, 2.6])
+    assert stationData["SUR_TEMP_TYPE"].tolist() == ["C", "R"]
+    assert stationData["CRX_VN"].tolist() == ["2.622", "2.622"]
+
+
+def test_parse_hourly02_empty_payload():
+    stationData = parseHourly02Bytes(rawBytes=b"\n")
+    assert all(len(values) == 0 for values in stationData.values())
+
+
+def test_station_label():
+    label = getStationLabel(stationFile="CRNH0203-2020-TX_Austin_33_NW.txt", year=2020)
+    assert label == "TX_Austin_33_NW"
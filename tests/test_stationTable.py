@@ -0,0 +1,55 @@
+"""
+Tests for the compact schema-driven StationTable
+"""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "weatherForcastingCalculator")
+)
+
+from utils.stationTable import StationTable, loadColumnDescriptions  # noqa: E402
+
+
+def makeCleanedStation(n=100, surfaceType="C"):
+    return {
+        "WBANNO": np.full(n, 3047.0),
+        "UTC_DATE": np.full(n, 20200101.0),
+        "UTC_TIME": np.arange(n, dtype=float),
+        "CRX_VN": np.full(n, 2.622),
+        "T_HR_AVG": np.linspace(-5, 5, n),
+        "SOLARAD_FLAG": np.where(np.arange(n) % 10 == 0, 3.0, 0.0),
+        "SUR_TEMP_TYPE": np.array([surfaceType] * n),
+    }
+
+
+def test_station_table_is_compact_and_keeps_dict_access():
+    data = {
+        "A": makeCleanedStation(n=100),
+        "B": makeCleanedStation(n=50, surfaceType="R"),
+    }
+    data["B"]["T_HR_AVG"][3] = np.nan
+    table = StationTable.fromStationDict(weatherDataDictObjectAll=data)
+    assert list(table.keys()) == ["A", "B"]
+    assert table["B"]["T_HR_AVG"].dtype == np.float32
+    assert np.isnan(table["B"]["T_HR_AVG"][3])
+    np.testing.assert_allclose(table["A"]["T_HR_AVG"], data["A"]["T_HR_AVG"], atol=1e-6)
+    assert table["A"]["UTC_DATE"].dtype == np.int32
+    assert table["A"]["SOLARAD_FLAG"].dtype == np.uint8
+    assert table["A"]["SOLARAD_FLAG"][:2].tolist() == [3, 0]
+    assert table["B"]["SUR_TEMP_TYPE"].tolist() == ["R"] * 50
+    assert table.buffers["SUR_TEMP_TYPE"].dtype == np.uint8
+    # Station columns are views into one shared buffer
+    assert np.shares_memory(table["B"]["UTC_TIME"], table.column("UTC_TIME"))
+    originalBytes = sum(v.nbytes for s in data.values() for v in s.values())
+    assert table.nbytes * 3 < originalBytes
+
+
+def test_column_descriptions_from_spreadsheet():
+    dirname = os.path.join(
+        os.path.dirname(__file__), "..", "weatherForcastingCalculator"
+    )
+    descriptions = loadColumnDescriptions(dirname=dirname)
+    assert "RH_HR_AVG" in descriptions
@@ -0,0 +1,161 @@
+"""
+Tests for the product schemas, chunked parsing and the bounded-memory streaming ingest
+"""
+import asyncio
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "weatherForcastingCalculator")
+)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+from localNceiServer import (  # noqa: E402
+    generateSubhourlyStationFile,
+    startLocalNceiServer,
+    stopLocalNceiServer,
+)
+from utils.columnarStore import openColumnarStore  # noqa: E402
+from utils.dataPrepAndParser import parserFunParallelized  # noqa: E402
+from utils.incrementalIngest import updateStoreIncrementally  # noqa: E402
+from utils.stationFileParser import (  # noqa: E402
+    SUBHOURLY01_COLUMN_DTYPES,
+    getStationLabel,
+    iterStationFileChunks,
+    parseStationBytes,
+)
+from utils.streamingIngest import streamIngestToStore  # noqa: E402
+
+
+def test_subhourly_chunks_match_a_whole_file_parse(tmp_path):
+    rawBytes = generateSubhourlyStationFile(year=2021, stationIndex=2, hours=30)
+    filePath = tmp_path / "CRNS0101-05-2021-TX_Synthetic_2_N.txt"
+    filePath.write_bytes(rawBytes)
+    whole = parseStationBytes(rawBytes=rawBytes, product="subhourly01")
+    assert list(whole) == list(SUBHOURLY01_COLUMN_DTYPES)
+    assert len(whole["UTC_DATE"]) == 30 * 12
+    chunks = list(
+        iterStationFileChunks(
+            filePath=str(filePath), product="subhourly01", chunkRows=100
+        )
+    )
+    assert [len(chunk["UTC_TIME"]) for chunk in chunks] == [100, 100, 100, 60]
+    for column, values in whole.items():
+        np.testing.assert_array_equal(
+            np.concatenate([chunk[column] for chunk in chunks]), values
+        )
+    assert getStationLabel(stationFile=filePath.name, year="2021") == (
+        "TX_Synthetic_2_N"
+    )
+    with pytest.raises(ValueError):
+        parseStationBytes(rawBytes=rawBytes, product="daily01")
+
+
+def test_streamed_store_matches_the_in_memory_ingest(
+    tmp_path, makeInputData, makeDataDir
+):
+    server, serverUrl = startLocalNceiServer(
+        years=[2020, 2021], numStations=5, hours=48
+    )
+    try:
+        inputData = makeInputData(serverUrl=serverUrl, streamChunkRows=50)
+        expected, _ = asyncio.run(
+            parserFunParallelized(
+                inputData=inputData, dirname=makeDataDir(tmp_path / "memory")
+            )
+        )
+        dirname = makeDataDir(tmp_path / "streamed")
+        store, dfStations = asyncio.run(
+            streamIngestToStore(
+                inputData=inputData,
+                dirname=dirname,
+                storeDir=dirname + "/Data/weatherDataStore",
+            )
+        )
+    finally:
+        stopLocalNceiServer(server=server)
+    assert sorted(store) == sorted(expected)
+    for station in expected:
+        for column, values in expected[station].items():
+            np.testing.assert_array_equal(store[station][column], values)
+    assert len(dfStations) == 5
+    assert not os.listdir(os.path.join(dirname, "Data", "ingestSpool"))
+
+
+def test_subhourly_stream_with_a_failed_station(tmp_path, makeInputData, makeDataDir):
+    server, serverUrl = startLocalNceiServer(
+        years=[2020, 2021], numStations=4, hours=24, product="subhourly01"
+    )
+    try:
+        # The 2021 file of one station is listed but cannot be downloaded
+        del server.RequestHandlerClass.files[
+            "/subhourly01/2021/CRNS0101-05-2021-TX_Synthetic_1_N.txt"
+        ]
+        inputData = makeInputData(
+            serverUrl=serverUrl, product="subhourly01", streamChunkRows=50
+        )
+        inputData["useHttpCache"] = 1
+        dirname = makeDataDir(tmp_path)
+        store, _ = asyncio.run(
+            streamIngestToStore(
+                inputData=inputData,
+                dirname=dirname,
+                storeDir=dirname + "/Data/weatherDataStore",
+            )
+        )
+    finally:
+        stopLocalNceiServer(server=server)
+    assert list(store) == ["TX_Synthetic_0_N", "TX_Synthetic_2_N", "TX_Synthetic_3_N"]
+    assert store.manifest["product"] == "subhourly01"
+    station = store["TX_Synthetic_2_N"]
+    utc = station["UTC_DATE"].astype(np.int64) * 10000 + station["UTC_TIME"]
+    assert len(utc) == 2 * 24 * 12 and (np.diff(utc) > 0).all()
+    # -9999 sentinels are masked chunk by chunk
+    assert np.isnan(station["WETNESS"]).all()
+    assert not (station["AIR_TEMPERATURE"] == -9999.0).any()
+
+
+def test_incremental_refresh_of_a_subhourly_store(tmp_path, makeInputData, makeDataDir):
+    server, serverUrl = startLocalNceiServer(
+        years=[2021], numStations=2, hours=24, product="subhourly01"
+    )
+    try:
+        inputData = makeInputData(
+            serverUrl=serverUrl,
+            years=[2021],
+            product="subhourly01",
+            streamChunkRows=50,
+        )
+        dirname = makeDataDir(tmp_path)
+        asyncio.run(
+            streamIngestToStore(
+                inputData=inputData,
+                dirname=dirname,
+                storeDir=dirname + "/Data/weatherDataStore",
+            )
+        )
+        stationFile = "/subhourly01/2021/CRNS0101-05-2021-TX_Synthetic_1_N.txt"
+        server.RequestHandlerClass.files[stationFile] = generateSubhourlyStationFile(
+            year=2021, stationIndex=1, hours=25
+        )
+        # A parseDataBool = 2 run has no product in inputData, the store records it
+        rowsAdded = asyncio.run(
+            updateStoreIncrementally(
+                inputData={
+                    "nceiBaseUrl": inputData["nceiBaseUrl"],
+                    "currentYear": 2021,
+                },
+                dirname=dirname,
+            )
+        )
+    finally:
+        stopLocalNceiServer(server=server)
+    assert rowsAdded == 12
+    store = openColumnarStore(storeDir=dirname + "/Data/weatherDataStore")
+    station = store["TX_Synthetic_1_N"]
+    assert list(station) == list(SUBHOURLY01_COLUMN_DTYPES)
+    assert len(station["AIR_TEMPERATURE"]) == 25 * 12
+    assert station["UTC_TIME"][-1] == 100
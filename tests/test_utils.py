@@ -0,0 +1,79 @@
+"""
+Tests for the streaming json writer and the incremental json reader in utils/utils.py
+"""
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "weatherForcastingCalculator")
+)
+
+from utils.stationTable import StationTable  # noqa: E402
+from utils.utils import (  # noqa: E402
+    NumpyEncoder,
+    iterJsonStations,
+    readFromJson,
+    writeToJson,
+)
+
+
+def makeStations(numStations=3, numRows=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    stations = {}
+    for i in range(numStations):
+        temperature = np.round(rng.normal(10, 5, numRows), 1)
+        temperature[::7] = np.nan
+        stations[f"TX_Station_{i}"] = {
+            "UTC_DATE": np.arange(numRows, dtype=np.int32) + 20200101,
+            "T_HR_AVG": temperature,
+            "P_CALC": rng.exponential(0.2, numRows),
+            # Quotes, backslashes and non-ascii text have to survive block boundaries
+            "SUR_TEMP_TYPE": rng.choice(["R", 'C"q', "U\\\\", "é"], numRows),
+        }
+    return stations
+
+
+def test_streamed_json_is_what_json_dumps_writes(tmp_path):
+    stations = makeStations()
+    outFileName = str(tmp_path / "weatherDataJSONObject.json")
+    # A small block size splits every column into several encoded blocks
+    writeToJson(data=stations, outFileName=outFileName, blockSize=97)
+    with open(outFileName, "r") as f:
+        assert f.read() == json.dumps(stations, cls=NumpyEncoder)
+    assert not os.path.exists(outFileName + ".tmp")
+    # Mappings other than dict (StationTable) are written the same way
+    table = StationTable.fromStationDict(weatherDataDictObjectAll=makeStations())
+    writeToJson(data=table, outFileName=outFileName)
+    assert sorted(json.load(open(outFileName, "r"))) == sorted(stations)
+
+
+def test_reader_loads_selected_stations_and_columns(tmp_path):
+    stations = makeStations()
+    outFileName = str(tmp_path / "weatherDataJSONObject.json")
+    writeToJson(data=stations, outFileName=outFileName)
+    everything = json.load(open(outFileName, "r"))
+    # Tiny read blocks put every token on a block boundary at some point
+    for blockSize in [5, 64, 1 << 20]:
+        loaded = dict(iterJsonStations(fileName=outFileName, blockSize=blockSize))
+        assert list(loaded) == list(everything)
+        for station, columns in everything.items():
+            assert list(loaded[station]) == list(columns)
+            for column, values in columns.items():
+                np.testing.assert_array_equal(loaded[station][column], values)
+    selected = readFromJson(
+        fileName=outFileName,
+        stations=["TX_Station_2", "TX_Station_0"],
+        columns=["T_HR_AVG", "SUR_TEMP_TYPE"],
+    )
+    assert list(selected) == ["TX_Station_0", "TX_Station_2"]
+    assert list(selected["TX_Station_2"]) == ["T_HR_AVG", "SUR_TEMP_TYPE"]
+    np.testing.assert_array_equal(
+        selected["TX_Station_2"]["T_HR_AVG"], stations["TX_Station_2"]["T_HR_AVG"]
+    )
+    np.testing.assert_array_equal(
+        selected["TX_Station_0"]["SUR_TEMP_TYPE"],
+        stations["TX_Station_0"]["SUR_TEMP_TYPE"],
+    )
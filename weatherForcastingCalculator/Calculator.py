@@ -3,6 +3,10 @@ import time
 import numpy as np
 import asyncio
 from utils.dataPrepAndParser import getCleanedDataStructure
+from utils.figures import startFigureGeneration
+from utils.metrics import getPipelineMetrics
+from utils.featureAnalysis import analyzeFeatures, writeFeatureAnalysis
+from utils.forecasting import forecastAllStations
 from utils.utils import generateInputFileDict
 from os.path import dirname
 
@@ -16,19 +20,105 @@ async def calculate(dirname=""):
         weatherDataDictObjectCleaned, dfStations = await getCleanedDataStructure(
             inputData=inputData, dirname=dirname
         )
+        figureJob = None
+        if inputData["generatePlots"] == 1:
+            # Station map drawn off the data path (skipped when the station table is unchanged)
+            figureJob = startFigureGeneration(
+                dfStations=dfStations, dirname=dirname, inputData=inputData
+            )
+        if inputData["exportStationCube"] == 1:
+            # Imported here, xarray/netCDF4 are only needed for the export
+            from utils.stationCube import writeStationCube
+
+            # All stations on one hourly axis as a compressed, chunked NetCDF (open lazily with xarray)
+            writeStationCube(
+                weatherDataDictObjectAll=weatherDataDictObjectCleaned,
+                dfStations=dfStations,
+                outFileName=dirname + "/Data/weatherStationCube.nc",
+                chunkHours=inputData["cubeChunkHours"],
+            )
+        if inputData["detectAnomalies"] == 1:
+            # Imported here, the spatial check needs scipy's KD-tree
+            from utils.anomalyDetection import detectAnomalies, writeAnomalyMasks
+
+            # Spike/stuck/step/spatial checks over all stations at once, flags kept next to the data
+            masks, dfAnomalyCounts = detectAnomalies(
+                weatherDataDictObjectAll=weatherDataDictObjectCleaned,
+                dfStations=dfStations,
+                inputData=inputData,
+            )
+            writeAnomalyMasks(
+                masks=masks, outFileName=dirname + "/Data/anomalyMasks.npz"
+            )
+            print("Values flagged per check:")
+            print(dfAnomalyCounts.sum())
         if inputData["problemType"] == "PROB01":
-            # This could be data generating further feature information (i.e., correlation/uncertainty/feature importance, etc. stats and plots)
-            print("HERE 01")
+            # Per-station/network moments and quantiles, NaN-aware correlations and feature importance
+            analysis = analyzeFeatures(
+                weatherDataDictObjectAll=weatherDataDictObjectCleaned,
+                inputData=inputData,
+            )
+            writeFeatureAnalysis(analysis=analysis, dirname=dirname)
+            print("Network wide summary:")
+            print(analysis["networkSummary"][["count", "mean", "std", "q50"]])
+            print("Feature importance for " + inputData["analysisTarget"] + ":")
+            print(analysis["featureImportance"])
         if inputData["problemType"] == "PROB02":
-            # This could be geospatial modeling to get a 2D/3D map.
+            # Imported here, scipy's KD-tree is only needed for the gridding
+            from utils.spatialInterpolation import (
+                generateInterpolatedMapPlot,
+                mapStationVariable,
+            )
+
+            # Hourly 2D maps of one variable from cached IDW weights (one batched product for all hours)
             # Could then use this map as ground truth data and predict other features away from stations and at various time stamps
-            print("HERE 02")
+            gridLon, gridLat, hours, field = mapStationVariable(
+                weatherDataDictObjectAll=weatherDataDictObjectCleaned,
+                dfStations=dfStations,
+                inputData=inputData,
+            )
+            np.savez_compressed(
+                dirname + "/Data/Interpolated " + inputData["mapVariable"] + ".npz",
+                gridLon=gridLon,
+                gridLat=gridLat,
+                hours=hours.astype(np.int64),
+                field=field,
+            )
+            generateInterpolatedMapPlot(
+                gridLon=gridLon,
+                gridLat=gridLat,
+                field=np.nanmean(field, axis=0),
+                dfStations=dfStations,
+                title=inputData["mapVariable"]
+                + " mean over the last "
+                + str(len(hours))
+                + " hours",
+                outFileName=dirname
+                + "/Figures/Interpolated "
+                + inputData["mapVariable"]
+                + ".png",
+            )
         if inputData["problemType"] == "PROB03":
-            # This could be Time Series Forecasting using standard ML approaches (could spice it up if want)
-            print("HERE 03")
+            # Direct multi-horizon ridge forecasts per station with rolling-origin backtests
+            dfBacktest, dfForecast, dfStatus = forecastAllStations(
+                weatherDataDictObjectAll=weatherDataDictObjectCleaned,
+                inputData=inputData,
+            )
+            dfBacktest.to_csv(dirname + "/Data/Forecast Backtest.csv", index=False)
+            dfForecast.to_csv(dirname + "/Data/Forecasts.csv", index=False)
+            print(dfStatus["status"].value_counts())
+            print("Backtest error per horizon (mean over stations):")
+            print(dfBacktest.groupby("horizon")[["mae", "rmse", "skill"]].mean())
         if inputData["problemType"] == "PROB04":
             # At this point, could start using some cool methods, like physics informed NNs in a Bayesian framework. etc...
             print("HERE 04")
+        if figureJob is not None:
+            print("Figures drawn:", figureJob.result())
+        metrics = getPipelineMetrics()
+        if metrics.enabled:
+            # Per-stage timers (ingest through plots and analysis), byte/row counters, request latency
+            # histogram and concurrency gauges of the whole run
+            metrics.writeJson(outFileName=dirname + "/Data/pipelineMetrics.json")
         endTime = time.time()
         print(
             "The total numerical time to parse data is "
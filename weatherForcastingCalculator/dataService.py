@@ -0,0 +1,422 @@
+##########################################################
+"""
+HTTP data service over the cleaned station data, loaded once at startup
+
+    uvicorn dataService:app --app-dir weatherForcastingCalculator --host 0.0.0.0 --port 8000
+
+The data directory defaults to the one next to this file (override with WEATHER_DATA_DIR)
+"""
+import os
+import json
+import threading
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from os.path import dirname
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
+from utils.dataPrepAndParser import getCleanedDataStructure
+from utils.queryEngine import StationQueryEngine
+from utils.rollups import RollupPyramid, getRollupDir, rollupsExist
+
+STREAM_CHUNK_ROWS = 5000
+
+
+##########################################################
+class LruCache:
+    """
+    *** Thread safe least-recently-used cache of encoded responses (bounded by entry count)
+    """
+
+    def __init__(self, maxEntries=1024):
+        self.maxEntries = maxEntries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key=None):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return self.entries[key]
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key=None, value=None):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxEntries:
+                self.entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def getOrCompute(self, key=None, compute=None):
+        value = self.get(key=key)
+        if value is None:
+            value = compute()
+            self.put(key=key, value=value)
+        return value
+
+
+##########################################################
+def toJsonBytes(data={}):
+    """
+    *** Encode a response once (NaN -> null) so cached hits skip serialization entirely
+    """
+    return json.dumps(data, allow_nan=False, default=str).encode("utf-8")
+
+
+def toJsonValues(values=[]):
+    values = np.asarray(values, dtype=np.float64)
+    return [None if np.isnan(value) else float(value) for value in values]
+
+
+##########################################################
+def isWholeDay(stamp=None):
+    return stamp is None or np.datetime64(stamp, "h") == np.datetime64(stamp, "D")
+
+
+##########################################################
+def splitList(text=None):
+    return None if not text else [item for item in text.split(",") if item]
+
+
+##########################################################
+def getStationMetadata(engine=None, dfStations=None):
+    dfInfo = dfStations.set_index("City") if dfStations is not None else None
+    stations = []
+    for station in engine.stations:
+        first, last = engine.getTimeBounds(station=station)
+        info = {
+            "station": station,
+            "rows": int(len(engine.hours[station])),
+            "firstHour": None if first is None else str(first),
+            "lastHour": None if last is None else str(last),
+        }
+        if dfInfo is not None and station in dfInfo.index:
+            for column in ["Longitude", "Latitude", "Elevation"]:
+                value = float(dfInfo.loc[station, column])
+                info[column.lower()] = None if np.isnan(value) else value
+        stations.append(info)
+    return stations
+
+
+##########################################################
+def streamNdjson(engine=None, station="", variables=[], rows=slice(0, 0)):
+    """
+    *** One JSON object per hour, encoded STREAM_CHUNK_ROWS rows at a time
+    """
+    for start in range(rows.start, rows.stop, STREAM_CHUNK_ROWS):
+        chunk = slice(start, min(start + STREAM_CHUNK_ROWS, rows.stop))
+        dfChunk = pd.DataFrame(
+            {"UTC_HOUR": engine.hours[station][chunk].view("datetime64[h]").astype(str)}
+        )
+        for variable in variables:
+            dfChunk[variable] = engine.getStationColumn(
+                station=station, variable=variable, rows=chunk
+            )
+        yield dfChunk.to_json(orient="records", lines=True).rstrip("\n") + "\n"
+
+
+def streamBinary(engine=None, station="", variables=[], rows=slice(0, 0)):
+    """
+    *** Little-endian columns back to back: int64 UTC hours since 1970, then float64 per variable
+    """
+    for start in range(rows.start, rows.stop, STREAM_CHUNK_ROWS):
+        chunk = slice(start, min(start + STREAM_CHUNK_ROWS, rows.stop))
+        yield engine.hours[station][chunk].astype("<i8").tobytes()
+    for variable in variables:
+        for start in range(rows.start, rows.stop, STREAM_CHUNK_ROWS):
+            chunk = slice(start, min(start + STREAM_CHUNK_ROWS, rows.stop))
+            values = engine.getStationColumn(
+                station=station, variable=variable, rows=chunk
+            )
+            yield np.asarray(values, dtype="<f8").tobytes()
+
+
+##########################################################
+def createApp(dataDir="", cacheEntries=1024):
+    """
+    *** FastAPI app serving station metadata, time-range slices, snapshots and aggregates
+    """
+
+    @asynccontextmanager
+    async def lifespan(app):
+        # parseDataBool = 0: memory-map the cached store, no network and no re-cleaning
+        weatherDataDictObjectAll, dfStations = await getCleanedDataStructure(
+            inputData={"parseDataBool": 0}, dirname=dataDir
+        )
+        app.state.engine = StationQueryEngine(
+            weatherDataDictObjectAll=weatherDataDictObjectAll
+        )
+        app.state.dfStations = dfStations
+        # Columns every station has, the only ones snapshots/aggregates over all stations can serve
+        variableSets = [
+            set(weatherDataDictObjectAll[s].keys()) for s in app.state.engine.stations
+        ]
+        app.state.variables = set.intersection(*variableSets) if variableSets else set()
+        rollupDir = getRollupDir(dirname=dataDir)
+        app.state.rollups = (
+            RollupPyramid.load(rollupDir=rollupDir)
+            if rollupsExist(rollupDir=rollupDir)
+            else None
+        )
+        app.state.cache = LruCache(maxEntries=cacheEntries)
+        yield
+
+    app = FastAPI(title="Weather station data service", lifespan=lifespan)
+
+    def getStationOr404(station=""):
+        if station not in app.state.engine.stationIndex:
+            raise HTTPException(status_code=404, detail=f"Unknown station {station}")
+        return station
+
+    def getVariablesOr404(variables=None):
+        """
+        *** Requested variables, checked before anything is computed or streamed
+        """
+        variableList = (
+            splitList(text=variables) if isinstance(variables, str) else variables
+        )
+        if not variableList:
+            raise HTTPException(status_code=422, detail="No variables given")
+        unknown = [v for v in variableList if v not in app.state.variables]
+        if unknown:
+            raise HTTPException(
+                status_code=404, detail=f"Unknown variables {','.join(unknown)}"
+            )
+        return variableList
+
+    def getHourOr422(stamp=None, name="time"):
+        """
+        *** ISO time of a query parameter as datetime64[h] (None stays None)
+        """
+        if stamp is None:
+            return None
+        try:
+            hour = np.datetime64(stamp, "h")
+        except ValueError:
+            hour = np.datetime64("NaT", "h")
+        if np.isnat(hour):
+            raise HTTPException(
+                status_code=422, detail=f"Invalid {name} {stamp!r}, expected ISO time"
+            )
+        return hour
+
+    def cachedJson(key=None, compute=None):
+        body = app.state.cache.getOrCompute(
+            key=key, compute=lambda: toJsonBytes(compute())
+        )
+        return Response(content=body, media_type="application/json")
+
+    ######################################################
+    @app.get("/health")
+    def health():
+        return {"status": "ok", "stations": len(app.state.engine.stations)}
+
+    @app.get("/cache")
+    def cacheStats():
+        return {**app.state.cache.stats, "entries": len(app.state.cache.entries)}
+
+    @app.get("/stations")
+    def stations():
+        return cachedJson(
+            key=("stations",),
+            compute=lambda: getStationMetadata(
+                engine=app.state.engine, dfStations=app.state.dfStations
+            ),
+        )
+
+    @app.get("/stations/{station}/series")
+    def series(
+        station: str,
+        variables: str = "T_HR_AVG",
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        format: str = Query("ndjson", pattern="^(ndjson|binary)$"),
+    ):
+        """
+        *** Hourly values of one station for [start, end), streamed without building the full response
+        """
+        engine = app.state.engine
+        station = getStationOr404(station=station)
+        variableList = getVariablesOr404(variables=variables)
+        rows = engine.getRowRange(
+            station=station,
+            start=getHourOr422(stamp=start, name="start"),
+            end=getHourOr422(stamp=end, name="end"),
+        )
+        if format == "binary":
+            return StreamingResponse(
+                streamBinary(
+                    engine=engine, station=station, variables=variableList, rows=rows
+                ),
+                media_type="application/octet-stream",
+                headers={
+                    "X-Rows": str(rows.stop - rows.start),
+                    "X-Columns": ",".join(["UTC_HOUR"] + variableList),
+                },
+            )
+        return StreamingResponse(
+            streamNdjson(
+                engine=engine, station=station, variables=variableList, rows=rows
+            ),
+            media_type="application/x-ndjson",
+        )
+
+    @app.get("/snapshot")
+    def snapshot(time: str, variables: str = "T_HR_AVG"):
+        """
+        *** Every station's values at one UTC hour
+        """
+        variableList = getVariablesOr404(variables=variables)
+        hour = getHourOr422(stamp=time, name="time")
+
+        def compute():
+            result = app.state.engine.pointInTime(stamp=hour, variables=variableList)
+            return {
+                "time": str(hour),
+                "stations": result["stations"],
+                "found": result["found"].tolist(),
+                **{v: toJsonValues(values=result[v]) for v in variableList},
+            }
+
+        return cachedJson(key=("snapshot", time, tuple(variableList)), compute=compute)
+
+    @app.get("/aggregate")
+    def aggregate(
+        variable: str = "T_HR_AVG",
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        stations: Optional[str] = None,
+    ):
+        """
+        *** Count/mean/min/max of one variable per station over [start, end)
+        """
+        stationList = splitList(text=stations) or app.state.engine.stations
+        for station in stationList:
+            getStationOr404(station=station)
+        getVariablesOr404(variables=[variable])
+        for name, stamp in [("start", start), ("end", end)]:
+            getHourOr422(stamp=stamp, name=name)
+
+        rollups = app.state.rollups
+        if (
+            rollups is not None
+            and variable in rollups.variables
+            and isWholeDay(stamp=start)
+            and isWholeDay(stamp=end)
+        ):
+            # Whole days: answered from the coarsest rollup buckets tiling the range
+            def compute():
+                dfSummary = rollups.summarize(
+                    variable=variable, start=start, end=end, stations=stationList
+                )
+                rows = []
+                for row in dfSummary.itertuples(index=False):
+                    rows.append(
+                        {
+                            "station": row.station,
+                            "count": int(row.count),
+                            **{
+                                stat: None if np.isnan(value) else float(value)
+                                for stat, value in [
+                                    ("mean", row.mean),
+                                    ("min", row.min),
+                                    ("max", row.max),
+                                ]
+                            },
+                        }
+                    )
+                return {
+                    "variable": variable,
+                    "start": start,
+                    "end": end,
+                    "stations": rows,
+                }
+
+            return cachedJson(
+                key=("aggregate", variable, start, end, tuple(stationList)),
+                compute=compute,
+            )
+
+        def compute():
+            result = app.state.engine.query(
+                stations=stationList, variables=[variable], start=start, end=end
+            )
+            rows = []
+            for station in stationList:
+                values = np.asarray(result[station][variable], dtype=np.float64)
+                valid = values[~np.isnan(values)]
+                rows.append(
+                    {
+                        "station": station,
+                        "count": int(len(valid)),
+                        "mean": float(valid.mean()) if len(valid) else None,
+                        "min": float(valid.min()) if len(valid) else None,
+                        "max": float(valid.max()) if len(valid) else None,
+                    }
+                )
+            return {"variable": variable, "start": start, "end": end, "stations": rows}
+
+        return cachedJson(
+            key=("aggregate", variable, start, end, tuple(stationList)), compute=compute
+        )
+
+    @app.get("/rollups/{station}")
+    def rollupSeries(
+        station: str,
+        variable: str = "T_HR_AVG",
+        level: str = Query("monthly", pattern="^(daily|monthly|yearly)$"),
+        stat: str = Query("mean", pattern="^(mean|count|sum|min|max)$"),
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+    ):
+        """
+        *** Daily/monthly/yearly aggregate series of one station from the precomputed rollups
+        """
+        rollups = app.state.rollups
+        if rollups is None or variable not in rollups.variables:
+            raise HTTPException(status_code=404, detail=f"No rollups for {variable}")
+        if station not in rollups.stationIndex:
+            raise HTTPException(status_code=404, detail=f"Unknown station {station}")
+        for name, stamp in [("start", start), ("end", end)]:
+            getHourOr422(stamp=stamp, name=name)
+
+        def compute():
+            periods, values = rollups.query(
+                variable=variable,
+                stat=stat,
+                level=level,
+                stations=[station],
+                start=start,
+                end=end,
+            )[station]
+            return {
+                "station": station,
+                "variable": variable,
+                "level": level,
+                "stat": stat,
+                "periods": periods.astype(str).tolist(),
+                "values": toJsonValues(values=values),
+            }
+
+        return cachedJson(
+            key=("rollups", station, variable, level, stat, start, end),
+            compute=compute,
+        )
+
+    return app
+
+
+##########################################################
+app = createApp(
+    dataDir=os.environ.get("WEATHER_DATA_DIR", dirname(os.path.abspath(__file__))),
+    cacheEntries=int(os.environ.get("WEATHER_CACHE_ENTRIES", "1024")),
+)
+
+
+##########################################################
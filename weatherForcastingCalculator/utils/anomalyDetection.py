@@ -0,0 +1,442 @@
+##########################################################
+import os
+import warnings
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from utils.metrics import getPipelineMetrics
+from utils.spatialInterpolation import StationRegistry
+from utils.timeIndex import getStationHourOffsets
+
+# One bit per check in the uint8 anomaly mask of every value (0 = passed every check)
+ANOMALY_FLAGS = {"spike": 1, "stuck": 2, "step": 4, "spatial": 8}
+# Robust z-score thresholds (residual / 1.4826 MAD) above which a value is flagged
+DEFAULT_ANOMALY_THRESHOLDS = {"spike": 6.0, "step": 6.0, "spatial": 5.0}
+MAD_TO_STD = 1.4826
+# Hours on each side of the centered rolling median (spikes), hours averaged before/after a candidate
+# step (whole days cancel the diurnal cycle), hours of the rolling mean removed before comparing with
+# the neighbors, and hours per block of the window copies (bounds their memory)
+SPIKE_HALF_WINDOW = 2
+# Days on each side whose same hour of day make up the diurnal profile removed before the spike check
+DIURNAL_HALF_WINDOW_DAYS = 7
+STEP_WINDOW = 24
+SPATIAL_WINDOW = 24
+TIME_BLOCK = 4096
+
+##########################################################
+# Per variable: smallest robust scale (units of the variable) so near-constant series do not turn
+# every wiggle into an outlier, hours a reading may repeat exactly before it counts as stuck, smallest
+# step worth flagging, and a value allowed to repeat (SOLARAD is 0 all night)
+DEFAULT_VARIABLE_CHECK = {
+    "minScale": 0.5,
+    "stuckHours": 6,
+    "minStep": 2.0,
+    "stuckIgnore": None,
+}
+VARIABLE_CHECKS = {
+    "T_HR_AVG": {"minScale": 0.3, "stuckHours": 6, "minStep": 3.0},
+    "RH_HR_AVG": {"minScale": 2.0, "stuckHours": 12, "minStep": 10.0},
+    "SOLARAD": {
+        "minScale": 20.0,
+        "stuckHours": 4,
+        "minStep": 100.0,
+        "stuckIgnore": 0.0,
+    },
+    "SOIL_MOISTURE": {"minScale": 0.005, "stuckHours": 72, "minStep": 0.05},
+    "SOIL_TEMP": {"minScale": 0.2, "stuckHours": 24, "minStep": 2.0},
+}
+
+
+##########################################################
+def getVariableCheck(variable=""):
+    """
+    *** Check settings of a variable; SOIL_MOISTURE_5/SOIL_TEMP_20/... share the settings of their prefix
+    """
+    prefix = variable.rsplit("_", 1)[0] if variable.startswith("SOIL_") else variable
+    return {**DEFAULT_VARIABLE_CHECK, **VARIABLE_CHECKS.get(prefix, {})}
+
+
+def getDefaultAnomalyVariables(firstStation={}):
+    return [
+        column
+        for column in firstStation
+        if column in ["T_HR_AVG", "RH_HR_AVG", "SOLARAD"] or column.startswith("SOIL_")
+    ]
+
+
+##########################################################
+def robustScale(values=[], minScale=0.0):
+    """
+    *** Per column 1.4826 x median absolute deviation (NaN-aware), never below minScale
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN columns
+        center = np.nanmedian(values, axis=0)
+        scale = MAD_TO_STD * np.nanmedian(np.abs(values - center), axis=0)
+    return np.fmax(np.nan_to_num(scale, nan=minScale), minScale)
+
+
+##########################################################
+def nanMedianLastAxis(values=[]):
+    """
+    *** NaN-aware median over the (short) last axis: sorting puts NaN last, so the median sits at the
+    *** middle of the valid count; several times faster than np.nanmedian on window/neighbor axes
+    """
+    ordered = np.sort(values, axis=-1)
+    counts = (~np.isnan(values)).sum(axis=-1, keepdims=True)
+    lower = np.take_along_axis(ordered, np.maximum(counts - 1, 0) // 2, axis=-1)
+    upper = np.take_along_axis(ordered, counts // 2, axis=-1)
+    # No valid value leaves lower = NaN, so the median of an all-NaN window is NaN
+    return ((lower + upper) / 2)[..., 0]
+
+
+##########################################################
+def getWindowSums(values=[], window=1):
+    """
+    *** NaN-aware sums and valid counts of every window of rows [t, t + window), from cumulative sums
+    *** Shapes (hours - window + 1, stations), one pass whatever the window length
+    """
+    valid = ~np.isnan(values)
+    zeroRow = np.zeros((1, values.shape[1]))
+    cumulativeSum = np.concatenate(
+        [zeroRow, np.cumsum(np.where(valid, values, 0.0), 0)]
+    )
+    cumulativeCount = np.concatenate([zeroRow, np.cumsum(valid, axis=0)])
+    sums = cumulativeSum[window:] - cumulativeSum[:-window]
+    counts = cumulativeCount[window:] - cumulativeCount[:-window]
+    return sums, counts
+
+
+def padRows(values=[], before=0, after=0, fill=np.nan):
+    return np.pad(values, ((before, after), (0, 0)), constant_values=fill)
+
+
+def spreadWindowFlags(windowFlags=[], window=1):
+    """
+    *** Window flags (one per window start) -> value flags: a value is flagged when any window covering it is
+    """
+    numWindows = len(windowFlags)
+    cumulative = np.cumsum(padRows(values=windowFlags, before=1, fill=0), axis=0)
+    rows = np.arange(numWindows + window - 1)
+    # Row t is covered by the windows starting at t - window + 1 ... t
+    last = np.minimum(rows, numWindows - 1) + 1
+    first = np.maximum(rows - window + 1, 0)
+    return cumulative[last] - cumulative[first] > 0
+
+
+##########################################################
+def getRollingMedianResiduals(values=[], halfWindow=SPIKE_HALF_WINDOW):
+    """
+    *** values minus the NaN-aware median of the halfWindow hours on each side, computed over
+    *** sliding-window views of all stations at once, TIME_BLOCK hours at a time
+    *** The value itself is left out: otherwise it is its own median a fifth of the time, the zero
+    *** residuals deflate the robust scale and ordinary noise gets flagged
+    """
+    window = 2 * halfWindow + 1
+    padded = padRows(values=values, before=halfWindow, after=halfWindow)
+    windows = sliding_window_view(padded, window, axis=0)  # hours x stations x window
+    medians = np.empty_like(values)
+    for start in range(0, len(values), TIME_BLOCK):
+        block = windows[start : start + TIME_BLOCK].copy()
+        block[..., halfWindow] = np.nan
+        medians[start : start + TIME_BLOCK] = nanMedianLastAxis(values=block)
+    return values - medians
+
+
+def getDiurnalProfile(
+    values=[], firstHourOfDay=0, halfWindowDays=DIURNAL_HALF_WINDOW_DAYS
+):
+    """
+    *** Typical value of every hour: NaN-aware median of the same hour of day on the halfWindowDays
+    *** days before and after (not the day itself, see getRollingMedianResiduals), so the profile follows
+    *** the seasonal change of the daily cycle; firstHourOfDay is the UTC hour of day of the first row
+    """
+    numHours, numStations = values.shape
+    numDays = -(-(firstHourOfDay + numHours) // 24)
+    days = np.full((numDays * 24, numStations), np.nan)
+    days[firstHourOfDay : firstHourOfDay + numHours] = values
+    days = np.pad(
+        days.reshape(numDays, 24, numStations),
+        ((halfWindowDays, halfWindowDays), (0, 0), (0, 0)),
+        constant_values=np.nan,
+    )
+    windows = sliding_window_view(days, 2 * halfWindowDays + 1, axis=0)
+    profile = np.empty((numDays, 24, numStations))
+    blockDays = max(1, TIME_BLOCK // 24)
+    for start in range(0, numDays, blockDays):
+        block = windows[
+            start : start + blockDays
+        ].copy()  # days x 24 x stations x window
+        block[..., halfWindowDays] = np.nan
+        profile[start : start + blockDays] = nanMedianLastAxis(values=block)
+    return profile.reshape(-1, numStations)[firstHourOfDay : firstHourOfDay + numHours]
+
+
+##########################################################
+def detectSpikes(values=[], check={}, threshold=6.0, firstHourOfDay=0):
+    """
+    *** Values far from their centered rolling median once the diurnal profile is removed (a rolling
+    *** median of the raw series cuts off the daily peaks and troughs), relative to the robust residual
+    *** scale of the station at that hour of day (e.g. SOLARAD is far noisier at noon than at night)
+    """
+    residuals = getRollingMedianResiduals(
+        values=values - getDiurnalProfile(values=values, firstHourOfDay=firstHourOfDay)
+    )
+    hourOfDay = (firstHourOfDay + np.arange(len(values))) % 24
+    scale = np.empty(values.shape)
+    for hour in range(24):
+        rows = hourOfDay == hour
+        scale[rows] = robustScale(values=residuals[rows], minScale=check["minScale"])
+    # The median of a window cut short by the record ends or a gap is skewed by the diurnal slope,
+    # values are only judged when at most one of their window is missing
+    window = 2 * SPIKE_HALF_WINDOW + 1
+    _, counts = getWindowSums(
+        values=padRows(
+            values=values, before=SPIKE_HALF_WINDOW, after=SPIKE_HALF_WINDOW
+        ),
+        window=window,
+    )
+    return (np.abs(residuals) > threshold * scale) & (counts >= window - 1)
+
+
+def detectStuck(values=[], check={}):
+    """
+    *** Runs of stuckHours valid readings that are exactly equal (a value of stuckIgnore may repeat)
+    """
+    window = check["stuckHours"]
+    if len(values) < window:
+        return np.zeros(values.shape, bool)
+    windows = sliding_window_view(values, window, axis=0)
+    # NaN in a window makes max/min NaN, so a run with gaps is never stuck
+    stuck = windows.max(axis=-1) == windows.min(axis=-1)
+    if check["stuckIgnore"] is not None:
+        stuck &= windows[..., 0] != check["stuckIgnore"]
+    return spreadWindowFlags(windowFlags=stuck, window=window)
+
+
+def detectSteps(values=[], check={}, threshold=6.0, window=STEP_WINDOW):
+    """
+    *** Level shifts: the mean of the window after hour t minus the mean of the window before it,
+    *** flagged at the hour where that difference peaks when it is both unusual for the station
+    *** (robust z above threshold) and at least minStep
+    """
+    flags = np.zeros(values.shape, bool)
+    if len(values) < 2 * window:
+        return flags
+    sums, counts = getWindowSums(values=values, window=window)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.where(counts >= window // 2, sums / counts, np.nan)
+    # Step at hour t compares rows [t - window, t) with [t, t + window)
+    steps = means[window:] - means[:-window]
+    scale = robustScale(values=steps, minScale=check["minStep"] / threshold)
+    magnitude = np.abs(steps)
+    candidate = (magnitude > threshold * scale) & (magnitude >= check["minStep"])
+    # Only the peak of the difference inside +-window hours marks the change point
+    peaks = sliding_window_view(
+        padRows(values=np.nan_to_num(magnitude), before=window, after=window, fill=0),
+        2 * window + 1,
+        axis=0,
+    ).max(axis=-1)
+    flags[window : window + len(steps)] = candidate & (magnitude >= peaks)
+    return flags
+
+
+##########################################################
+def getNeighborIndices(
+    stations=[], dfStations=None, numNeighbors=5, maxDistanceKm=400.0
+):
+    """
+    *** stations x numNeighbors column indices of each station's closest stations (from dfStations
+    *** coordinates); missing neighbors point at len(stations), an all-NaN column appended by the caller
+    """
+    missing = len(stations)
+    neighborIndices = np.full((len(stations), numNeighbors), missing, dtype=np.int64)
+    if dfStations is None or numNeighbors == 0:
+        return neighborIndices
+    dfKnown = dfStations[dfStations["City"].isin(stations)]
+    if len(dfKnown) < 2:
+        return neighborIndices
+    registry = StationRegistry.fromDataFrame(dfStations=dfKnown)
+    columnIndex = {station: j for j, station in enumerate(stations)}
+    toColumns = np.array([columnIndex[s] for s in registry.stations] + [missing])
+    distances, indices = registry.query(
+        longitude=registry.longitude,
+        latitude=registry.latitude,
+        numNeighbors=numNeighbors + 1,
+    )
+    # The closest hit is the station itself, neighbors too far away do not vote
+    isSelf = indices == np.arange(len(registry))[:, None]
+    indices = np.where(isSelf | (distances > maxDistanceKm), len(registry), indices)
+    for row, station in enumerate(registry.stations):
+        others = indices[row][indices[row] != len(registry)][:numNeighbors]
+        neighborIndices[columnIndex[station], : len(others)] = toColumns[others]
+    return neighborIndices
+
+
+def detectSpatialOutliers(
+    values=[], neighborIndices=None, check={}, threshold=5.0, minNeighbors=2
+):
+    """
+    *** Compare each station's departure from its own daily mean with the median departure of its
+    *** neighbors at the same hour; removing the local mean first cancels elevation/climate offsets
+    """
+    flags = np.zeros(values.shape, bool)
+    if neighborIndices is None or len(values) < SPATIAL_WINDOW:
+        return flags
+    halfWindow = SPATIAL_WINDOW // 2
+    sums, counts = getWindowSums(
+        values=padRows(values=values, before=halfWindow, after=halfWindow),
+        window=SPATIAL_WINDOW + 1,
+    )
+    with np.errstate(invalid="ignore", divide="ignore"):
+        departures = values - np.where(counts > halfWindow, sums / counts, np.nan)
+    # Extra all-NaN column for the missing-neighbor index
+    departures = np.concatenate([departures, np.full((len(values), 1), np.nan)], 1)
+    disagreement = np.full(values.shape, np.nan)
+    for start in range(0, len(values), TIME_BLOCK):
+        block = departures[start : start + TIME_BLOCK]
+        neighborValues = block[:, neighborIndices]  # hours x stations x neighbors
+        enough = (~np.isnan(neighborValues)).sum(axis=-1) >= minNeighbors
+        consensus = np.where(enough, nanMedianLastAxis(values=neighborValues), np.nan)
+        disagreement[start : start + TIME_BLOCK] = block[:, :-1] - consensus
+    scale = robustScale(values=disagreement, minScale=check["minScale"])
+    return np.abs(disagreement) > threshold * scale
+
+
+##########################################################
+def detectVariableAnomalies(
+    values=[],
+    variable="",
+    neighborIndices=None,
+    thresholds=DEFAULT_ANOMALY_THRESHOLDS,
+    firstHourOfDay=0,
+):
+    """
+    *** hours x stations uint8 anomaly mask of one variable, every check over all stations at once
+    """
+    check = getVariableCheck(variable=variable)
+    thresholds = {**DEFAULT_ANOMALY_THRESHOLDS, **thresholds}
+    mask = np.zeros(values.shape, np.uint8)
+    mask[
+        detectSpikes(
+            values=values,
+            check=check,
+            threshold=thresholds["spike"],
+            firstHourOfDay=firstHourOfDay,
+        )
+    ] |= ANOMALY_FLAGS["spike"]
+    mask[detectStuck(values=values, check=check)] |= ANOMALY_FLAGS["stuck"]
+    mask[
+        detectSteps(values=values, check=check, threshold=thresholds["step"])
+    ] |= ANOMALY_FLAGS["step"]
+    mask[
+        detectSpatialOutliers(
+            values=values,
+            neighborIndices=neighborIndices,
+            check=check,
+            threshold=thresholds["spatial"],
+        )
+    ] |= ANOMALY_FLAGS["spatial"]
+    # Missing values are never anomalous, they are already NaN
+    mask[np.isnan(values)] = 0
+    return mask
+
+
+##########################################################
+def detectAnomalies(
+    weatherDataDictObjectAll={}, dfStations=None, variables=None, inputData={}
+):
+    """
+    *** QC every station at once: each variable is aligned on a shared hourly axis (hours x stations),
+    *** checked with rolling-window statistics and against neighboring stations of dfStations
+    *** Returns ({station: {variable: uint8 mask per row}}, DataFrame of flagged counts per station,
+    *** variable and check); the data itself is left untouched
+    """
+    stations = list(weatherDataDictObjectAll.keys())
+    if not stations:
+        return {}, pd.DataFrame()
+    if variables is None:
+        variables = getDefaultAnomalyVariables(
+            firstStation=weatherDataDictObjectAll[stations[0]]
+        )
+    hours, rowOffsets = getStationHourOffsets(
+        weatherDataDictObjectAll=weatherDataDictObjectAll, stations=stations
+    )
+    neighborIndices = getNeighborIndices(
+        stations=stations,
+        dfStations=dfStations,
+        numNeighbors=inputData.get("anomalyNeighbors", 5),
+        maxDistanceKm=inputData.get("anomalyMaxDistanceKm", 400.0),
+    )
+    masks = {station: {} for station in stations}
+    counts = []
+    with getPipelineMetrics().stage("anomaly"):
+        for variable in variables:
+            values = np.full((len(hours), len(stations)), np.nan)
+            for j, (station, (offsets, inRange)) in enumerate(
+                zip(stations, rowOffsets)
+            ):
+                stationValues = np.asarray(weatherDataDictObjectAll[station][variable])
+                values[offsets, j] = stationValues[inRange]
+            mask = detectVariableAnomalies(
+                values=values,
+                variable=variable,
+                neighborIndices=neighborIndices,
+                thresholds=inputData.get("anomalyThresholds", {}),
+                firstHourOfDay=int(hours[0].astype(np.int64) % 24),
+            )
+            for j, (station, (offsets, inRange)) in enumerate(
+                zip(stations, rowOffsets)
+            ):
+                rowMask = np.zeros(len(inRange), np.uint8)
+                rowMask[inRange] = mask[offsets, j]
+                masks[station][variable] = rowMask
+            for flag, bit in ANOMALY_FLAGS.items():
+                flagged = ((mask & bit) > 0).sum(axis=0)
+                counts.append(pd.Series(flagged, index=stations, name=(variable, flag)))
+    dfCounts = pd.concat(counts, axis=1) if counts else pd.DataFrame(index=stations)
+    getPipelineMetrics().incrementCounter(
+        "valuesFlagged",
+        int(sum((m > 0).sum() for s in masks.values() for m in s.values())),
+    )
+    return masks, dfCounts
+
+
+##########################################################
+def maskAnomalies(values=[], mask=[], flags=None):
+    """
+    *** Copy of values with NaN wherever mask has any of the given flags (all checks by default)
+    """
+    bits = sum(ANOMALY_FLAGS[flag] for flag in (flags or ANOMALY_FLAGS))
+    values = np.array(values, dtype=np.float64)
+    values[(np.asarray(mask) & bits) > 0] = np.nan
+    return values
+
+
+##########################################################
+def writeAnomalyMasks(masks={}, outFileName=""):
+    """
+    *** Compressed npz with one uint8 array per station and variable (keys "station/variable")
+    """
+    with open(outFileName + ".tmp", "wb") as f:
+        np.savez_compressed(
+            f,
+            **{
+                f"{station}/{variable}": mask
+                for station, stationMasks in masks.items()
+                for variable, mask in stationMasks.items()
+            },
+        )
+    os.replace(outFileName + ".tmp", outFileName)
+
+
+def loadAnomalyMasks(fileName=""):
+    masks = {}
+    with np.load(fileName) as arrays:
+        for key in arrays.files:
+            station, _, variable = key.partition("/")
+            masks.setdefault(station, {})[variable] = arrays[key]
+    return masks
+
+
+##########################################################
@@ -0,0 +1,212 @@
+##########################################################
+import os
+import json
+import shutil
+import numpy as np
+from collections.abc import Mapping
+
+MANIFEST_FILE_NAME = "manifest.json"
+STORE_VERSION = 1
+
+
+##########################################################
+def toStorableArray(values=[]):
+    """
+    *** Columns are stored as flat fixed-width arrays, so object arrays (python strings) become unicode
+    """
+    array = np.ascontiguousarray(np.asarray(values).flatten())
+    if array.dtype == object:
+        array = array.astype(str)
+    return array
+
+
+##########################################################
+def readManifest(storeDir=""):
+    with open(os.path.join(storeDir, MANIFEST_FILE_NAME), "r") as f:
+        return json.load(f)
+
+
+##########################################################
+def writeManifest(storeDir="", manifest={}):
+    manifestPath = os.path.join(storeDir, MANIFEST_FILE_NAME)
+    with open(manifestPath + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(manifestPath + ".tmp", manifestPath)
+
+
+##########################################################
+def columnarStoreExists(storeDir=""):
+    return os.path.exists(os.path.join(storeDir, MANIFEST_FILE_NAME))
+
+
+##########################################################
+def replaceStoreDir(partialDir="", storeDir=""):
+    """
+    *** Swap a completely written store in for the previous one: the old directory is renamed aside and
+    *** only removed afterwards, so storeDir is missing for no more than two renames (open memmaps of
+    *** the old files stay valid, the files are only unlinked)
+    """
+    oldDir = storeDir + ".old"
+    shutil.rmtree(oldDir, ignore_errors=True)
+    if os.path.exists(storeDir):
+        os.replace(storeDir, oldDir)
+    os.replace(partialDir, storeDir)
+    shutil.rmtree(oldDir, ignore_errors=True)
+
+
+##########################################################
+def writeColumnarStore(data={}, storeDir="", product=None):
+    """
+    *** Write {station: {column: array}} as one raw binary file per station and column plus a json manifest
+    *** The manifest records dtype and length of every column so it can be memory-mapped back without parsing
+    *** data can also be an iterator of (station, columns) pairs, only one station is then held at a time
+    *** The store is built in storeDir.partial and swapped in when complete, readers of the previous store
+    *** never see a half written column and stations no longer present do not linger
+    *** product (e.g. "hourly02") is recorded in the manifest, incremental refreshes fetch the same product
+    """
+    partialDir = storeDir + ".partial"
+    shutil.rmtree(partialDir, ignore_errors=True)
+    os.makedirs(partialDir)
+    manifest = {"version": STORE_VERSION, "stations": {}}
+    if product is not None:
+        manifest["product"] = product
+    items = data.items() if isinstance(data, Mapping) else data
+    for i, (station, stationData) in enumerate(items):
+        stationDir = f"s{i:04d}"
+        os.makedirs(os.path.join(partialDir, stationDir))
+        columns = {}
+        for column, values in stationData.items():
+            array = toStorableArray(values=values)
+            fileName = column + ".bin"
+            array.tofile(os.path.join(partialDir, stationDir, fileName))
+            columns[column] = {
+                "file": fileName,
+                "dtype": array.dtype.str,
+                "length": int(array.shape[0]),
+            }
+        manifest["stations"][station] = {"dir": stationDir, "columns": columns}
+    # Manifest is written last so a partially written store is never picked up as complete
+    writeManifest(storeDir=partialDir, manifest=manifest)
+    replaceStoreDir(partialDir=partialDir, storeDir=storeDir)
+    return manifest
+
+
+##########################################################
+def appendToColumnarStore(storeDir="", newData={}, manifest=None, saveManifest=True):
+    """
+    *** Append rows of {station: {column: array}} to the end of existing column files in place
+    *** Numeric columns are cast to the stored dtype; a string column is only rewritten if it needs to widen
+    *** Stations and columns the store does not have yet are created with the dtype of the first rows
+    *** The manifest (lengths) is saved after the data, so a crash mid-append leaves the old view intact
+    *** (saveManifest=False leaves saving to the caller, e.g. after a batch of appends)
+    """
+    if manifest is None:
+        manifest = readManifest(storeDir=storeDir)
+    for station, columns in newData.items():
+        if station not in manifest["stations"]:
+            stationDir = f"s{len(manifest['stations']):04d}"
+            os.makedirs(os.path.join(storeDir, stationDir), exist_ok=True)
+            manifest["stations"][station] = {"dir": stationDir, "columns": {}}
+        stationInfo = manifest["stations"][station]
+        for column, values in columns.items():
+            if column not in stationInfo["columns"]:
+                stationInfo["columns"][column] = {
+                    "file": column + ".bin",
+                    "dtype": toStorableArray(values=values).dtype.str,
+                    "length": 0,
+                }
+            info = stationInfo["columns"][column]
+            filePath = os.path.join(storeDir, stationInfo["dir"], info["file"])
+            array = toStorableArray(values=values)
+            storedDtype = np.dtype(info["dtype"])
+            if array.dtype.kind == "U" and array.dtype.itemsize > storedDtype.itemsize:
+                oldArray = np.fromfile(
+                    filePath, dtype=storedDtype, count=info["length"]
+                )
+                array = np.concatenate([oldArray.astype(array.dtype), array])
+                array.tofile(filePath)
+                info["dtype"] = array.dtype.str
+                info["length"] = int(array.shape[0])
+                continue
+            array = array.astype(storedDtype, copy=False)
+            with open(filePath, "r+b" if os.path.exists(filePath) else "wb") as f:
+                # Truncate anything past the recorded length left behind by an interrupted append
+                f.truncate(info["length"] * storedDtype.itemsize)
+                f.seek(0, os.SEEK_END)
+                f.write(array.tobytes())
+            info["length"] += int(array.shape[0])
+    if saveManifest:
+        writeManifest(storeDir=storeDir, manifest=manifest)
+    return manifest
+
+
+##########################################################
+class ColumnarStation(Mapping):
+    """
+    *** Dict-like view of one station; each column is memory-mapped the first time it is accessed
+    """
+
+    def __init__(self, storeDir="", stationInfo={}, mode="c"):
+        self.storeDir = storeDir
+        self.stationInfo = stationInfo
+        self.mode = mode
+        self.openColumns = {}
+
+    def __getitem__(self, column):
+        if column not in self.openColumns:
+            info = self.stationInfo["columns"][column]
+            dtype = np.dtype(info["dtype"])
+            if info["length"] == 0:
+                self.openColumns[column] = np.empty(0, dtype=dtype)
+            else:
+                self.openColumns[column] = np.memmap(
+                    os.path.join(self.storeDir, self.stationInfo["dir"], info["file"]),
+                    dtype=dtype,
+                    mode=self.mode,
+                    shape=(info["length"],),
+                )
+        return self.openColumns[column]
+
+    def __iter__(self):
+        return iter(self.stationInfo["columns"])
+
+    def __len__(self):
+        return len(self.stationInfo["columns"])
+
+
+##########################################################
+class ColumnarStore(Mapping):
+    """
+    *** Lazy {station: {column: array}} mapping over a store written by writeColumnarStore
+    *** Opening only reads the manifest; column data is paged in by the OS when it is touched
+    *** mode="c" (copy-on-write) lets callers modify arrays in memory without touching the files
+    """
+
+    def __init__(self, storeDir="", mode="c"):
+        self.storeDir = storeDir
+        self.mode = mode
+        self.manifest = readManifest(storeDir=storeDir)
+        self.stations = {}
+
+    def __getitem__(self, station):
+        if station not in self.stations:
+            self.stations[station] = ColumnarStation(
+                storeDir=self.storeDir,
+                stationInfo=self.manifest["stations"][station],
+                mode=self.mode,
+            )
+        return self.stations[station]
+
+    def __iter__(self):
+        return iter(self.manifest["stations"])
+
+    def __len__(self):
+        return len(self.manifest["stations"])
+
+
+##########################################################
+def openColumnarStore(storeDir="", mode="c"):
+    return ColumnarStore(storeDir=storeDir, mode=mode)
+
+
+##########################################################
@@ -1,133 +1,285 @@
 ##########################################################
+import os
+import json
 import numpy as np
 import pandas as pd
-import requests
-import matplotlib.pyplot as plt
+from concurrent.futures import ThreadPoolExecutor
+from utils.stationFileParser import PRODUCT_FLAG_COLUMNS, PRODUCT_SCHEMAS
+from utils.metrics import getPipelineMetrics
 
 
 ##########################################################
-def getElevations(lat=0, lon=0):
-    ######################################################
-    try:
-        url = f"https://api.open-elevation.com/api/v1/lookup"
-        params = {"locations": f"{lat},{lon}"}
-        response = requests.get(url, params=params, timeout=10)
-        if response.status_code == 200:
-            data = response.json()
-            elevation = data["results"][0]["elevation"]
-            return float(elevation)
-        return np.nan
-    except Exception as e:
-        print(f"Error getting elevation for {lat}, {lon}: {e}")
-        return np.nan
+ELEVATION_SERVICE_URL = "https://api.open-elevation.com/api/v1/lookup"
+
+
+##########################################################
+def getElevationCacheKey(lat=0, lon=0):
+    return f"{float(lat):.4f},{float(lon):.4f}"
+
+
+##########################################################
+def loadElevationCache(cachePath=""):
+    if not os.path.exists(cachePath):
+        return {}
+    with open(cachePath, "r") as f:
+        return json.load(f)
+
+
+##########################################################
+def saveElevationCache(cachePath="", elevationCache={}):
+    with open(cachePath + ".tmp", "w") as f:
+        json.dump(elevationCache, f, indent=1, sort_keys=True)
+    os.replace(cachePath + ".tmp", cachePath)
+
+
+##########################################################
+def getElevationsBatched(latLonList=[], url=ELEVATION_SERVICE_URL, chunkSize=100):
+    """
+    *** Look up many (lat, lon) points with the batched POST form of the lookup API
+    *** Chunks are sent concurrently; points of a failed chunk come back as NaN
+    """
+    import requests
+
+    def lookupChunk(chunk):
+        try:
+            payload = {
+                "locations": [{"latitude": lat, "longitude": lon} for lat, lon in chunk]
+            }
+            response = requests.post(url, json=payload, timeout=30)
+            if response.status_code == 200:
+                return [float(x["elevation"]) for x in response.json()["results"]]
+            print(f"Elevation lookup failed with status {response.status_code}")
+        except Exception as e:
+            print(f"Error getting elevations for {len(chunk)} stations: {e}")
+        return [np.nan] * len(chunk)
+
+    chunks = [
+        latLonList[i : i + chunkSize] for i in range(0, len(latLonList), chunkSize)
+    ]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lookupChunk, chunks))
+    return [elevation for chunkResult in results for elevation in chunkResult]
 
 
 ##########################################################
 def getElevationAndDataFrameOfDesiredWeatherStations(
-    weatherDataDictObjectAll={}, dirname=""
+    weatherDataDictObjectAll={}, dirname="", elevationServiceUrl=ELEVATION_SERVICE_URL
 ):
     ######################################################
     cityList = []
     longitudeList = []
     latitudeList = []
-    elevationList = []
     ######################################################
     for i in range(0, len(list(weatherDataDictObjectAll))):
         city = list(weatherDataDictObjectAll)[i]
         longitude = np.float64(weatherDataDictObjectAll[city]["LONGITUDE"][0])
         latitude = np.float64(weatherDataDictObjectAll[city]["LATITUDE"][0])
-        elevation = getElevations(lat=latitude, lon=longitude)
         if longitude >= -130:  # i.e., stations not part of the continental US
             cityList.append(city)
             longitudeList.append(longitude)
             latitudeList.append(latitude)
-            elevationList.append(elevation)
     ######################################################
-    npArray = np.vstack([cityList, longitudeList, latitudeList, elevationList]).T
+    # Elevations come from a persistent lat/lon keyed cache, only misses go to the service (in one batch)
+    cachePath = dirname + "/Data/elevationCache.json"
+    elevationCache = loadElevationCache(cachePath=cachePath)
+    keys = [
+        getElevationCacheKey(lat=lat, lon=lon)
+        for lat, lon in zip(latitudeList, longitudeList)
+    ]
+    missing = sorted(
+        {
+            key: (lat, lon)
+            for key, lat, lon in zip(keys, latitudeList, longitudeList)
+            if key not in elevationCache
+        }.items()
+    )
+    if missing:
+        print(f"Looking up elevation for {len(missing)} uncached stations")
+        with getPipelineMetrics().stage("elevation"):
+            elevations = getElevationsBatched(
+                latLonList=[latLon for _, latLon in missing], url=elevationServiceUrl
+            )
+        for (key, _), elevation in zip(missing, elevations):
+            if not np.isnan(elevation):  # failed lookups are retried on the next run
+                elevationCache[key] = elevation
+        saveElevationCache(cachePath=cachePath, elevationCache=elevationCache)
+    elevationList = [elevationCache.get(key, np.nan) for key in keys]
+    ######################################################
+    # Built column by column so coordinates/elevation stay float64 (np.vstack made them all strings)
     dfStations = pd.DataFrame(
-        npArray, columns=["City", "Longitude", "Latitude", "Elevation"]
+        {
+            "City": cityList,
+            "Longitude": np.asarray(longitudeList, dtype=np.float64),
+            "Latitude": np.asarray(latitudeList, dtype=np.float64),
+            "Elevation": np.asarray(elevationList, dtype=np.float64),
+        }
     )
     ######################################################
-    generatePlotOfContinentalUS(dfStations=dfStations, dirname=dirname)
-    dfStations.to_csv(dirname + "/Data/Weather Stations Info.csv", index=False)
+    # The station map is drawn by utils/figures.py (generatePlots), not on the data path
+    with getPipelineMetrics().stage("write"):
+        dfStations.to_csv(dirname + "/Data/Weather Stations Info.csv", index=False)
     ######################################################
     return dfStations
 
 
 ##########################################################
-def generatePlotOfContinentalUS(dfStations=[], dirname=""):
-    ######################################################
-    plt.figure(figsize=(14, 8))
-    cm = plt.cm.get_cmap("terrain")
-    sc = plt.scatter(
-        np.float64(dfStations["Longitude"].values.flatten()),
-        np.float64(dfStations["Latitude"].values.flatten()),
-        c=np.float64(dfStations["Elevation"].values.flatten()),
-        cmap=cm,
-        s=50,
-        alpha=0.8,
-        edgecolors="black",
-        linewidth=0.3,
-    )
-    ######################################################
-    cbar = plt.colorbar(sc, label="Elevation (ft)", shrink=0.8, aspect=30)
-    cbar.ax.tick_params(labelsize=10)
+# Missing-value sentinels per column; any column not listed uses the defaults.
+# Identifier, time and coordinate columns are never masked (e.g. a longitude of exactly -99.0 is valid)
+DEFAULT_SENTINEL_VALUES = [-99.0, -9999.0]
+COLUMN_SENTINEL_VALUES = {
+    column: []
+    for schema in PRODUCT_SCHEMAS.values()
+    for column in schema["columns"][:8] + list(schema["flagColumns"].values())
+}
+
+
+##########################################################
+def isMaskableColumn(column=""):
+    """
+    *** Whether a column can hold masked values: it has sentinels or a QC flag column
+    """
+    sentinels = COLUMN_SENTINEL_VALUES.get(column, DEFAULT_SENTINEL_VALUES)
+    return bool(sentinels) or column in PRODUCT_FLAG_COLUMNS
+
+
+##########################################################
+def getInvalidMask(values=[], column="", flagValues=None):
+    """
+    *** Boolean mask of sentinel values, plus values whose QC flag is set (non-zero) when flagValues is given
+    """
+    sentinels = COLUMN_SENTINEL_VALUES.get(column, DEFAULT_SENTINEL_VALUES)
+    mask = np.isin(values, sentinels) if sentinels else np.zeros(len(values), bool)
+    if flagValues is not None:
+        mask |= np.nan_to_num(flagValues, nan=0) != 0
+    return mask
+
+
+##########################################################
+def cleanAllStations(weatherDataDictObjectAll={}, inPlace=True, useQcFlags=True):
+    """
+    *** Clean every station at once: each column of all stations is handled as one buffer,
+    *** sentinel and QC-flag masking is applied in a single vectorized pass per column
+    *** inPlace writes NaNs into existing float arrays (or the shared buffers of a StationTable),
+    *** otherwise new {station: {column: array}} (or a new StationTable) is returned and the input is untouched
+    *** Returns the cleaned data and a DataFrame of masked value counts (stations x columns)
+    """
+    stations = list(weatherDataDictObjectAll.keys())
+    if not stations:
+        return weatherDataDictObjectAll, pd.DataFrame()
+    isStationTable = hasattr(weatherDataDictObjectAll, "buffers")
+    if isStationTable:
+        cleanedBuffers = dict(weatherDataDictObjectAll.buffers)
+    elif inPlace:
+        cleaned = weatherDataDictObjectAll
+    else:
+        cleaned = {
+            station: dict(weatherDataDictObjectAll[station]) for station in stations
+        }
+    columns = list(weatherDataDictObjectAll[stations[0]].keys())
+    if isStationTable:
+        offsets = weatherDataDictObjectAll.offsets
+    else:
+        lengths = [len(weatherDataDictObjectAll[s][columns[0]]) for s in stations]
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
     ######################################################
-    xticks = np.round(np.linspace(-130, -60, 20), 3).tolist()
-    yticks = np.round(np.linspace(20, 60, 20), 3).tolist()
-    plt.xlim([min(xticks), max(xticks)])  # Longitude
-    plt.ylim([min(yticks), max(yticks)])  # Latitude
-    plt.xticks(xticks, rotation=45)
-    plt.yticks(yticks, rotation=45)
-    plt.xlabel("Longitude (°W)", fontsize=12, fontweight="bold")
-    plt.ylabel("Latitude (°N)", fontsize=12, fontweight="bold")
-    plt.title(
-        "Weather Stations across Continental US\n(Colored by Elevation)",
-        fontsize=14,
-        fontweight="bold",
-        pad=20,
-    )
-    plt.grid(True, alpha=0.3, linestyle="--")
-    plt.tight_layout()
-    plt.savefig(
-        dirname + "/Figures/Weather Stations Map.png", dpi=300, bbox_inches="tight"
-    )
+    # Numeric buffers of every column over all stations: float only where a value can be masked,
+    # flag/identifier/time columns keep their parsed dtype and text columns are passed through
+    buffers = {}
+    floatColumns = set()
+    for column in columns:
+        if isStationTable:
+            if column not in weatherDataDictObjectAll.categories:
+                buffers[column] = weatherDataDictObjectAll.buffers[column]
+            continue
+        stationArrays = [
+            np.asarray(weatherDataDictObjectAll[s][column]).flatten() for s in stations
+        ]
+        buffer = np.concatenate(stationArrays)
+        if not isMaskableColumn(column=column):
+            if buffer.dtype.kind in "biuf":
+                buffers[column] = buffer
+            continue
+        try:
+            buffers[column] = buffer.astype(float)
+            floatColumns.add(column)
+        except ValueError:  # i.e., text column, kept as is
+            for station, values in zip(stations, stationArrays):
+                cleaned[station][column] = values
     ######################################################
+    maskedCounts = {}
+    for column, buffer in buffers.items():
+        flagColumn = PRODUCT_FLAG_COLUMNS.get(column)
+        flagValues = buffers.get(flagColumn) if useQcFlags else None
+        mask = getInvalidMask(values=buffer, column=column, flagValues=flagValues)
+        if mask.any() and buffer.dtype.kind == "f":
+            # Buffers of a dict input are already new arrays (concatenated), only table buffers are shared
+            if isStationTable and not inPlace:
+                buffer = buffer.copy()
+            buffer[mask] = np.nan
+        # Masked values per station from the running count at the station offsets
+        cumulative = np.concatenate([[0], np.cumsum(mask)])
+        maskedCounts[column] = cumulative[offsets[1:]] - cumulative[offsets[:-1]]
+        if isStationTable:
+            cleanedBuffers[column] = buffer
+            continue
+        if column not in floatColumns:
+            continue  # never masked, the station arrays are left as they are
+        for i, station in enumerate(stations):
+            values = buffer[offsets[i] : offsets[i + 1]]
+            original = weatherDataDictObjectAll[station][column]
+            if (
+                inPlace
+                and isinstance(original, np.ndarray)
+                and original.dtype == values.dtype
+                and original.shape == values.shape
+                and original.flags.writeable
+            ):
+                original[...] = values
+            else:
+                cleaned[station][column] = values
+    dfMaskedCounts = pd.DataFrame(maskedCounts, index=stations)
+    if isStationTable and inPlace:
+        cleaned = weatherDataDictObjectAll
+    elif isStationTable:
+        table = weatherDataDictObjectAll
+        cleaned = type(table)(
+            stations=table.stations,
+            offsets=table.offsets,
+            buffers=cleanedBuffers,
+            categories=table.categories,
+            schema=table.schema,
+        )
+    return cleaned, dfMaskedCounts
 
 
 ##########################################################
-def replaceInvalidDataWithNaN(stationDict={}, keysList=[], i=0):
-    try:
-        valRawDataFloat = np.array(stationDict[keysList[i]]).flatten().astype(float)
-        valCleanDataPartI = np.where(
-            (valRawDataFloat == -99.0) | (valRawDataFloat == -9999.0),
-            np.nan,
-            valRawDataFloat,
-        )
-        stationDict[keysList[i]] = valCleanDataPartI
-    except:  # i.e., cannot convert valRawDataFloat to float
-        stationDict[keysList[i]] = np.array(stationDict[keysList[i]]).flatten()
-    return stationDict
+def cleanStationColumns(stationDict={}, useQcFlags=True):
+    cleaned, _ = cleanAllStations(
+        weatherDataDictObjectAll={"station": stationDict}, useQcFlags=useQcFlags
+    )
+    return cleaned["station"]
 
 
 ##########################################################
-def cleanData(weatherDataDictObjectAll={}, dirname=""):
+def cleanData(weatherDataDictObjectAll={}, dirname="", inputData={}):
     ######################################################
-    # Initial Clean up of each data
-    stationsKeysList = list(weatherDataDictObjectAll.keys())
-    for j in range(0, len(stationsKeysList)):
-        stationDict = weatherDataDictObjectAll[stationsKeysList[j]]
-        keysList = list(stationDict.keys())
-        for i in range(0, len(keysList)):
-            # adding data cleaning functions here
-            stationDict = replaceInvalidDataWithNaN(
-                stationDict=stationDict, keysList=keysList, i=i
-            )
-        weatherDataDictObjectAll[stationsKeysList[j]] = stationDict
+    # Initial Clean up of all stations in one vectorized pass (sentinels + QC flags)
+    metrics = getPipelineMetrics()
+    with metrics.stage("clean"):
+        weatherDataDictObjectAll, dfMaskedCounts = cleanAllStations(
+            weatherDataDictObjectAll=weatherDataDictObjectAll,
+            useQcFlags=inputData.get("useQcFlags", 1) == 1,
+        )
+    metrics.incrementCounter("valuesMasked", int(dfMaskedCounts.values.sum()))
+    print(
+        f"Masked {int(dfMaskedCounts.values.sum())} invalid values across all stations"
+    )
     ######################################################
     print("Done Cleaning")
     dfStations = getElevationAndDataFrameOfDesiredWeatherStations(
-        weatherDataDictObjectAll=weatherDataDictObjectAll, dirname=dirname
+        weatherDataDictObjectAll=weatherDataDictObjectAll,
+        dirname=dirname,
+        elevationServiceUrl=inputData.get("elevationServiceUrl", ELEVATION_SERVICE_URL),
     )
     print("Done Getting Unique Weather Station Info and Putting in DataFrame")
     return weatherDataDictObjectAll, dfStations
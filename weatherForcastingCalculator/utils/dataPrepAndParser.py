@@ -2,13 +2,33 @@
 import numpy as np
 import pandas as pd
 import warnings
-import json
+import time
+import random
 import asyncio
-import aiohttp
-from urllib.request import urlopen
-from bs4 import BeautifulSoup
-from utils.utils import writeToJson
+from concurrent.futures import ProcessPoolExecutor
+from utils.utils import iterJsonStations, writeToJson
 from utils.dataCleaning import cleanData
+from utils.stationFileParser import (
+    NCEI_HOURLY02_URL,
+    getProductSchema,
+    getStationLabel,
+    parseStationBytes,
+)
+from utils.httpCache import getHttpCache
+from utils.metrics import configurePipelineMetrics, getPipelineMetrics
+from utils.ingestManifest import getIngestManifest
+from utils.stationTable import StationTable
+from utils.columnarStore import (
+    columnarStoreExists,
+    openColumnarStore,
+    writeColumnarStore,
+)
+from utils.ingestPlan import (
+    buildIngestPlan,
+    formatIngestPlanReport,
+    parseListingSizes,
+)
+from utils.rollups import buildRollups, getRollupDir, rollupsExist
 
 warnings.filterwarnings("ignore")
 
@@ -21,21 +41,74 @@ def verticallyStackObjectsInDict(dictAllData={}):
     years = list(dictAllData.keys())
     weather_stations = list(dictAllData[years[0]].keys())
     ######################################################
-    for station in weather_stations:
-        stackedWeatherData[station] = {}
-        measurement_keys = dictAllData[years[0]][station].keys()
-        for measurement in measurement_keys:
-            yearly_data = []
-            for year in years:
-                if year in dictAllData and station in dictAllData[year]:
-                    yearly_data.append(dictAllData[year][station][measurement])
-            # Stack vertically (concatenate arrays)
-            stackedWeatherData[station][measurement] = np.concatenate(yearly_data)
+    with getPipelineMetrics().stage("stack"):
+        for station in weather_stations:
+            stackedWeatherData[station] = {}
+            measurement_keys = dictAllData[years[0]][station].keys()
+            for measurement in measurement_keys:
+                yearly_data = []
+                for year in years:
+                    if year in dictAllData and station in dictAllData[year]:
+                        yearly_data.append(dictAllData[year][station][measurement])
+                # Stack vertically (concatenate arrays)
+                stackedWeatherData[station][measurement] = np.concatenate(yearly_data)
     ######################################################
     return stackedWeatherData
     ######################################################
 
 
+##########################################################
+class IncrementalYearStacker:
+    """
+    *** Stacks each station's years as soon as its last year is parsed, the same result as
+    *** updateAndCleanUpDictionaryWithStats + verticallyStackObjectsInDict without first holding every
+    *** parsed year in memory: a station only keeps its yearly columns until it is complete
+    """
+
+    def __init__(self, years=[], jobs=[]):
+        self.years = [str(year) for year in years]
+        # Number of results each station still waits for; a station missing from some year would be
+        # dropped by the year intersection anyway, so its results are never kept
+        self.remaining = {}
+        for year, stationFile in jobs:
+            stationLabel = getStationLabel(stationFile=stationFile, year=year)
+            self.remaining[stationLabel] = self.remaining.get(stationLabel, 0) + 1
+        self.pending = {}
+        self.incomplete = set(
+            station
+            for station, count in self.remaining.items()
+            if count < len(self.years)
+        )
+        self.stackedData = {}
+
+    def add(self, year="", stationFile="", stationData={}):
+        stationLabel = getStationLabel(stationFile=stationFile, year=year)
+        if not stationData:
+            self.incomplete.add(stationLabel)
+        if stationLabel not in self.incomplete:
+            self.pending.setdefault(stationLabel, {})[str(year)] = stationData
+        self.remaining[stationLabel] -= 1
+        if self.remaining[stationLabel] > 0:
+            return
+        yearlyData = self.pending.pop(stationLabel, {})
+        if stationLabel in self.incomplete:
+            return
+        with getPipelineMetrics().stage("stack"):
+            firstYear = yearlyData[self.years[0]]
+            self.stackedData[stationLabel] = {
+                measurement: np.concatenate(
+                    [yearlyData[year][measurement] for year in self.years]
+                )
+                for measurement in firstYear.keys()
+            }
+
+    def summary(self):
+        return {
+            "stackedStations": len(self.stackedData),
+            "removedStations": len(self.incomplete),
+        }
+
+
 ##########################################################
 def updateAndCleanUpDictionaryWithStats(weatherDataDictObjectAll={}):
     """
@@ -86,166 +159,296 @@ def updateAndCleanUpDictionaryWithStats(weatherDataDictObjectAll={}):
 
 
 ##########################################################
-async def fetchURLContent(session="", url=""):
+def getRetryPolicy(inputData={}):
+    return {
+        "maxRetries": inputData.get("maxRetries", 0),
+        "retryBaseDelay": inputData.get("retryBaseDelay", 1.0),
+    }
+
+
+##########################################################
+def isRetryableStatus(status=None):
     """
-    *** Fetch content from URL asynchronously
+    *** Server errors (5xx) and rate limiting (429) can pass, a 404/403 will not change on a retry
     """
+    return status == 429 or (status is not None and status >= 500)
+
+
+##########################################################
+async def fetchURLContent(
+    session="", url="", asBytes=False, cache=None, retryPolicy={}
+):
+    """
+    *** Fetch content from URL asynchronously (raw bytes if asBytes, otherwise decoded text)
+    *** When an HttpCache is given the payload is served from/revalidated against the on-disk cache
+    *** Failed attempts (5xx/429 status, connection errors, timeouts) are retried with exponential backoff and
+    *** jitter, any other failed status is returned as None right away
+    """
+    import aiohttp
+
+    maxRetries = retryPolicy.get("maxRetries", 0)
+    if cache is not None and cache.offline:
+        maxRetries = 0  # nothing to gain from retrying a cache miss
+    metrics = getPipelineMetrics()
+    for attempt in range(maxRetries + 1):
+        try:
+            with metrics.trackConcurrency("requestsInFlight"):
+                startTime = time.perf_counter() if metrics.enabled else 0.0
+                status, content = await fetchURLContentOnce(
+                    session=session, url=url, asBytes=asBytes, cache=cache
+                )
+            if metrics.enabled:
+                metrics.observe(
+                    "requestLatencySeconds", time.perf_counter() - startTime
+                )
+            if content is not None:
+                metrics.incrementCounter("bytesFetched", len(content))
+                return content
+            if not isRetryableStatus(status=status):
+                return
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Error fetching {url}: {e!r}")
+        if attempt < maxRetries:
+            metrics.incrementCounter("fetchRetries")
+            delay = retryPolicy.get("retryBaseDelay", 1.0) * 2**attempt
+            await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+            print(f"Retrying ({attempt + 1}/{maxRetries}):", url)
+    return
+
+
+##########################################################
+async def fetchURLContentOnce(session="", url="", asBytes=False, cache=None):
+    """
+    *** One attempt, returns (HTTP status, content or None)
+    """
+    if cache is not None:
+        status, body = await cache.fetchWithStatus(session=session, url=url)
+        if body is None or asBytes:
+            return status, body
+        return status, body.decode("utf-8", errors="replace")
     async with session.get(url) as response:
         if response.status == 200:
-            return await response.text()
+            if asBytes:
+                return response.status, await response.read()
+            return response.status, await response.text()
         else:
             print("Failed to fetch:", url)
             print("Status:", response.status)
-            return
+            return response.status, None
+
+
+##########################################################
+def getNceiBaseUrl(inputData={}):
+    """
+    *** Root of the product (inputData["product"], hourly02 by default), overridable
+    *** (e.g. a local stand-in server for tests/benchmarks)
+    """
+    if "nceiBaseUrl" in inputData:
+        return inputData["nceiBaseUrl"]
+    return getProductSchema(product=inputData.get("product", "hourly02"))["url"]
+
+
+##########################################################
+def getStationFileUrl(year="", stationFile="", baseUrl=NCEI_HOURLY02_URL):
+    return f"{baseUrl}{year}/{stationFile}"
 
 
 ##########################################################
-async def processStationData(session="", year="", stationFile=""):
+async def processStationData(
+    session="",
+    year="",
+    stationFile="",
+    cache=None,
+    executor=None,
+    retryPolicy={},
+    manifest=None,
+    baseUrl=NCEI_HOURLY02_URL,
+    product="hourly02",
+):
     """
     *** Process individual station data file
+    *** Bytes are fetched on the event loop; parsing runs in the executor (process pool) when one is given
+    *** Files a resumed manifest lists as completed are read straight from the cache, without any request
     """
-    url = f"https://www.ncei.noaa.gov/pub/data/uscrn/products/hourly02/{year}/{stationFile}"
-    html_content = await fetchURLContent(session=session, url=url)
-    soup = BeautifulSoup(html_content, features="html.parser")
-    text = soup.get_text()
-    # Parse data lines
-    val_split = text.split("\n")
-    val = [x for x in val_split if x]
-    text_line_list = []
-    for line in val:
-        text_line = line.split(" ")
-        text_line = [x for x in text_line if x]
-        if text_line:  # Only add non-empty lines
-            text_line_list.append(text_line)
-    # Define columns as a constant to avoid hardcoding
-    weatherDataColumns = [
-        "WBANNO",
-        "UTC_DATE",
-        "UTC_TIME",
-        "LST_DATE",
-        "LST_TIME",
-        "CRX_VN",
-        "LONGITUDE",
-        "LATITUDE",
-        "T_CALC",
-        "T_HR_AVG",
-        "T_MAX",
-        "T_MIN",
-        "P_CALC",
-        "SOLARAD",
-        "SOLARAD_FLAG",
-        "SOLARAD_MAX",
-        "SOLARAD_MAX_FLAG",
-        "SOLARAD_MIN",
-        "SOLARAD_MIN_FLAG",
-        "SUR_TEMP_TYPE",
-        "SUR_TEMP",
-        "SUR_TEMP_FLAG",
-        "SUR_TEMP_MAX",
-        "SUR_TEMP_MAX_FLAG",
-        "SUR_TEMP_MIN",
-        "SUR_TEMP_MIN_FLAG",
-        "RH_HR_AVG",
-        "RH_HR_AVG_FLAG",
-        "SOIL_MOISTURE_5",
-        "SOIL_MOISTURE_10",
-        "SOIL_MOISTURE_20",
-        "SOIL_MOISTURE_50",
-        "SOIL_MOISTURE_100",
-        "SOIL_TEMP_5",
-        "SOIL_TEMP_10",
-        "SOIL_TEMP_20",
-        "SOIL_TEMP_50",
-        "SOIL_TEMP_100",
-    ]
-    # Convert to numpy array and reshape
-    textLineArray = (
-        np.array(text_line_list).flatten().reshape(-1, len(weatherDataColumns))
-    )
-    # Create station label
-    stationLabel = stationFile.replace(".txt", "").replace(f"CRNH0203-{year}-", "")
-    if len(stationLabel) > 31:
-        stationLabel = stationLabel[:31]
-    # Create DataFrame and convert to JSON-serializable format
-    dfTemp = pd.DataFrame(textLineArray, columns=weatherDataColumns)
-    # Convert DataFrame to dictionary with JSON-serializable values
-    stationData = {}
-    for col in dfTemp.columns:
-        # Convert numpy arrays to lists for JSON serialization
-        column_data = dfTemp[col].values.tolist()
-        # Ensure all values are JSON serializable
-        stationData[col] = [
-            str(val) if val is not None else None for val in column_data
-        ]
+    metrics = getPipelineMetrics()
+    url = getStationFileUrl(year=year, stationFile=stationFile, baseUrl=baseUrl)
+    rawBytes = None
+    with metrics.stage("stationFetch"):
+        if manifest is not None and cache is not None and manifest.isCompleted(url=url):
+            _, rawBytes = cache.load(url=url)
+        if rawBytes is None:
+            rawBytes = await fetchURLContent(
+                session=session,
+                url=url,
+                asBytes=True,
+                cache=cache,
+                retryPolicy=retryPolicy,
+            )
+    if rawBytes is None:
+        if manifest is not None:
+            manifest.markFailed(
+                url=url, year=year, stationFile=stationFile, error="download failed"
+            )
+        return "", {}
+    # Parse the fixed layout of the product straight into typed numpy columns
+    with metrics.stage("parse"), metrics.trackConcurrency("parsesInFlight"):
+        if executor is not None:
+            loop = asyncio.get_running_loop()
+            stationData = await loop.run_in_executor(
+                executor, parseStationBytes, rawBytes, product
+            )
+        else:
+            stationData = parseStationBytes(rawBytes=rawBytes, product=product)
+    metrics.incrementCounter("stationsParsed")
+    metrics.incrementCounter("rowsParsed", len(stationData["UTC_DATE"]))
+    stationLabel = getStationLabel(stationFile=stationFile, year=year)
+    if manifest is not None:
+        manifest.markCompleted(
+            url=url, year=year, stationFile=stationFile, numBytes=len(rawBytes)
+        )
     return stationLabel, stationData
 
 
 ##########################################################
-async def processYearData(inputData={}, session="", year=""):
+def parseStationFileListing(htmlContent=""):
     """
-    *** First get list of station files for a given year
-    *** Then process all station data for a given year with improved error handling
+    *** Extract the CRNH/CRNS station .txt file names from a year directory listing
     """
-    # Getting list of station files for a given year
-    url = f"https://www.ncei.noaa.gov/pub/data/uscrn/products/hourly02/{year}/"
-    htmlContent = await fetchURLContent(session=session, url=url)
+    from bs4 import BeautifulSoup
+
     soup = BeautifulSoup(htmlContent, features="html.parser")
     text = soup.get_text()
-    # Extract .txt files containing 'CRNH'
     lines = (line.strip() for line in text.splitlines())
     chunks = (phrase.strip() for line in lines for phrase in line.split(".txt"))
     textParts = " ".join(chunk for chunk in chunks if chunk).split(" ")
     textParts = [x for x in textParts if x]  # Remove empty strings
-    stationFiles = [s + ".txt" for s in textParts if "CRNH" in s]
-    print(f"Processing {len(stationFiles)} stations for year {year}")
-    # Now process all stations for this year in parallel given a batch size
-    yearData = {}
-    batchSizeVal = inputData["batchSize"]
-    for i in range(0, len(stationFiles), batchSizeVal):
-        batch = stationFiles[i : i + batchSizeVal]
-        print(
-            f"Processing batch {i//batchSizeVal + 1} for year {year} ({len(batch)} stations)"
-        )
-        # Create tasks for this batch
-        tasks = [
-            processStationData(session, year, stationFile) for stationFile in batch
-        ]
-        # Wait for batch to complete
-        batchResults = await asyncio.gather(*tasks, return_exceptions=True)
-        # Process batch results
-        successfulCount = 0
-        for j, result in enumerate(batchResults):
-            if isinstance(result, Exception):
-                print(
-                    f"Exception processing station {batch[j]} in year {year}: {result}"
-                )
-                continue
-            stationLabel, stationData = result
-            if stationLabel and stationData:
-                yearData[stationLabel] = stationData
-                successfulCount += 1
-            else:
-                print(f"Failed to process station {batch[j]} in year {year}")
-        print(
-            f"Batch {i//batchSizeVal + 1} completed: {successfulCount}/{len(batch)} successful"
+    return [s + ".txt" for s in textParts if "CRN" in s]
+
+
+##########################################################
+def getParseExecutor(inputData={}):
+    """
+    *** Process pool for station parsing, or None (parse on the event loop) when parseWorkers is 0
+    """
+    parseWorkers = inputData.get("parseWorkers", 0)
+    if parseWorkers <= 0:
+        return None
+    return ProcessPoolExecutor(max_workers=parseWorkers)
+
+
+##########################################################
+async def fetchYearListing(
+    session="", year="", cache=None, retryPolicy={}, baseUrl=NCEI_HOURLY02_URL
+):
+    """
+    *** [(station file, listed size in bytes)] of a given year
+    *** A listing that cannot be fetched raises: planning or ingesting over an empty year would replace
+    *** the cached data with an empty station set
+    """
+    url = f"{baseUrl}{year}/"
+    with getPipelineMetrics().stage("listingFetch"):
+        htmlContent = await fetchURLContent(
+            session=session, url=url, cache=cache, retryPolicy=retryPolicy
         )
-        await asyncio.sleep(0.1)
-    print(
-        f"Completed processing year {year}: {len(yearData)} stations successfully processed"
-    )
-    return yearData
+    if htmlContent is None:
+        raise RuntimeError(f"Could not fetch the station listing of {year}: {url}")
+    return parseListingSizes(htmlContent=htmlContent)
 
 
 ##########################################################
-async def parserFunParallelized(inputData={}, dirname="", writeJson=False):
+async def streamStationDownloads(
+    inputData={},
+    session="",
+    jobs=[],
+    onResult=None,
+    cache=None,
+    executor=None,
+    manifest=None,
+):
     """
-    *** Call all modular functions and begin putting all stations for a given year into dictionary format for later use
+    *** Keep inputData["batchSize"] station downloads in flight across all (year, stationFile) jobs
+    *** A bounded queue feeds a fixed set of workers, so a slow station only holds its own slot and
+    *** the producer waits (backpressure) instead of materializing every task up front
+    *** Each parsed result is handed to onResult(year, stationFile, stationLabel, stationData) as soon as it finishes
     """
+    numWorkers = max(1, min(inputData["batchSize"], len(jobs)))
+    retryPolicy = getRetryPolicy(inputData=inputData)
+    baseUrl = getNceiBaseUrl(inputData=inputData)
+    queue = asyncio.Queue(maxsize=2 * numWorkers)
+    metrics = getPipelineMetrics()
+
+    async def producer():
+        for job in jobs:
+            await queue.put(job)
+            metrics.setGauge("queueDepth", queue.qsize())
+        for _ in range(numWorkers):
+            await queue.put(None)  # one stop signal per worker
+
+    async def worker():
+        while True:
+            job = await queue.get()
+            if job is None:
+                return
+            year, stationFile = job
+            try:
+                with metrics.trackConcurrency("stationsInFlight"):
+                    stationLabel, stationData = await processStationData(
+                        session,
+                        year,
+                        stationFile,
+                        cache=cache,
+                        executor=executor,
+                        retryPolicy=retryPolicy,
+                        manifest=manifest,
+                        baseUrl=baseUrl,
+                        product=inputData.get("product", "hourly02"),
+                    )
+            except Exception as e:
+                print(f"Exception processing station {stationFile} in year {year}: {e}")
+                stationLabel, stationData = "", {}
+                if manifest is not None:
+                    manifest.markFailed(
+                        url=getStationFileUrl(
+                            year=year, stationFile=stationFile, baseUrl=baseUrl
+                        ),
+                        year=year,
+                        stationFile=stationFile,
+                        error=e,
+                    )
+            if not stationLabel:
+                metrics.incrementCounter("stationsFailed")
+            onResult(year, stationFile, stationLabel, stationData)
+
+    await asyncio.gather(producer(), *[worker() for _ in range(numWorkers)])
+
+
+##########################################################
+async def fetchAndParseYears(
+    inputData={},
+    dirname="",
+    stationFilter=None,
+    manifest=None,
+    planYears=None,
+    stackYears=False,
+):
+    """
+    *** Download and parse every (year, station file) of inputData["idealDates"] into {year: {station: columns}}
+    *** With stackYears the stations are stacked while they arrive and {station: columns} is returned instead
+    *** stationFilter(year, stationFile) -> bool restricts the jobs (e.g. to one ingest shard)
+    *** With planIngest only stations listed in every year of planYears (default: the fetched years) are
+    *** downloaded, the others would be dropped when the years are stacked anyway
+    """
+    # Network and HTML parsing dependencies are only loaded by the ingest paths, a cached run never imports them
+    import aiohttp
+
     years = [str(year) for year in inputData["idealDates"]]
-    # Create aiohttp session with connection limits and longer timeout
+    planYears = years if planYears is None else [str(year) for year in planYears]
+    listingYears = list(dict.fromkeys(planYears + years))
+    cache = getHttpCache(inputData=inputData, dirname=dirname)
+    # Connection pool sized to the number of downloads kept in flight (all files live on one host)
     connector = aiohttp.TCPConnector(
-        limit=20,  # Increased total connection limit
-        limit_per_host=10,  # Increased per-host limit
+        limit=inputData["batchSize"],
+        limit_per_host=inputData["batchSize"],
         ttl_dns_cache=300,  # DNS cache TTL
         use_dns_cache=True,
     )
@@ -256,46 +459,207 @@ async def parserFunParallelized(inputData={}, dirname="", writeJson=False):
     )
     # Create aiohttp session with connection limits
     async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-        # Process all years in parallel
-        tasks = [
-            processYearData(inputData=inputData, session=session, year=year)
-            for year in years
-        ]
-        yearResults = await asyncio.gather(*tasks, return_exceptions=True)
-        # Combine results
-        dictAllData = {}
-        for i, result in enumerate(yearResults):
-            dictAllData[years[i]] = result
+        # Year listings are small, fetch them all up front
+        listings = await asyncio.gather(
+            *[
+                fetchYearListing(
+                    session=session,
+                    year=year,
+                    cache=cache,
+                    retryPolicy=getRetryPolicy(inputData=inputData),
+                    baseUrl=getNceiBaseUrl(inputData=inputData),
+                )
+                for year in listingYears
+            ]
+        )
+        listings = dict(zip(listingYears, listings))
+        if inputData.get("planIngest", 1) == 1:
+            plan = buildIngestPlan(
+                listings={year: listings[year] for year in planYears},
+                fetchYears=years,
+            )
+            print(formatIngestPlanReport(plan=plan))
+            yearListings = [
+                [
+                    stationFile
+                    for jobYear, stationFile in plan["jobs"]
+                    if jobYear == year
+                ]
+                for year in years
+            ]
+        else:
+            yearListings = [
+                [stationFile for stationFile, _ in listings[year]] for year in years
+            ]
+        if stationFilter is not None:
+            yearListings = [
+                [
+                    stationFile
+                    for stationFile in files
+                    if stationFilter(year, stationFile)
+                ]
+                for year, files in zip(years, yearListings)
+            ]
+        jobs = []
+        for year, stationFiles in zip(years, yearListings):
+            print(f"Processing {len(stationFiles)} stations for year {year}")
+            jobs += [(year, stationFile) for stationFile in stationFiles]
+        # One global queue over every year keeps the connection pool steadily busy
+        dictAllData = {year: {} for year in years}
+        stacker = IncrementalYearStacker(years=years, jobs=jobs) if stackYears else None
+        remainingPerYear = {
+            year: len(files) for year, files in zip(years, yearListings)
+        }
+        processedPerYear = {year: 0 for year in years}
+
+        def onResult(year, stationFile, stationLabel, stationData):
+            if stationLabel and stationData:
+                processedPerYear[year] += 1
+                if stacker is None:
+                    dictAllData[year][stationLabel] = stationData
+            else:
+                stationData = {}
+                print(f"Failed to process station {stationFile} in year {year}")
+            if stacker is not None:
+                stacker.add(year=year, stationFile=stationFile, stationData=stationData)
+            remainingPerYear[year] -= 1
+            if remainingPerYear[year] == 0:
+                print(
+                    f"Completed processing year {year}: {processedPerYear[year]} stations successfully processed"
+                )
+
+        # CPU bound parsing goes to worker processes so it neither blocks downloads nor the GIL
+        executor = getParseExecutor(inputData=inputData)
+        if manifest is None:
+            manifest = getIngestManifest(inputData=inputData, dirname=dirname)
+        try:
+            await streamStationDownloads(
+                inputData=inputData,
+                session=session,
+                jobs=jobs,
+                onResult=onResult,
+                cache=cache,
+                executor=executor,
+                manifest=manifest,
+            )
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            manifest.save()
+    print("Ingest manifest:", manifest.summary())
+    if manifest.entries["failed"]:
+        print(
+            "Some files failed, rerun with resumeIngest = 1 to fetch only what is missing"
+        )
+    if cache is not None:
+        print("HTTP cache stats:", cache.stats)
+    if stacker is not None:
+        print("Stacked years:", stacker.summary())
+        return stacker.stackedData
+    return dictAllData
+
+
+##########################################################
+def stackCleanAndWrite(
+    dictAllData={}, inputData={}, dirname="", writeJson=False, writeStore=False
+):
+    """
+    *** {year: {station: columns}} -> stations present in every year, years stacked in order, cleaned and written
+    """
     # Make sure all yearly stations are the same
     weatherDataDictObjectAll = updateAndCleanUpDictionaryWithStats(
         weatherDataDictObjectAll=dictAllData
     )
     # Clean up dictionary format and vertically stack all years into one array per weather station
     weatherDataDictObjectAll = verticallyStackObjectsInDict(dictAllData=dictAllData)
+    return cleanAndWrite(
+        weatherDataDictObjectAll=weatherDataDictObjectAll,
+        inputData=inputData,
+        dirname=dirname,
+        writeJson=writeJson,
+        writeStore=writeStore,
+    )
+
+
+##########################################################
+def cleanAndWrite(
+    weatherDataDictObjectAll={},
+    inputData={},
+    dirname="",
+    writeJson=False,
+    writeStore=False,
+):
+    """
+    *** {station: stacked columns} -> cleaned and written
+    """
     # Clean the data
     weatherDataDictObjectAll, dfStations = cleanData(
-        weatherDataDictObjectAll=weatherDataDictObjectAll, dirname=dirname
+        weatherDataDictObjectAll=weatherDataDictObjectAll,
+        dirname=dirname,
+        inputData=inputData,
     )
     # Save to JSON if dirname provided
-    if writeJson == True:
-        writeToJson(
-            data=weatherDataDictObjectAll,
-            outFileName=dirname + "/Data/weatherDataJSONObject.json",
-        )
+    with getPipelineMetrics().stage("write"):
+        if writeJson == True:
+            writeToJson(
+                data=weatherDataDictObjectAll,
+                outFileName=dirname + "/Data/weatherDataJSONObject.json",
+            )
+        if writeStore == True:
+            writeColumnarStore(
+                data=weatherDataDictObjectAll,
+                storeDir=dirname + "/Data/weatherDataStore",
+                product=inputData.get("product", "hourly02"),
+            )
     print("Successfully generated dictionary of all weather stations")
     return weatherDataDictObjectAll, dfStations
 
 
 ##########################################################
-def parserFunSlowAndInSeries(inputData={}, dirname="", writeJson=False):
+async def parserFunParallelized(
+    inputData={}, dirname="", writeJson=False, writeStore=False
+):
+    """
+    *** Call all modular functions and begin putting all stations for a given year into dictionary format for later use
+    """
+    # Stations are stacked as they arrive, the parsed years are never all held at once
+    weatherDataDictObjectAll = await fetchAndParseYears(
+        inputData=inputData, dirname=dirname, stackYears=True
+    )
+    return cleanAndWrite(
+        weatherDataDictObjectAll=weatherDataDictObjectAll,
+        inputData=inputData,
+        dirname=dirname,
+        writeJson=writeJson,
+        writeStore=writeStore,
+    )
+
+
+##########################################################
+def parserFunSlowAndInSeries(
+    inputData={}, dirname="", writeJson=False, writeStore=False
+):
+    from urllib.request import urlopen
+    from bs4 import BeautifulSoup
+
+    cache = getHttpCache(inputData=inputData, dirname=dirname)
+    metrics = getPipelineMetrics()
     dfDict = {}
     for varTime in range(0, len(inputData["idealDates"])):
         url = (
-            "https://www.ncei.noaa.gov/pub/data/uscrn/products/hourly02/"
+            getNceiBaseUrl(inputData=inputData)
             + str(inputData["idealDates"][varTime])
             + "/"
         )
-        html = urlopen(url).read()
+        with metrics.stage("listingFetch"):
+            html = (
+                cache.fetchSync(url=url) if cache is not None else urlopen(url).read()
+            )
+        if html is None:
+            # Offline cache miss or failed fetch, stacking without this year would drop every station
+            raise RuntimeError(
+                f"Could not fetch the station listing of {inputData['idealDates'][varTime]}: {url}"
+            )
         soup = BeautifulSoup(html, features="html.parser")
         text = soup.get_text()
         lines = (line.strip() for line in text.splitlines())
@@ -305,7 +669,7 @@ def parserFunSlowAndInSeries(inputData={}, dirname="", writeJson=False):
         text = [x for x in text if x]  # Delete '' from list after parsing
         textL = []
         for s in text:
-            if s.find("CRNH") != -1:
+            if s.find("CRN") != -1:
                 textL.append(s + ".txt")
         dfDict[str(inputData["idealDates"][varTime])] = textL
     #######################################################
@@ -317,115 +681,125 @@ def parserFunSlowAndInSeries(inputData={}, dirname="", writeJson=False):
         for j in range(0, len(dfDict[thisYear])):
             stationAtThisYear = dfDict[thisYear][j]
             url = (
-                "https://www.ncei.noaa.gov/pub/data/uscrn/products/hourly02/"
-                + thisYear
-                + "/"
-                + stationAtThisYear
+                getNceiBaseUrl(inputData=inputData) + thisYear + "/" + stationAtThisYear
             )
-            html = urlopen(url).read()
-            soup = BeautifulSoup(html, features="html.parser")
-            text = soup.get_text()
-            valSplit = text.split("\n")
-            val = [x for x in valSplit if x]
-            textLineList = []
-            for k in range(0, len(val)):
-                textLine = val[k].split(" ")
-                textLine = [x for x in textLine if x]
-                textLineList.append(textLine)
-            textLineArray = np.array(textLineList).flatten().reshape(-1, 38)
-            stationLabel = stationAtThisYear.replace(".txt", "").replace(
-                "CRNH0203-" + str(inputData["idealDates"][varTime]) + "-", ""
-            )
-            if len(stationLabel) > 31:
-                stationLabel = stationLabel[:31]
+            with metrics.stage("stationFetch"):
+                try:
+                    if cache is not None:
+                        rawBytes = cache.fetchSync(url=url)
+                    else:
+                        rawBytes = urlopen(url).read()
+                except Exception as e:
+                    print(f"Exception fetching {url}: {e}")
+                    rawBytes = None
+            if rawBytes is None:
+                # Skipped like in the async path, the station is dropped when the years are stacked
+                print(
+                    f"Failed to process station {stationAtThisYear} in year {thisYear}"
+                )
+                metrics.incrementCounter("stationsFailed")
+                continue
+            metrics.incrementCounter("bytesFetched", len(rawBytes))
+            stationLabel = getStationLabel(stationFile=stationAtThisYear, year=thisYear)
             print(j, stationLabel)
-            weatherDataColumns = [
-                "WBANNO",
-                "UTC_DATE",
-                "UTC_TIME",
-                "LST_DATE",
-                "LST_TIME",
-                "CRX_VN",
-                "LONGITUDE",
-                "LATITUDE",
-                "T_CALC",
-                "T_HR_AVG",
-                "T_MAX",
-                "T_MIN",
-                "P_CALC",
-                "SOLARAD",
-                "SOLARAD_FLAG",
-                "SOLARAD_MAX",
-                "SOLARAD_MAX_FLAG",
-                "SOLARAD_MIN",
-                "SOLARAD_MIN_FLAG",
-                "SUR_TEMP_TYPE",
-                "SUR_TEMP",
-                "SUR_TEMP_FLAG",
-                "SUR_TEMP_MAX",
-                "SUR_TEMP_MAX_FLAG",
-                "SUR_TEMP_MIN",
-                "SUR_TEMP_MIN_FLAG",
-                "RH_HR_AVG",
-                "RH_HR_AVG_FLAG",
-                "SOIL_MOISTURE_5",
-                "SOIL_MOISTURE_10",
-                "SOIL_MOISTURE_20",
-                "SOIL_MOISTURE_50",
-                "SOIL_MOISTURE_100",
-                "SOIL_TEMP_5",
-                "SOIL_TEMP_10",
-                "SOIL_TEMP_20",
-                "SOIL_TEMP_50",
-                "SOIL_TEMP_100",
-            ]
-            dataFrameTemp = pd.DataFrame(textLineArray, columns=weatherDataColumns)
-            dictNew = {}
-            for col in dataFrameTemp.columns:
-                dictNew[col] = dataFrameTemp.loc[:, col].values.tolist()
-            dictStations[stationLabel] = dictNew
+            with metrics.stage("parse"):
+                dictStations[stationLabel] = parseStationBytes(
+                    rawBytes=rawBytes, product=inputData.get("product", "hourly02")
+                )
+            metrics.incrementCounter("stationsParsed")
+            metrics.incrementCounter(
+                "rowsParsed", len(dictStations[stationLabel]["UTC_DATE"])
+            )
         dictAllData[thisYear] = dictStations
-    # Make sure all yearly stations are the same
-    weatherDataDictObjectAll = updateAndCleanUpDictionaryWithStats(
-        weatherDataDictObjectAll=dictAllData
+    return stackCleanAndWrite(
+        dictAllData=dictAllData,
+        inputData=inputData,
+        dirname=dirname,
+        writeJson=writeJson,
+        writeStore=writeStore,
     )
-    # Clean up dictionary format and vertically stack all years into one array per weather station
-    weatherDataDictObjectAll = verticallyStackObjectsInDict(dictAllData=dictAllData)
-    # Clean the data
-    weatherDataDictObjectAll, dfStations = cleanData(
-        weatherDataDictObjectAll=weatherDataDictObjectAll, dirname=dirname
-    )
-    # Save to JSON if dirname provided
-    if writeJson == True:
-        writeToJson(
-            data=weatherDataDictObjectAll,
-            outFileName=dirname + "/Data/weatherDataJSONObject.json",
-        )
-    print("Successfully generated dictionary of all weather stations")
-    return weatherDataDictObjectAll, dfStations
 
 
 ##########################################################
 async def getCleanedDataStructure(inputData={}, dirname=""):
     ######################################################
-    if inputData["parseDataBool"] == 0:
-        fileName = ["weatherDataJSONObject2018.json", "weatherDataJSONObject.json"][1]
-        with open(dirname + "/Data/" + fileName, "r") as f:
-            weatherDataDictObjectAll = json.load(f)
+    metrics = configurePipelineMetrics(inputData=inputData)
+    if inputData["parseDataBool"] == 2:
+        # Imported here since incrementalIngest builds on the fetch helpers of this module
+        from utils.incrementalIngest import updateStoreIncrementally
+
+        await updateStoreIncrementally(inputData=inputData, dirname=dirname)
+    if inputData["parseDataBool"] in [0, 2]:
+        storeDir = dirname + "/Data/weatherDataStore"
+        if not columnarStoreExists(storeDir=storeDir):
+            # One time migration of the legacy json object into the memory-mapped store,
+            # read one station at a time
+            fileName = "weatherDataJSONObject.json"
+            writeColumnarStore(
+                data=iterJsonStations(fileName=dirname + "/Data/" + fileName),
+                storeDir=storeDir,
+            )
+        # Only the manifest is read here, columns are paged in lazily when touched
+        weatherDataDictObjectAll = openColumnarStore(storeDir=storeDir)
         dfStations = pd.read_csv(dirname + "/Data/Weather Stations Info.csv")
     else:
         if (
             inputData["booleanRunSeriesVsParallel"] == 1
         ):  # parserFunSlowAndInSeries took apx 700 seconds to complete
             weatherDataDictObjectAll, dfStations = parserFunSlowAndInSeries(
-                inputData=inputData, dirname=dirname, writeJson=True
+                inputData=inputData, dirname=dirname, writeJson=True, writeStore=True
+            )
+        elif inputData.get("streamIngest", 0) == 1:
+            # Imported here since streamingIngest builds on the fetch helpers of this module
+            from utils.streamingIngest import streamIngestToStore
+
+            # Files parsed in chunks and appended straight to the store, nothing is stacked in memory
+            weatherDataDictObjectAll, dfStations = await streamIngestToStore(
+                inputData=inputData,
+                dirname=dirname,
+                storeDir=dirname + "/Data/weatherDataStore",
+            )
+        elif inputData.get("ingestShards", 0) > 1:
+            # Imported here since shardedIngest builds on the fetch helpers of this module
+            from utils.shardedIngest import runShardedIngest
+
+            # Shards (years or station-hash buckets) in their own processes, merged deterministically
+            weatherDataDictObjectAll, dfStations = runShardedIngest(
+                inputData=inputData,
+                dirname=dirname,
+                shardDir=dirname + "/Data/ingestShards",
+                numShards=inputData["ingestShards"],
+                mode=inputData.get("shardMode", "hash"),
+                writeJson=True,
+                writeStore=True,
             )
         elif (
             inputData["booleanRunSeriesVsParallel"] == 0
         ):  # parserFunParallelized    took apx 500 seconds to complete
             weatherDataDictObjectAll, dfStations = await parserFunParallelized(
-                inputData=inputData, dirname=dirname, writeJson=True
+                inputData=inputData, dirname=dirname, writeJson=True, writeStore=True
             )
+    rollupDir = getRollupDir(dirname=dirname)
+    if inputData.get("buildRollups", 0) == 1 and (
+        inputData["parseDataBool"] == 1 or not rollupsExist(rollupDir=rollupDir)
+    ):
+        # Daily/monthly/yearly aggregates next to the store (parseDataBool = 2 updates them in place),
+        # a streamed store is reduced station by station so the rollups keep its bounded memory
+        with metrics.stage("rollup"):
+            buildRollups(
+                weatherDataDictObjectAll=weatherDataDictObjectAll,
+                rollupDir=rollupDir,
+                byStation=inputData.get("streamIngest", 0) == 1,
+            )
+    if (
+        inputData.get("useStationTable", 0) == 1
+        and inputData.get("streamIngest", 0) == 0
+    ):
+        # Compact per-column dtypes in shared buffers, same dict-style access for callers
+        # (a streamed store stays memory-mapped, loading it into buffers would undo the bounded memory)
+        weatherDataDictObjectAll = StationTable.fromStationDict(
+            weatherDataDictObjectAll=weatherDataDictObjectAll
+        )
     ######################################################
     return weatherDataDictObjectAll, dfStations
 
@@ -0,0 +1,270 @@
+##########################################################
+import warnings
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from utils.stationFileParser import HOURLY02_MEASUREMENT_COLUMNS
+from utils.metrics import getPipelineMetrics
+
+# Quantiles reported per station and network wide
+SUMMARY_QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+# Per-station quantile sketch resolution used to approximate the network wide quantiles
+SKETCH_POINTS = np.linspace(0, 1, 201)
+# Same-sensor variants left out when ranking features for a target (e.g. T_MAX for T_HR_AVG)
+DERIVED_FEATURES = {
+    "T_HR_AVG": ["T_CALC", "T_MAX", "T_MIN"],
+    "T_CALC": ["T_HR_AVG", "T_MAX", "T_MIN"],
+    "SOLARAD": ["SOLARAD_MAX", "SOLARAD_MIN"],
+    "SUR_TEMP": ["SUR_TEMP_MAX", "SUR_TEMP_MIN"],
+}
+
+
+##########################################################
+def computeChunkComoments(values=[]):
+    """
+    *** NaN-aware (pairwise complete) moments of one chunk of rows x variables
+    *** Entry [i, j] of every matrix only uses rows where both variable i and j are valid:
+    ***   n = row count, mean = mean of variable i, m2 = sum of squared deviations of i,
+    ***   c = co-moment of i and j. The diagonal holds the plain per-variable count/mean/m2
+    """
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    # Shift by the chunk mean first, the sums below are then small and numerically safe
+    with warnings.catch_warnings():
+        warnings.simplefilter(
+            "ignore", RuntimeWarning
+        )  # all-NaN columns get a zero shift
+        shift = np.nan_to_num(np.nanmean(values, axis=0))
+    centered = np.where(valid, values - shift, 0.0)
+    validFloat = valid.astype(np.float64)
+    n = validFloat.T @ validFloat
+    sums = centered.T @ validFloat
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(n > 0, sums / n, 0.0)
+        m2 = np.where(n > 0, (centered**2).T @ validFloat - sums * mean, 0.0)
+        c = np.where(n > 0, centered.T @ centered - sums * mean.T, 0.0)
+    return {"n": n, "mean": mean + shift[:, None], "m2": m2, "c": c}
+
+
+##########################################################
+def mergeComoments(a=None, b=None):
+    """
+    *** Combine two partial results (Chan et al. parallel form of Welford's update), order independent
+    """
+    if a is None:
+        return b
+    if b is None:
+        return a
+    n = a["n"] + b["n"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        weight = np.where(n > 0, a["n"] * b["n"] / n, 0.0)
+        mean = np.where(n > 0, (a["n"] * a["mean"] + b["n"] * b["mean"]) / n, 0.0)
+    delta = b["mean"] - a["mean"]
+    return {
+        "n": n,
+        "mean": mean,
+        "m2": a["m2"] + b["m2"] + delta**2 * weight,
+        "c": a["c"] + b["c"] + delta * delta.T * weight,
+    }
+
+
+##########################################################
+def getMomentSummary(comoments={}, variables=[]):
+    """
+    *** Count, mean, variance and standard deviation per variable from the diagonal of the co-moments
+    """
+    count = np.diag(comoments["n"])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        variance = np.where(count > 1, np.diag(comoments["m2"]) / (count - 1), np.nan)
+    mean = np.where(count > 0, np.diag(comoments["mean"]), np.nan)
+    return pd.DataFrame(
+        {
+            "count": count.astype(np.int64),
+            "mean": mean,
+            "variance": variance,
+            "std": np.sqrt(variance),
+        },
+        index=pd.Index(variables, name="variable"),
+    )
+
+
+##########################################################
+def getCorrelationMatrix(comoments={}, variables=[], minPairs=30):
+    """
+    *** Pairwise complete Pearson correlation (NaN where fewer than minPairs rows overlap)
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        correlation = comoments["c"] / np.sqrt(comoments["m2"] * comoments["m2"].T)
+    correlation[(comoments["n"] < minPairs) | ~np.isfinite(correlation)] = np.nan
+    return pd.DataFrame(correlation, index=variables, columns=variables)
+
+
+##########################################################
+def analyzeStation(stationColumns={}, variables=[], chunkRows=8784):
+    """
+    *** One pass over one station in chunks of chunkRows: mergeable co-moments, min/max and quantile sketch
+    """
+    values = np.column_stack(
+        [
+            np.asarray(stationColumns[variable], dtype=np.float64)
+            for variable in variables
+        ]
+    )
+    comoments = None
+    for start in range(0, len(values), chunkRows):
+        comoments = mergeComoments(
+            a=comoments,
+            b=computeChunkComoments(values=values[start : start + chunkRows]),
+        )
+    if comoments is None:
+        comoments = computeChunkComoments(values=values)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN columns stay NaN
+        sketch = np.nanquantile(values, SKETCH_POINTS, axis=0)
+        minimum = np.nanmin(values, axis=0)
+        maximum = np.nanmax(values, axis=0)
+    return {
+        "comoments": comoments,
+        "min": minimum,
+        "max": maximum,
+        "sketch": sketch,
+    }
+
+
+##########################################################
+def analyzeStationWorker(args=()):
+    stationColumns, variables, chunkRows = args
+    return analyzeStation(
+        stationColumns=stationColumns, variables=variables, chunkRows=chunkRows
+    )
+
+
+##########################################################
+def getNetworkQuantiles(stationResults=[], quantiles=SUMMARY_QUANTILES):
+    """
+    *** Network wide quantiles approximated from the per-station quantile sketches weighted by count
+    """
+    networkQuantiles = []
+    for i in range(len(stationResults[0]["min"])):
+        points = np.concatenate([result["sketch"][:, i] for result in stationResults])
+        weights = np.concatenate(
+            [
+                np.full(len(SKETCH_POINTS), result["comoments"]["n"][i, i])
+                for result in stationResults
+            ]
+        )
+        keep = ~np.isnan(points) & (weights > 0)
+        if not keep.any():
+            networkQuantiles.append(np.full(len(quantiles), np.nan))
+            continue
+        order = np.argsort(points[keep])
+        sortedPoints = points[keep][order]
+        cumulative = np.cumsum(weights[keep][order])
+        cumulative = (cumulative - 0.5 * weights[keep][order]) / cumulative[-1]
+        networkQuantiles.append(np.interp(quantiles, cumulative, sortedPoints))
+    return np.array(networkQuantiles)
+
+
+##########################################################
+def getFeatureImportance(correlation=None, target="T_HR_AVG", exclude=None):
+    """
+    *** Rank features for a target by |correlation| and by standardized regression coefficients
+    *** solved from the correlation matrix (R_xx beta = r_xy), so no design matrix is ever built
+    """
+    if exclude is None:
+        exclude = DERIVED_FEATURES.get(target, [])
+    targetCorrelation = correlation[target].drop([target] + exclude, errors="ignore")
+    features = [
+        feature
+        for feature in targetCorrelation.dropna().index
+        if correlation.loc[feature, targetCorrelation.dropna().index].notna().all()
+    ]
+    rXX = correlation.loc[features, features].values
+    rXY = targetCorrelation[features].values
+    beta = np.linalg.lstsq(rXX, rXY, rcond=None)[0] if features else np.array([])
+    dfImportance = pd.DataFrame(
+        {
+            "correlation": rXY,
+            "standardizedCoefficient": beta,
+            "importance": np.abs(beta) / max(np.abs(beta).sum(), 1e-12),
+        },
+        index=pd.Index(features, name="feature"),
+    )
+    return dfImportance.sort_values("importance", ascending=False)
+
+
+##########################################################
+def analyzeFeatures(weatherDataDictObjectAll={}, inputData={}, variables=None):
+    """
+    *** Per-station and network wide means/variances/quantiles, NaN-aware correlations and feature importance
+    *** Stations are analyzed independently (in a process pool when inputData["analysisWorkers"] > 0)
+    *** and their partial results merged, so no dataset wide DataFrame is built
+    """
+    stations = list(weatherDataDictObjectAll.keys())
+    if variables is None:
+        firstStation = weatherDataDictObjectAll[stations[0]]
+        variables = [v for v in HOURLY02_MEASUREMENT_COLUMNS if v in firstStation]
+    chunkRows = inputData.get("analysisChunkRows", 8784)
+    jobs = (
+        (
+            {v: np.asarray(weatherDataDictObjectAll[station][v]) for v in variables},
+            variables,
+            chunkRows,
+        )
+        for station in stations
+    )
+    with getPipelineMetrics().stage("featureAnalysis"):
+        numWorkers = inputData.get("analysisWorkers", 0)
+        if numWorkers > 0:
+            with ProcessPoolExecutor(max_workers=numWorkers) as executor:
+                stationResults = list(executor.map(analyzeStationWorker, jobs))
+        else:
+            stationResults = [analyzeStationWorker(args=job) for job in jobs]
+    ######################################################
+    stationFrames = []
+    networkComoments = None
+    for station, result in zip(stations, stationResults):
+        dfStation = getMomentSummary(comoments=result["comoments"], variables=variables)
+        dfStation["min"] = result["min"]
+        dfStation["max"] = result["max"]
+        for q in SUMMARY_QUANTILES:
+            dfStation[f"q{int(q * 100):02d}"] = [
+                np.interp(q, SKETCH_POINTS, result["sketch"][:, i])
+                for i in range(len(variables))
+            ]
+        dfStation.insert(0, "station", station)
+        stationFrames.append(dfStation.reset_index())
+        networkComoments = mergeComoments(a=networkComoments, b=result["comoments"])
+    ######################################################
+    dfNetwork = getMomentSummary(comoments=networkComoments, variables=variables)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        dfNetwork["min"] = np.nanmin([r["min"] for r in stationResults], axis=0)
+        dfNetwork["max"] = np.nanmax([r["max"] for r in stationResults], axis=0)
+    networkQuantiles = getNetworkQuantiles(stationResults=stationResults)
+    for j, q in enumerate(SUMMARY_QUANTILES):
+        dfNetwork[f"q{int(q * 100):02d}"] = networkQuantiles[:, j]
+    dfCorrelation = getCorrelationMatrix(
+        comoments=networkComoments, variables=variables
+    )
+    target = inputData.get("analysisTarget", "T_HR_AVG")
+    dfImportance = getFeatureImportance(correlation=dfCorrelation, target=target)
+    return {
+        "stationSummary": pd.concat(stationFrames, ignore_index=True),
+        "networkSummary": dfNetwork,
+        "correlation": dfCorrelation,
+        "featureImportance": dfImportance,
+    }
+
+
+##########################################################
+def writeFeatureAnalysis(analysis={}, dirname=""):
+    analysis["stationSummary"].to_csv(
+        dirname + "/Data/Station Feature Summary.csv", index=False
+    )
+    analysis["networkSummary"].to_csv(dirname + "/Data/Network Feature Summary.csv")
+    analysis["correlation"].to_csv(dirname + "/Data/Feature Correlation.csv")
+    analysis["featureImportance"].to_csv(dirname + "/Data/Feature Importance.csv")
+
+
+##########################################################
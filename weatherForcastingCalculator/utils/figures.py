@@ -0,0 +1,184 @@
+##########################################################
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from concurrent.futures import Future, ProcessPoolExecutor
+from utils.metrics import PipelineMetrics, getPipelineMetrics
+
+FIGURE_CACHE_FILE_NAME = "figureCache.json"
+
+
+##########################################################
+def generatePlotOfContinentalUS(dfStations=[], dirname=""):
+    import matplotlib.pyplot as plt
+
+    ######################################################
+    plt.figure(figsize=(14, 8))
+    cm = plt.cm.get_cmap("terrain")
+    sc = plt.scatter(
+        np.float64(dfStations["Longitude"].values.flatten()),
+        np.float64(dfStations["Latitude"].values.flatten()),
+        c=np.float64(dfStations["Elevation"].values.flatten()),
+        cmap=cm,
+        s=50,
+        alpha=0.8,
+        edgecolors="black",
+        linewidth=0.3,
+    )
+    ######################################################
+    cbar = plt.colorbar(sc, label="Elevation (ft)", shrink=0.8, aspect=30)
+    cbar.ax.tick_params(labelsize=10)
+    ######################################################
+    xticks = np.round(np.linspace(-130, -60, 20), 3).tolist()
+    yticks = np.round(np.linspace(20, 60, 20), 3).tolist()
+    plt.xlim([min(xticks), max(xticks)])  # Longitude
+    plt.ylim([min(yticks), max(yticks)])  # Latitude
+    plt.xticks(xticks, rotation=45)
+    plt.yticks(yticks, rotation=45)
+    plt.xlabel("Longitude (°W)", fontsize=12, fontweight="bold")
+    plt.ylabel("Latitude (°N)", fontsize=12, fontweight="bold")
+    plt.title(
+        "Weather Stations across Continental US\n(Colored by Elevation)",
+        fontsize=14,
+        fontweight="bold",
+        pad=20,
+    )
+    plt.grid(True, alpha=0.3, linestyle="--")
+    plt.tight_layout()
+    plt.savefig(
+        dirname + "/Figures/Weather Stations Map.png", dpi=300, bbox_inches="tight"
+    )
+    plt.close()
+    ######################################################
+
+
+##########################################################
+# Figure file under Figures/ -> function drawing it from the station table
+STATION_FIGURES = {"Weather Stations Map.png": generatePlotOfContinentalUS}
+
+
+##########################################################
+def getStationsSignature(dfStations=None):
+    """
+    *** Content hash of the station table, a figure is only redrawn when its inputs change
+    """
+    digest = hashlib.sha1()
+    digest.update(",".join(map(str, dfStations.columns)).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(dfStations, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+##########################################################
+def loadFigureCache(cachePath=""):
+    if not os.path.exists(cachePath):
+        return {}
+    with open(cachePath, "r") as f:
+        return json.load(f)
+
+
+def saveFigureCache(cachePath="", figureCache={}):
+    with open(cachePath + ".tmp", "w") as f:
+        json.dump(figureCache, f, indent=1, sort_keys=True)
+    os.replace(cachePath + ".tmp", cachePath)
+
+
+##########################################################
+def getStaleFigures(dfStations=None, dirname="", force=False):
+    """
+    *** Station figures that are missing or were drawn from a different station table
+    """
+    figureCache = loadFigureCache(cachePath=dirname + "/Data/" + FIGURE_CACHE_FILE_NAME)
+    signature = getStationsSignature(dfStations=dfStations)
+    return [
+        fileName
+        for fileName in STATION_FIGURES
+        if force
+        or figureCache.get(fileName) != signature
+        or not os.path.exists(dirname + "/Figures/" + fileName)
+    ]
+
+
+##########################################################
+def generateFigures(dfStations=None, dirname="", force=False, metrics=None):
+    """
+    *** Draw the station figures whose inputs changed since they were last written
+    *** Signatures are kept in Data/figureCache.json; returns the figure files that were (re)drawn
+    *** Drawing time goes to the "plot" stage of metrics (default: the run's pipeline metrics)
+    """
+    metrics = getPipelineMetrics() if metrics is None else metrics
+    cachePath = dirname + "/Data/" + FIGURE_CACHE_FILE_NAME
+    figureCache = loadFigureCache(cachePath=cachePath)
+    signature = getStationsSignature(dfStations=dfStations)
+    drawn = []
+    staleFigures = getStaleFigures(dfStations=dfStations, dirname=dirname, force=force)
+    for fileName, plotFunction in STATION_FIGURES.items():
+        if fileName not in staleFigures:
+            continue
+        with metrics.stage("plot"):
+            plotFunction(dfStations=dfStations, dirname=dirname)
+        figureCache[fileName] = signature
+        drawn.append(fileName)
+    if drawn:
+        saveFigureCache(cachePath=cachePath, figureCache=figureCache)
+    return drawn
+
+
+def generateFiguresWorker(args=()):
+    # Off-screen backend, the worker process has no display
+    import matplotlib
+
+    matplotlib.use("Agg")
+    dfStations, dirname, force = args
+    # The run's metrics live in the parent, the stage timers are sent back with the result
+    metrics = PipelineMetrics()
+    drawn = generateFigures(
+        dfStations=dfStations, dirname=dirname, force=force, metrics=metrics
+    )
+    return drawn, metrics.timers
+
+
+def mergeWorkerResult(workerFuture=None, future=None):
+    if workerFuture.exception() is not None:
+        future.set_exception(workerFuture.exception())
+        return
+    drawn, timers = workerFuture.result()
+    getPipelineMetrics().mergeTimers(timers=timers)
+    future.set_result(drawn)
+
+
+##########################################################
+def startFigureGeneration(dfStations=None, dirname="", inputData={}):
+    """
+    *** Figures as a separate step off the data path, returns a Future of the drawn file names
+    *** plotsInBackground = 1 draws in one worker process while the caller goes on with the data
+    """
+    force = inputData.get("forcePlots", 0) == 1
+    if not getStaleFigures(dfStations=dfStations, dirname=dirname, force=force):
+        # Nothing to draw, no worker process is started (and matplotlib is never imported)
+        future = Future()
+        future.set_result([])
+        return future
+    if inputData.get("plotsInBackground", 0) == 1:
+        executor = ProcessPoolExecutor(max_workers=1)
+        workerFuture = executor.submit(
+            generateFiguresWorker, (dfStations, dirname, force)
+        )
+        # Returns right away, the submitted job still runs to completion
+        executor.shutdown(wait=False)
+        future = Future()
+        workerFuture.add_done_callback(
+            lambda workerFuture: mergeWorkerResult(
+                workerFuture=workerFuture, future=future
+            )
+        )
+        return future
+    future = Future()
+    future.set_result(
+        generateFigures(dfStations=dfStations, dirname=dirname, force=force)
+    )
+    return future
+
+
+##########################################################
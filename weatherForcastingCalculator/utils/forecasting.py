@@ -0,0 +1,370 @@
+##########################################################
+import time
+import numpy as np
+import pandas as pd
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from numpy.lib.stride_tricks import sliding_window_view
+from utils.timeIndex import alignStationsOnHours, getHourRange, getUtcHours
+from utils.metrics import getPipelineMetrics
+
+DEFAULT_FORECAST_SETTINGS = {
+    "forecastVariable": "T_HR_AVG",
+    "forecastHorizons": [1, 3, 6, 12, 24],
+    "forecastLags": 24,
+    "forecastRollingWindows": [24, 168],
+    "forecastRidge": 1.0,
+    "forecastFolds": 4,
+    "forecastFoldHours": 168,
+    "forecastChunkRows": 8784,
+}
+
+
+##########################################################
+def getForecastSettings(inputData={}):
+    return {
+        key: inputData.get(key, value)
+        for key, value in DEFAULT_FORECAST_SETTINGS.items()
+    }
+
+
+##########################################################
+def getStationHourlySeries(stationData={}, variable=""):
+    """
+    *** One station's variable on a contiguous hourly axis (gaps are NaN), returns (hours, series)
+    """
+    utcHours = getUtcHours(stationData=stationData)
+    hours = getHourRange(start=utcHours.min(), end=utcHours.max())
+    series = alignStationsOnHours(
+        weatherDataDictObjectAll={"station": stationData},
+        stations=["station"],
+        variable=variable,
+        hours=hours,
+    )[:, 0]
+    return hours, series
+
+
+##########################################################
+def getRollingMeans(series=[], window=24):
+    """
+    *** NaN-aware trailing mean over window hours ending at each hour, O(n) from cumulative sums
+    """
+    valid = ~np.isnan(series)
+    sums = np.concatenate([[0.0], np.cumsum(np.where(valid, series, 0.0))])
+    counts = np.concatenate([[0], np.cumsum(valid)])
+    rollingMeans = np.full(len(series), np.nan)
+    if len(series) >= window:
+        windowCounts = counts[window:] - counts[:-window]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rollingMeans[window - 1 :] = np.where(
+                windowCounts > 0,
+                (sums[window:] - sums[:-window]) / windowCounts,
+                np.nan,
+            )
+    return rollingMeans
+
+
+##########################################################
+class LagFeatures:
+    """
+    *** Feature rows for hour t: [1, series[t - numLags + 1 .. t], rolling means at t, sin/cos hour of day]
+    *** Targets for hour t: series[t + h] for every horizon h (direct multi-horizon forecasting)
+    *** The lag block is a sliding_window_view of the series, so lags are never copied up front;
+    *** rows are only materialized chunk by chunk when the normal equations are accumulated
+    """
+
+    def __init__(self, series=[], startHour=None, settings={}):
+        self.series = np.asarray(series, dtype=np.float64)
+        self.numLags = settings["forecastLags"]
+        self.horizons = list(settings["forecastHorizons"])
+        self.lagWindows = sliding_window_view(self.series, self.numLags)
+        self.rollingMeans = [
+            getRollingMeans(series=self.series, window=window)
+            for window in settings["forecastRollingWindows"]
+        ]
+        hourOfDay = (startHour.astype(np.int64) + np.arange(len(self.series))) % 24
+        self.hourSin = np.sin(2 * np.pi * hourOfDay / 24)
+        self.hourCos = np.cos(2 * np.pi * hourOfDay / 24)
+        # First hour with a full lag window and all rolling windows, last hour with every target
+        self.firstRow = (
+            max([self.numLags] + list(settings["forecastRollingWindows"])) - 1
+        )
+        self.lastRow = len(self.series) - max(self.horizons)
+
+    @property
+    def numFeatures(self):
+        return 1 + self.numLags + len(self.rollingMeans) + 2
+
+    ######################################################
+    def getRows(self, start=0, stop=0):
+        """
+        *** Feature matrix of hours [start, stop)
+        """
+        return np.column_stack(
+            [
+                np.ones(stop - start),
+                self.lagWindows[start - self.numLags + 1 : stop - self.numLags + 1],
+            ]
+            + [rollingMean[start:stop] for rollingMean in self.rollingMeans]
+            + [self.hourSin[start:stop], self.hourCos[start:stop]]
+        )
+
+    def getTargets(self, start=0, stop=0):
+        return np.column_stack(
+            [self.series[start + h : stop + h] for h in self.horizons]
+        )
+
+
+##########################################################
+def accumulateNormalEquations(features=None, start=0, stop=0, chunkRows=8784):
+    """
+    *** X'X, X'Y and row count over the fully observed rows of hours [start, stop), in row chunks
+    """
+    numFeatures = features.numFeatures
+    xtx = np.zeros((numFeatures, numFeatures))
+    xty = np.zeros((numFeatures, len(features.horizons)))
+    numRows = 0
+    for chunkStart in range(start, stop, chunkRows):
+        chunkStop = min(chunkStart + chunkRows, stop)
+        x = features.getRows(start=chunkStart, stop=chunkStop)
+        y = features.getTargets(start=chunkStart, stop=chunkStop)
+        valid = np.isfinite(x).all(axis=1) & np.isfinite(y).all(axis=1)
+        xtx += x[valid].T @ x[valid]
+        xty += x[valid].T @ y[valid]
+        numRows += int(valid.sum())
+    return xtx, xty, numRows
+
+
+##########################################################
+def solveRidge(xtx=None, xty=None, ridge=1.0):
+    """
+    *** Ridge coefficients (features x horizons) for all horizons in one solve, intercept not penalized
+    """
+    penalty = ridge * np.eye(len(xtx))
+    penalty[0, 0] = 0.0
+    return np.linalg.lstsq(xtx + penalty, xty, rcond=None)[0]
+
+
+##########################################################
+def forecastStation(series=[], startHour=None, settings={}):
+    """
+    *** Rolling-origin backtest (expanding window) plus a final fit and forecast for one station
+    """
+    features = LagFeatures(series=series, startHour=startHour, settings=settings)
+    horizons = features.horizons
+    maxHorizon = max(horizons)
+    foldHours = settings["forecastFoldHours"]
+    numFolds = settings["forecastFolds"]
+    chunkRows = settings["forecastChunkRows"]
+    origins = [features.lastRow - (numFolds - k) * foldHours for k in range(numFolds)]
+    origins = [origin for origin in origins if origin - maxHorizon > features.firstRow]
+    if not origins:
+        return {"status": "insufficient data", "backtest": [], "forecast": []}
+    ######################################################
+    # Training rows of fold k end maxHorizon hours before its origin (no target leaks into the test hours)
+    # Normal equations are accumulated block by block between consecutive training ends
+    backtest = []
+    xtx = np.zeros((features.numFeatures, features.numFeatures))
+    xty = np.zeros((features.numFeatures, len(horizons)))
+    trainEnd = features.firstRow
+    for origin in origins:
+        blockXtx, blockXty, _ = accumulateNormalEquations(
+            features=features,
+            start=trainEnd,
+            stop=origin - maxHorizon,
+            chunkRows=chunkRows,
+        )
+        xtx, xty = xtx + blockXtx, xty + blockXty
+        trainEnd = origin - maxHorizon
+        beta = solveRidge(xtx=xtx, xty=xty, ridge=settings["forecastRidge"])
+        testStop = min(origin + foldHours, features.lastRow)
+        x = features.getRows(start=origin, stop=testStop)
+        y = features.getTargets(start=origin, stop=testStop)
+        persistence = features.series[origin:testStop]
+        prediction = x @ beta
+        for k, horizon in enumerate(horizons):
+            valid = np.isfinite(prediction[:, k]) & np.isfinite(y[:, k])
+            errors = prediction[valid, k] - y[valid, k]
+            persistenceValid = valid & np.isfinite(persistence)
+            backtest.append(
+                {
+                    "origin": origin,
+                    "horizon": horizon,
+                    "numPoints": int(valid.sum()),
+                    "absErrorSum": float(np.abs(errors).sum()),
+                    "squaredErrorSum": float((errors**2).sum()),
+                    "persistenceAbsErrorSum": float(
+                        np.abs(
+                            persistence[persistenceValid] - y[persistenceValid, k]
+                        ).sum()
+                    ),
+                    "persistencePoints": int(persistenceValid.sum()),
+                }
+            )
+    ######################################################
+    # Final model on every complete row, forecast from the latest hour with a complete feature row
+    blockXtx, blockXty, _ = accumulateNormalEquations(
+        features=features, start=trainEnd, stop=features.lastRow, chunkRows=chunkRows
+    )
+    beta = solveRidge(
+        xtx=xtx + blockXtx, xty=xty + blockXty, ridge=settings["forecastRidge"]
+    )
+    lastRows = features.getRows(
+        start=max(features.firstRow, len(series) - 168), stop=len(series)
+    )
+    complete = np.flatnonzero(np.isfinite(lastRows).all(axis=1))
+    forecast = []
+    if len(complete) > 0:
+        t = len(series) - len(lastRows) + complete[-1]
+        prediction = lastRows[complete[-1]] @ beta
+        forecast = [
+            {"horizon": h, "hourOffset": int(t + h), "value": float(p)}
+            for h, p in zip(horizons, prediction)
+        ]
+    return {"status": "ok", "backtest": backtest, "forecast": forecast}
+
+
+##########################################################
+def forecastStationWorker(args=()):
+    station, series, startHour, settings = args
+    return station, forecastStation(
+        series=series, startHour=startHour, settings=settings
+    )
+
+
+##########################################################
+def forecastAllStations(weatherDataDictObjectAll={}, inputData={}):
+    """
+    *** Fit and backtest every station (process pool of inputData["forecastWorkers"], 0 = in process)
+    *** Stations still queued when inputData["forecastTimeBudget"] seconds have passed are reported as skipped
+    *** Returns (dfBacktest per station and horizon, dfForecast, dfStatus)
+    """
+    settings = getForecastSettings(inputData=inputData)
+    timeBudget = inputData.get("forecastTimeBudget", None)
+    deadline = None if timeBudget is None else time.perf_counter() + timeBudget
+    startHours = {}
+
+    results = {}
+
+    def jobs():
+        for station in weatherDataDictObjectAll:
+            if len(weatherDataDictObjectAll[station]["UTC_DATE"]) == 0:
+                results[station] = {
+                    "status": "insufficient data",
+                    "backtest": [],
+                    "forecast": [],
+                }
+                continue
+            hours, series = getStationHourlySeries(
+                stationData=weatherDataDictObjectAll[station],
+                variable=settings["forecastVariable"],
+            )
+            startHours[station] = hours[0]
+            yield station, series, hours[0], settings
+
+    with getPipelineMetrics().stage("forecast"):
+        numWorkers = inputData.get("forecastWorkers", 0)
+        if numWorkers > 0:
+            executor = ProcessPoolExecutor(max_workers=numWorkers)
+            pendingJobs = jobs()
+            futures = set()
+            budgetUsedUp = False
+            try:
+                while True:
+                    # Series are built and submitted only as workers free up, at most numWorkers in flight
+                    while len(futures) < numWorkers:
+                        job = next(pendingJobs, None)
+                        if job is None:
+                            break
+                        futures.add(executor.submit(forecastStationWorker, job))
+                    if not futures:
+                        break
+                    remaining = (
+                        None
+                        if deadline is None
+                        else max(0.0, deadline - time.perf_counter())
+                    )
+                    done, futures = wait(
+                        futures, timeout=remaining, return_when=FIRST_COMPLETED
+                    )
+                    for future in done:
+                        station, result = future.result()
+                        results[station] = result
+                    if not done:
+                        budgetUsedUp = True
+                        print(
+                            "Forecast time budget used up, remaining stations are skipped"
+                        )
+                        break
+            finally:
+                # Past the budget nothing waits for the stations still running
+                executor.shutdown(wait=not budgetUsedUp, cancel_futures=True)
+        else:
+            for job in jobs():
+                if deadline is not None and time.perf_counter() > deadline:
+                    print(
+                        "Forecast time budget used up, remaining stations are skipped"
+                    )
+                    break
+                station, result = forecastStationWorker(args=job)
+                results[station] = result
+    ######################################################
+    backtestRows = []
+    forecastRows = []
+    statusRows = []
+    for station in weatherDataDictObjectAll:
+        result = results.get(
+            station, {"status": "skipped", "backtest": [], "forecast": []}
+        )
+        statusRows.append({"station": station, "status": result["status"]})
+        backtestRows += [{"station": station, **row} for row in result["backtest"]]
+        forecastRows += [
+            {
+                "station": station,
+                "horizon": row["horizon"],
+                "forecastHour": startHours[station] + row["hourOffset"],
+                "value": row["value"],
+            }
+            for row in result["forecast"]
+        ]
+    return (
+        summarizeBacktest(backtestRows=backtestRows),
+        pd.DataFrame(
+            forecastRows, columns=["station", "horizon", "forecastHour", "value"]
+        ),
+        pd.DataFrame(statusRows, columns=["station", "status"]),
+    )
+
+
+##########################################################
+def summarizeBacktest(backtestRows=[]):
+    """
+    *** MAE/RMSE per station and horizon over all folds, with the persistence forecast MAE as reference
+    """
+    columns = [
+        "station",
+        "horizon",
+        "numPoints",
+        "mae",
+        "rmse",
+        "persistenceMae",
+        "skill",
+    ]
+    if not backtestRows:
+        return pd.DataFrame(columns=columns)
+    dfSums = (
+        pd.DataFrame(backtestRows)
+        .groupby(["station", "horizon"], sort=False)
+        .sum(numeric_only=True)
+        .reset_index()
+    )
+    numPoints = dfSums["numPoints"].replace(0, np.nan)
+    dfSums["mae"] = dfSums["absErrorSum"] / numPoints
+    dfSums["rmse"] = np.sqrt(dfSums["squaredErrorSum"] / numPoints)
+    dfSums["persistenceMae"] = dfSums["persistenceAbsErrorSum"] / dfSums[
+        "persistencePoints"
+    ].replace(0, np.nan)
+    dfSums["skill"] = 1 - dfSums["mae"] / dfSums["persistenceMae"]
+    return dfSums[columns]
+
+
+##########################################################
@@ -0,0 +1,200 @@
+##########################################################
+import os
+import json
+import hashlib
+
+
+##########################################################
+class HttpCache:
+    """
+    *** On-disk content cache for NCEI fetches, keyed by URL
+    *** Raw payloads are stored next to a small json sidecar holding the ETag/Last-Modified validators,
+    *** so revalidating an unchanged file only costs a 304 instead of the full body
+    *** In offline mode nothing goes over the network and only cached payloads are served
+    """
+
+    def __init__(self, cacheDir="", offline=False):
+        self.cacheDir = cacheDir
+        self.offline = offline
+        self.stats = {"hits": 0, "revalidated": 0, "downloaded": 0, "misses": 0}
+        os.makedirs(self.cacheDir, exist_ok=True)
+
+    ######################################################
+    def getPaths(self, url=""):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        basePath = os.path.join(self.cacheDir, key[:2], key)
+        return basePath + ".body", basePath + ".json"
+
+    ######################################################
+    def loadMeta(self, url=""):
+        bodyPath, metaPath = self.getPaths(url=url)
+        if not (os.path.exists(bodyPath) and os.path.exists(metaPath)):
+            return None
+        with open(metaPath, "r") as f:
+            return json.load(f)
+
+    def load(self, url=""):
+        meta = self.loadMeta(url=url)
+        if meta is None:
+            return None, None
+        with open(self.getPaths(url=url)[0], "rb") as f:
+            body = f.read()
+        return meta, body
+
+    ######################################################
+    def store(self, url="", body=b"", headers={}):
+        bodyPath, metaPath = self.getPaths(url=url)
+        os.makedirs(os.path.dirname(bodyPath), exist_ok=True)
+        meta = {
+            "url": url,
+            "etag": headers.get("ETag"),
+            "lastModified": headers.get("Last-Modified"),
+            "size": len(body),
+        }
+        # Write to temporary files first so an interrupted run never leaves a torn entry behind
+        # (per process names: ingest shards running side by side share the cache directory)
+        suffix = f".{os.getpid()}.tmp"
+        with open(bodyPath + suffix, "wb") as f:
+            f.write(body)
+        with open(metaPath + suffix, "w") as f:
+            json.dump(meta, f)
+        os.replace(bodyPath + suffix, bodyPath)
+        os.replace(metaPath + suffix, metaPath)
+        return meta
+
+    ######################################################
+    def getConditionalHeaders(self, meta=None):
+        headers = {}
+        if meta:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("lastModified"):
+                headers["If-Modified-Since"] = meta["lastModified"]
+        return headers
+
+    ######################################################
+    async def fetch(self, session="", url=""):
+        """
+        *** Return the payload of url as bytes, revalidating any cached copy (None on failure)
+        """
+        _, body = await self.fetchWithStatus(session=session, url=url)
+        return body
+
+    async def fetchWithStatus(self, session="", url=""):
+        """
+        *** (HTTP status, payload or None) of fetch, the status is None for an offline lookup
+        """
+        meta, body = self.load(url=url)
+        if self.offline:
+            self.stats["hits" if body is not None else "misses"] += 1
+            if body is None:
+                print("Not in offline cache:", url)
+            return None, body
+        headers = self.getConditionalHeaders(meta=meta)
+        async with session.get(url, headers=headers) as response:
+            if response.status == 304 and body is not None:
+                self.stats["revalidated"] += 1
+                return response.status, body
+            if response.status == 200:
+                body = await response.read()
+                self.store(url=url, body=body, headers=response.headers)
+                self.stats["downloaded"] += 1
+                return response.status, body
+            print("Failed to fetch:", url)
+            print("Status:", response.status)
+            return response.status, None
+
+    ######################################################
+    async def fetchToFile(self, session="", url="", blockSize=1 << 16):
+        """
+        *** Like fetch, but a downloaded body is streamed block by block into the cache and the path
+        *** of the cached payload is returned (None on failure), so a large file is never held in memory
+        """
+        _, bodyPath = await self.fetchToFileWithStatus(
+            session=session, url=url, blockSize=blockSize
+        )
+        return bodyPath
+
+    async def fetchToFileWithStatus(self, session="", url="", blockSize=1 << 16):
+        """
+        *** (HTTP status, cached payload path or None) of fetchToFile, the status is None offline
+        """
+        bodyPath, metaPath = self.getPaths(url=url)
+        meta = self.loadMeta(url=url)
+        if self.offline:
+            self.stats["hits" if meta is not None else "misses"] += 1
+            if meta is None:
+                print("Not in offline cache:", url)
+                return None, None
+            return None, bodyPath
+        headers = self.getConditionalHeaders(meta=meta)
+        async with session.get(url, headers=headers) as response:
+            if response.status == 304 and meta is not None:
+                self.stats["revalidated"] += 1
+                return response.status, bodyPath
+            if response.status == 200:
+                os.makedirs(os.path.dirname(bodyPath), exist_ok=True)
+                suffix = f".{os.getpid()}.tmp"
+                with open(bodyPath + suffix, "wb") as f:
+                    async for block in response.content.iter_chunked(blockSize):
+                        f.write(block)
+                meta = {
+                    "url": url,
+                    "etag": response.headers.get("ETag"),
+                    "lastModified": response.headers.get("Last-Modified"),
+                    "size": os.path.getsize(bodyPath + suffix),
+                }
+                with open(metaPath + suffix, "w") as f:
+                    json.dump(meta, f)
+                os.replace(bodyPath + suffix, bodyPath)
+                os.replace(metaPath + suffix, metaPath)
+                self.stats["downloaded"] += 1
+                return response.status, bodyPath
+            print("Failed to fetch:", url)
+            print("Status:", response.status)
+            return response.status, None
+
+    ######################################################
+    def fetchSync(self, url=""):
+        """
+        *** Blocking counterpart of fetch for the in-series parser
+        """
+        from urllib.error import HTTPError
+        from urllib.request import Request, urlopen
+
+        meta, body = self.load(url=url)
+        if self.offline:
+            self.stats["hits" if body is not None else "misses"] += 1
+            if body is None:
+                print("Not in offline cache:", url)
+            return body
+        request = Request(url, headers=self.getConditionalHeaders(meta=meta))
+        try:
+            with urlopen(request) as response:
+                body = response.read()
+                self.store(url=url, body=body, headers=response.headers)
+                self.stats["downloaded"] += 1
+                return body
+        except HTTPError as e:
+            if e.code == 304 and body is not None:
+                self.stats["revalidated"] += 1
+                return body
+            print("Failed to fetch:", url)
+            print("Status:", e.code)
+            return
+
+
+##########################################################
+def getHttpCache(inputData={}, dirname=""):
+    """
+    *** Build the cache under Data/ from the input flags, or None when caching is turned off
+    """
+    if inputData.get("useHttpCache", 0) == 0 and inputData.get("offlineMode", 0) == 0:
+        return None
+    return HttpCache(
+        cacheDir=os.path.join(dirname, "Data", "httpCache"),
+        offline=inputData.get("offlineMode", 0) == 1,
+    )
+
+
+##########################################################
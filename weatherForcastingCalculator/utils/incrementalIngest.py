@@ -0,0 +1,227 @@
+##########################################################
+import asyncio
+import aiohttp
+import numpy as np
+from datetime import datetime, timezone
+from utils.dataCleaning import cleanStationColumns
+from utils.dataPrepAndParser import (
+    fetchURLContent,
+    getNceiBaseUrl,
+    getRetryPolicy,
+    parseStationFileListing,
+)
+from utils.httpCache import getHttpCache
+from utils.metrics import getPipelineMetrics
+from utils.columnarStore import appendToColumnarStore, openColumnarStore
+from utils.rollups import getRollupDir, rollupsExist, updateRollups
+from utils.stationFileParser import (
+    getStationLabel,
+    getUtcTimestamps,
+    parseStationBytes,
+)
+
+
+##########################################################
+def splitCompleteLines(rawBytes=b""):
+    """
+    *** Drop a trailing partial line, the file may be mid-write on the server side
+    """
+    end = rawBytes.rfind(b"\n")
+    if end == -1:
+        return b""
+    return rawBytes[: end + 1]
+
+
+##########################################################
+def selectRowsAfter(stationData={}, lastUtc=0):
+    keep = getUtcTimestamps(stationData=stationData) > lastUtc
+    return {col: np.asarray(values)[keep] for col, values in stationData.items()}
+
+
+##########################################################
+async def fetchURLRange(session="", url="", offset=0):
+    """
+    *** Ask only for the bytes past offset (206); servers ignoring Range answer 200 with the full body
+    """
+    async with session.get(url, headers={"Range": f"bytes={offset}-"}) as response:
+        if response.status in [200, 206]:
+            return response.status, await response.read()
+        if response.status != 416:  # 416 = nothing past offset yet
+            print("Failed to fetch:", url)
+            print("Status:", response.status)
+        return response.status, b""
+
+
+##########################################################
+async def fetchNewStationRows(
+    session="",
+    url="",
+    fileState={},
+    lastUtc=0,
+    cache=None,
+    retryPolicy={},
+    product="hourly02",
+):
+    """
+    *** Fetch the part of one year file that is not in the store yet and parse it into typed columns
+    *** Returns (stationData or None, new byte offset)
+    """
+    offset = fileState.get("offset", 0)
+    if offset > 0:
+        status, body = await fetchURLRange(session=session, url=url, offset=offset)
+        if status == 206:
+            newBytes = splitCompleteLines(rawBytes=body)
+            newOffset = offset + len(newBytes)
+        elif status == 200:
+            newBytes = splitCompleteLines(rawBytes=body)
+            newOffset = len(newBytes)
+        else:
+            return None, offset
+    else:
+        # First refresh of this file: full (cache revalidated) fetch, the offset is known afterwards
+        body = await fetchURLContent(
+            session=session, url=url, asBytes=True, cache=cache, retryPolicy=retryPolicy
+        )
+        if body is None:
+            return None, offset
+        newBytes = splitCompleteLines(rawBytes=body)
+        newOffset = len(newBytes)
+    stationData = selectRowsAfter(
+        stationData=parseStationBytes(rawBytes=newBytes, product=product),
+        lastUtc=lastUtc,
+    )
+    return stationData, newOffset
+
+
+##########################################################
+async def updateStoreIncrementally(inputData={}, dirname=""):
+    """
+    *** Append only the hours that arrived since the last ingest to Data/weatherDataStore
+    *** The last UTC stamp and byte offset per station file are kept in the store manifest (ingestState)
+    *** Only year files at or after each station's last stamp are fetched, with Range requests once offsets are known
+    *** Saved rollups (Data/weatherDataRollups) are updated with the appended hours
+    """
+    storeDir = dirname + "/Data/weatherDataStore"
+    store = openColumnarStore(storeDir=storeDir)
+    manifest = store.manifest
+    ingestState = manifest.setdefault("ingestState", {})
+    # The product the store was built from, not inputData (only set up for a full ingest)
+    product = manifest.get("product", "hourly02")
+    baseUrl = getNceiBaseUrl(inputData={**inputData, "product": product})
+    currentYear = inputData.get("currentYear", datetime.now(timezone.utc).year)
+    cache = getHttpCache(inputData=inputData, dirname=dirname)
+    retryPolicy = getRetryPolicy(inputData=inputData)
+    ######################################################
+    lastUtcByStation = {}
+    for station in store:
+        stationState = ingestState.setdefault(station, {"files": {}})
+        if "lastUtc" not in stationState:
+            if len(store[station]["UTC_DATE"]) == 0:
+                continue
+            lastRow = {
+                "UTC_DATE": store[station]["UTC_DATE"][-1:],
+                "UTC_TIME": store[station]["UTC_TIME"][-1:],
+            }
+            stationState["lastUtc"] = int(getUtcTimestamps(stationData=lastRow)[0])
+        lastUtcByStation[station] = stationState["lastUtc"]
+    if not lastUtcByStation:
+        print("Nothing to update, the store has no rows yet")
+        return 0
+    startYear = min(lastUtc // 10**8 for lastUtc in lastUtcByStation.values())
+    ######################################################
+    semaphore = asyncio.Semaphore(inputData.get("batchSize", 20))
+    newRowsByStation = {station: [] for station in lastUtcByStation}
+    newOffsetsByStation = {station: {} for station in lastUtcByStation}
+    failedStations = set()
+
+    async def refreshStationFile(session, station, url):
+        async with semaphore:
+            return await fetchNewStationRows(
+                session=session,
+                url=url,
+                fileState=ingestState[station]["files"].get(url, {}),
+                lastUtc=lastUtcByStation[station],
+                cache=cache,
+                retryPolicy=retryPolicy,
+                product=product,
+            )
+
+    async with aiohttp.ClientSession() as session:
+        for year in range(startYear, currentYear + 1):
+            with getPipelineMetrics().stage("listingFetch"):
+                htmlContent = await fetchURLContent(
+                    session=session,
+                    url=f"{baseUrl}{year}/",
+                    cache=cache,
+                    retryPolicy=retryPolicy,
+                )
+            if htmlContent is None:
+                continue
+            labelToFile = {
+                getStationLabel(stationFile=stationFile, year=year): stationFile
+                for stationFile in parseStationFileListing(htmlContent=htmlContent)
+            }
+            stationUrls = [
+                (station, f"{baseUrl}{year}/{labelToFile[station]}")
+                for station, lastUtc in lastUtcByStation.items()
+                if lastUtc // 10**8 <= year
+                and station in labelToFile
+                and station not in failedStations
+            ]
+            # One broken station file must not abort the refresh of all the others
+            results = await asyncio.gather(
+                *[
+                    refreshStationFile(session, station, url)
+                    for station, url in stationUrls
+                ],
+                return_exceptions=True,
+            )
+            # Years are processed in order, so rows are appended chronologically
+            for (station, url), result in zip(stationUrls, results):
+                if isinstance(result, Exception):
+                    print(
+                        f"Skipping station {station}, failed to refresh {url}: {result}"
+                    )
+                    failedStations.add(station)
+                    continue
+                stationData, newOffset = result
+                newOffsetsByStation[station][url] = newOffset
+                if stationData is not None and len(stationData["UTC_DATE"]) > 0:
+                    newRowsByStation[station].append(stationData)
+    if failedStations:
+        getPipelineMetrics().incrementCounter("stationsFailed", len(failedStations))
+    ######################################################
+    newData = {}
+    useQcFlags = inputData.get("useQcFlags", 1) == 1
+    for station, chunks in newRowsByStation.items():
+        # A failed station keeps its offsets and last stamp, the next refresh fetches the same rows again
+        if station in failedStations:
+            continue
+        for url, newOffset in newOffsetsByStation[station].items():
+            ingestState[station]["files"].setdefault(url, {})["offset"] = newOffset
+        if not chunks:
+            continue
+        stationData = {
+            col: np.concatenate([chunk[col] for chunk in chunks]) for col in chunks[0]
+        }
+        stationData = cleanStationColumns(
+            stationDict=stationData, useQcFlags=useQcFlags
+        )
+        newData[station] = {col: stationData[col] for col in store[station]}
+        ingestState[station]["lastUtc"] = int(
+            getUtcTimestamps(stationData=stationData)[-1]
+        )
+    with getPipelineMetrics().stage("write"):
+        appendToColumnarStore(storeDir=storeDir, newData=newData, manifest=manifest)
+    rollupDir = getRollupDir(dirname=dirname)
+    if newData and rollupsExist(rollupDir=rollupDir):
+        # Only the day/month/year buckets the new hours fall into change
+        with getPipelineMetrics().stage("rollup"):
+            updateRollups(rollupDir=rollupDir, newData=newData)
+    rowsAdded = sum(len(data["UTC_DATE"]) for data in newData.values())
+    getPipelineMetrics().incrementCounter("rowsAppended", rowsAdded)
+    print(f"Incremental update appended {rowsAdded} rows to {len(newData)} stations")
+    return rowsAdded
+
+
+##########################################################
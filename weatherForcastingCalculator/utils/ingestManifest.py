@@ -0,0 +1,76 @@
+##########################################################
+import os
+import json
+
+
+##########################################################
+class IngestManifest:
+    """
+    *** Persistent record of which station files of an ingest completed and which failed
+    *** With the HTTP cache holding the payloads of completed files, an interrupted or partly failed
+    *** ingest can be resumed and only the missing/failed files go over the network again
+    """
+
+    def __init__(self, manifestPath="", resume=False, saveEvery=25):
+        self.manifestPath = manifestPath
+        self.saveEvery = saveEvery
+        self.pendingUpdates = 0
+        self.entries = {"completed": {}, "failed": {}}
+        if resume and os.path.exists(manifestPath):
+            with open(manifestPath, "r") as f:
+                self.entries = json.load(f)
+
+    ######################################################
+    def isCompleted(self, url=""):
+        return url in self.entries["completed"]
+
+    def markCompleted(self, url="", year="", stationFile="", numBytes=0):
+        self.entries["failed"].pop(url, None)
+        self.entries["completed"][url] = {
+            "year": str(year),
+            "stationFile": stationFile,
+            "bytes": numBytes,
+        }
+        self.onUpdate()
+
+    def markFailed(self, url="", year="", stationFile="", error=""):
+        attempts = self.entries["failed"].get(url, {}).get("runs", 0) + 1
+        self.entries["failed"][url] = {
+            "year": str(year),
+            "stationFile": stationFile,
+            "error": str(error),
+            "runs": attempts,
+        }
+        self.onUpdate()
+
+    ######################################################
+    def onUpdate(self):
+        self.pendingUpdates += 1
+        if self.pendingUpdates >= self.saveEvery:
+            self.save()
+
+    def save(self):
+        with open(self.manifestPath + ".tmp", "w") as f:
+            json.dump(self.entries, f, indent=1)
+        os.replace(self.manifestPath + ".tmp", self.manifestPath)
+        self.pendingUpdates = 0
+
+    def summary(self):
+        return {
+            "completed": len(self.entries["completed"]),
+            "failed": len(self.entries["failed"]),
+        }
+
+
+##########################################################
+def getIngestManifest(inputData={}, dirname=""):
+    """
+    *** Manifest under Data/, continued from disk when inputData["resumeIngest"] is 1
+    """
+    return IngestManifest(
+        manifestPath=os.path.join(dirname, "Data", "ingestManifest.json"),
+        resume=inputData.get("resumeIngest", 0) == 1,
+    )
+
+
+##########################################################
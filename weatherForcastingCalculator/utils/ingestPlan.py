@@ -0,0 +1,201 @@
+##########################################################
+"""
+Ingest planning from the year listings alone: which stations are listed in every year (the only ones
+kept after stacking), which files that means downloading and roughly how many bytes
+
+    python -m utils.ingestPlan --years 2015 2016 2017 [--json plan.json]    (dry run, nothing else is fetched)
+"""
+import re
+import json
+import asyncio
+import argparse
+from utils.stationFileParser import getStationLabel
+
+# "CRNH0203-2020-TX_Austin_33_NW.txt   2021-01-06 10:34  3.6M" in the text of an Apache style listing
+# (CRNH = hourly02, CRNS = subhourly01 station files)
+STATION_FILE_PATTERN = r"CRN[HS]\S+?\.txt"
+LISTING_ROW_PATTERN = re.compile(
+    f"({STATION_FILE_PATTERN})" + r"\s*\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}\s*([\d.]+[KMG]?)"
+)
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3}
+
+
+##########################################################
+def parseSize(text=""):
+    """
+    *** Listing size column ("512", "3.6M", "1.2K") -> approximate bytes
+    """
+    unit = text[-1] if text[-1:] in SIZE_UNITS else ""
+    number = text[:-1] if unit else text
+    return int(float(number) * SIZE_UNITS[unit])
+
+
+##########################################################
+def parseListingSizes(htmlContent=""):
+    """
+    *** [(station file, size in bytes or None)] of a year listing; rows without a size column
+    *** (or listings in another layout) still come back with size None
+    """
+    from bs4 import BeautifulSoup
+
+    text = BeautifulSoup(htmlContent, features="html.parser").get_text(" ")
+    sizes = {
+        stationFile: parseSize(text=size)
+        for stationFile, size in LISTING_ROW_PATTERN.findall(text)
+    }
+    stationFiles = dict.fromkeys(re.findall(STATION_FILE_PATTERN, text))
+    return [(stationFile, sizes.get(stationFile)) for stationFile in stationFiles]
+
+
+##########################################################
+def buildIngestPlan(listings={}, fetchYears=None):
+    """
+    *** listings is {year: [(station file, bytes)]} of every year the stations have to be present in
+    *** Returns the plan: stations listed in all of them, the (year, station file) jobs of fetchYears
+    *** (default: all listed years) for those stations and per-year/total file and byte counts
+    """
+    years = [str(year) for year in listings]
+    fetchYears = years if fetchYears is None else [str(year) for year in fetchYears]
+    labelsByYear = {
+        str(year): {
+            getStationLabel(stationFile=stationFile, year=str(year)): (
+                stationFile,
+                size,
+            )
+            for stationFile, size in rows
+        }
+        for year, rows in listings.items()
+    }
+    labelSets = [set(labels) for labels in labelsByYear.values()]
+    commonStations = sorted(set.intersection(*labelSets)) if labelSets else []
+    allStations = set().union(*labelSets) if labelSets else set()
+    droppedStations = {
+        station: [year for year in years if station not in labelsByYear[year]]
+        for station in sorted(allStations - set(commonStations))
+    }
+    plan = {
+        "years": years,
+        "fetchYears": fetchYears,
+        "commonStations": commonStations,
+        "droppedStations": droppedStations,
+        "jobs": [],
+        "perYear": {},
+    }
+    for year in fetchYears:
+        labels = labelsByYear.get(year, {})
+        planned = [labels[station] for station in commonStations]
+        skipped = [labels[s] for s in labels if s in droppedStations]
+        plan["jobs"] += [(year, stationFile) for stationFile, _ in planned]
+        plan["perYear"][year] = {
+            "listedFiles": len(labels),
+            "plannedFiles": len(planned),
+            "plannedBytes": sum(size or 0 for _, size in planned),
+            "skippedFiles": len(skipped),
+            "skippedBytes": sum(size or 0 for _, size in skipped),
+            "unknownSizes": sum(size is None for _, size in planned),
+        }
+    plan["totals"] = {
+        key: sum(yearStats[key] for yearStats in plan["perYear"].values())
+        for key in [
+            "listedFiles",
+            "plannedFiles",
+            "plannedBytes",
+            "skippedFiles",
+            "skippedBytes",
+            "unknownSizes",
+        ]
+    }
+    return plan
+
+
+##########################################################
+def toMegabytes(numBytes=0):
+    return f"{numBytes / 1024**2:,.1f} MB"
+
+
+def formatIngestPlanReport(plan={}):
+    """
+    *** Human readable dry-run summary of a plan
+    """
+    lines = [
+        "=" * 60,
+        "Ingest plan (from year listings, sizes are as listed):",
+        f"Years required:        {', '.join(plan['years'])}",
+        f"Common stations:       {len(plan['commonStations'])}",
+        f"Dropped stations:      {len(plan['droppedStations'])}",
+    ]
+    for year, stats in plan["perYear"].items():
+        lines.append(
+            f"  {year}: fetch {stats['plannedFiles']}/{stats['listedFiles']} files, "
+            f"{toMegabytes(stats['plannedBytes'])} (skip {toMegabytes(stats['skippedBytes'])})"
+        )
+    totals = plan["totals"]
+    lines.append(
+        f"Total to download:     {totals['plannedFiles']} files, {toMegabytes(totals['plannedBytes'])}"
+    )
+    lines.append(
+        f"Avoided:               {totals['skippedFiles']} files, {toMegabytes(totals['skippedBytes'])}"
+    )
+    if totals["unknownSizes"]:
+        lines.append(f"Files without a listed size: {totals['unknownSizes']}")
+    lines.append("=" * 60)
+    return "\n".join(lines)
+
+
+##########################################################
+def writeIngestPlan(plan={}, outFileName=""):
+    with open(outFileName, "w") as f:
+        json.dump(plan, f, indent=1)
+
+
+##########################################################
+async def fetchIngestPlan(inputData={}, dirname="", fetchYears=None):
+    """
+    *** Fetch only the listings of inputData["idealDates"] and plan the ingest (dry run)
+    """
+    # Imported here since the fetch helpers of dataPrepAndParser build on this module
+    import aiohttp
+    from utils.dataPrepAndParser import (
+        fetchYearListing,
+        getNceiBaseUrl,
+        getRetryPolicy,
+    )
+    from utils.httpCache import getHttpCache
+
+    years = [str(year) for year in inputData["idealDates"]]
+    cache = getHttpCache(inputData=inputData, dirname=dirname)
+    async with aiohttp.ClientSession() as session:
+        listings = await asyncio.gather(
+            *[
+                fetchYearListing(
+                    session=session,
+                    year=year,
+                    cache=cache,
+                    retryPolicy=getRetryPolicy(inputData=inputData),
+                    baseUrl=getNceiBaseUrl(inputData=inputData),
+                )
+                for year in years
+            ]
+        )
+    return buildIngestPlan(listings=dict(zip(years, listings)), fetchYears=fetchYears)
+
+
+##########################################################
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--years", type=int, nargs="+", required=True)
+    parser.add_argument("--nceiBaseUrl", default="")
+    parser.add_argument("--json", default="", help="also write the full plan here")
+    args = parser.parse_args()
+    inputData = {"idealDates": args.years, "maxRetries": 2}
+    if args.nceiBaseUrl:
+        inputData["nceiBaseUrl"] = args.nceiBaseUrl
+    plan = asyncio.run(fetchIngestPlan(inputData=inputData))
+    print(formatIngestPlanReport(plan=plan))
+    if args.json:
+        writeIngestPlan(plan=plan, outFileName=args.json)
+
+
+##########################################################
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+##########################################################
+import re
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds (seconds) of the request latency histogram buckets, +Inf is implied
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+
+
+##########################################################
+class StageTimer:
+    """
+    *** Context manager adding the elapsed wall time of a block to one stage of the metrics
+    """
+
+    def __init__(self, metrics=None, stage=""):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.startTime = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.recordStage(
+            stage=self.stage, seconds=time.perf_counter() - self.startTime
+        )
+        return False
+
+
+##########################################################
+class ConcurrencyTracker:
+    """
+    *** Context manager holding a gauge one higher for the duration of a block
+    """
+
+    def __init__(self, metrics=None, gauge=""):
+        self.metrics = metrics
+        self.gauge = gauge
+
+    def __enter__(self):
+        self.metrics.adjustGauge(name=self.gauge, delta=1)
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.adjustGauge(name=self.gauge, delta=-1)
+        return False
+
+
+##########################################################
+class DisabledContext:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+DISABLED_CONTEXT = DisabledContext()
+
+
+##########################################################
+class PipelineMetrics:
+    """
+    *** Stage timers, counters, latency histograms and concurrency gauges of one pipeline run
+    *** When disabled every call returns right away (shared no-op context, no clock reads, no locking)
+    """
+
+    def __init__(self, enabled=True, latencyBuckets=LATENCY_BUCKETS):
+        self.enabled = enabled
+        self.latencyBuckets = list(latencyBuckets)
+        self.timers = {}
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+        self.startTime = time.perf_counter()
+        self.server = None
+
+    ######################################################
+    def stage(self, stage=""):
+        if not self.enabled:
+            return DISABLED_CONTEXT
+        return StageTimer(metrics=self, stage=stage)
+
+    def trackConcurrency(self, gauge=""):
+        if not self.enabled:
+            return DISABLED_CONTEXT
+        return ConcurrencyTracker(metrics=self, gauge=gauge)
+
+    ######################################################
+    def recordStage(self, stage="", seconds=0.0):
+        if not self.enabled:
+            return
+        with self.lock:
+            timer = self.timers.setdefault(
+                stage, {"count": 0, "totalSeconds": 0.0, "maxSeconds": 0.0}
+            )
+            timer["count"] += 1
+            timer["totalSeconds"] += seconds
+            timer["maxSeconds"] = max(timer["maxSeconds"], seconds)
+
+    def mergeTimers(self, timers={}):
+        """
+        *** Add stage timers recorded elsewhere (e.g. in a worker process) to this run
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            for stage, other in timers.items():
+                timer = self.timers.setdefault(
+                    stage, {"count": 0, "totalSeconds": 0.0, "maxSeconds": 0.0}
+                )
+                timer["count"] += other["count"]
+                timer["totalSeconds"] += other["totalSeconds"]
+                timer["maxSeconds"] = max(timer["maxSeconds"], other["maxSeconds"])
+
+    def incrementCounter(self, name="", value=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name="", value=0.0):
+        """
+        *** Add one observation (e.g. a request latency in seconds) to a histogram
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.setdefault(
+                name,
+                {
+                    "buckets": self.latencyBuckets,
+                    "counts": [0] * (len(self.latencyBuckets) + 1),
+                    "count": 0,
+                    "sum": 0.0,
+                },
+            )
+            i = 0
+            while i < len(histogram["buckets"]) and value > histogram["buckets"][i]:
+                i += 1
+            histogram["counts"][i] += 1
+            histogram["count"] += 1
+            histogram["sum"] += value
+
+    def adjustGauge(self, name="", delta=0):
+        if not self.enabled:
+            return
+        with self.lock:
+            gauge = self.gauges.setdefault(name, {"value": 0, "max": 0})
+            gauge["value"] += delta
+            gauge["max"] = max(gauge["max"], gauge["value"])
+
+    def setGauge(self, name="", value=0):
+        if not self.enabled:
+            return
+        with self.lock:
+            gauge = self.gauges.setdefault(name, {"value": 0, "max": 0})
+            gauge["value"] = value
+            gauge["max"] = max(gauge["max"], value)
+
+    ######################################################
+    def toDict(self):
+        with self.lock:
+            return json.loads(
+                json.dumps(
+                    {
+                        "wallSeconds": time.perf_counter() - self.startTime,
+                        "timers": self.timers,
+                        "counters": self.counters,
+                        "histograms": self.histograms,
+                        "gauges": self.gauges,
+                    }
+                )
+            )
+
+    def writeJson(self, outFileName=""):
+        with open(outFileName, "w") as f:
+            json.dump(self.toDict(), f, indent=2)
+
+    def toPrometheusText(self, prefix="weather_pipeline"):
+        """
+        *** Prometheus text exposition format (version 0.0.4) of the current values
+        """
+        data = self.toDict()
+        lines = [
+            f"# TYPE {prefix}_stage_seconds_total counter",
+            f"# TYPE {prefix}_stage_calls_total counter",
+        ]
+        for stage, timer in data["timers"].items():
+            label = f'{{stage="{stage}"}}'
+            lines.append(f"{prefix}_stage_seconds_total{label} {timer['totalSeconds']}")
+            lines.append(f"{prefix}_stage_calls_total{label} {timer['count']}")
+        for name, value in data["counters"].items():
+            metricName = f"{prefix}_{toSnakeCase(name=name)}_total"
+            lines += [f"# TYPE {metricName} counter", f"{metricName} {value}"]
+        for name, gauge in data["gauges"].items():
+            metricName = f"{prefix}_{toSnakeCase(name=name)}"
+            lines += [f"# TYPE {metricName} gauge", f"{metricName} {gauge['value']}"]
+        for name, histogram in data["histograms"].items():
+            metricName = f"{prefix}_{toSnakeCase(name=name)}"
+            lines.append(f"# TYPE {metricName} histogram")
+            cumulative = 0
+            bounds = [str(bound) for bound in histogram["buckets"]] + ["+Inf"]
+            for bound, count in zip(bounds, histogram["counts"]):
+                cumulative += count
+                lines.append(f'{metricName}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f"{metricName}_sum {histogram['sum']}")
+            lines.append(f"{metricName}_count {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    ######################################################
+    def startPrometheusEndpoint(self, port=0, host="127.0.0.1"):
+        """
+        *** Serve GET /metrics in a background thread, returns the bound port (port 0 = any free port)
+        *** Only reachable from this machine by default, host="0.0.0.0" exposes it on every interface
+        """
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = metrics.toPrometheusText().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server.server_address[1]
+
+    def stopPrometheusEndpoint(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+##########################################################
+def toSnakeCase(name=""):
+    return re.sub(r"(?<!^)(?=[A-Z])", "_", name).lower()
+
+
+##########################################################
+# Metrics of the current run, disabled until configurePipelineMetrics turns them on
+activePipelineMetrics = PipelineMetrics(enabled=False)
+
+
+def getPipelineMetrics():
+    return activePipelineMetrics
+
+
+def configurePipelineMetrics(inputData={}):
+    """
+    *** Fresh metrics for a run when inputData["collectMetrics"] is 1 (disabled no-op otherwise)
+    *** inputData["metricsPort"] > 0 additionally serves them on http://metricsHost:metricsPort/metrics
+    """
+    global activePipelineMetrics
+    activePipelineMetrics.stopPrometheusEndpoint()
+    activePipelineMetrics = PipelineMetrics(
+        enabled=inputData.get("collectMetrics", 0) == 1
+    )
+    if activePipelineMetrics.enabled and inputData.get("metricsPort", 0) > 0:
+        activePipelineMetrics.startPrometheusEndpoint(
+            port=inputData["metricsPort"],
+            host=inputData.get("metricsHost", "127.0.0.1"),
+        )
+    return activePipelineMetrics
+
+
+##########################################################
@@ -0,0 +1,154 @@
+##########################################################
+import numpy as np
+from utils.timeIndex import getUtcHours
+from utils.stationTable import StationTable
+
+# Combined sort key of the point-in-time index: station number in the high bits, UTC hour in the low bits
+STATION_KEY_SHIFT = 32
+
+
+##########################################################
+def toHourNumber(stamp=None):
+    """
+    *** datetime64 / ISO string / int hours since epoch -> int64 hours since 1970-01-01T00
+    """
+    if isinstance(stamp, (int, np.integer)):
+        return int(stamp)
+    return int(np.datetime64(stamp, "h").astype(np.int64))
+
+
+##########################################################
+class StationQueryEngine:
+    """
+    *** Time-range and point-in-time lookups over the cleaned {station: {column: array}} data
+    *** (plain dict, StationTable or memory-mapped ColumnarStore)
+    *** Every station keeps a sorted int64 UTC hour index built once; a range query is two binary
+    *** searches and returns slices (views) of the station columns. Point-in-time lookups across all
+    *** stations are one searchsorted over a combined (station, hour) key array
+    """
+
+    def __init__(self, weatherDataDictObjectAll={}):
+        self.data = weatherDataDictObjectAll
+        self.stations = list(weatherDataDictObjectAll.keys())
+        self.stationIndex = {station: i for i, station in enumerate(self.stations)}
+        self.hours = {}
+        self.orders = {}
+        lengths = []
+        for station in self.stations:
+            hours = getUtcHours(stationData=weatherDataDictObjectAll[station]).astype(
+                np.int64
+            )
+            if len(hours) > 1 and (np.diff(hours) < 0).any():
+                # Out of order rows: keep a permutation, results of this station are copies
+                self.orders[station] = np.argsort(hours, kind="stable")
+                hours = hours[self.orders[station]]
+            self.hours[station] = hours
+            lengths.append(len(hours))
+        self.offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        self.keys = np.concatenate(
+            [np.empty(0, dtype=np.int64)]
+            + [
+                (np.int64(i) << STATION_KEY_SHIFT) + self.hours[station]
+                for i, station in enumerate(self.stations)
+            ]
+        )
+        self.columnBuffers = {}
+
+    ######################################################
+    def getRowRange(self, station="", start=None, end=None):
+        """
+        *** Row slice of one station covering UTC hours [start, end) (open ended when None)
+        """
+        hours = self.hours[station]
+        lo = 0 if start is None else np.searchsorted(hours, toHourNumber(start), "left")
+        hi = (
+            len(hours)
+            if end is None
+            else np.searchsorted(hours, toHourNumber(end), "left")
+        )
+        return slice(int(lo), int(hi))
+
+    def getStationColumn(self, station="", variable="", rows=slice(None)):
+        values = self.data[station][variable]
+        if station in self.orders:
+            return np.asarray(values)[self.orders[station][rows]]
+        return values[rows]
+
+    ######################################################
+    def query(self, stations=None, variables=None, start=None, end=None):
+        """
+        *** {station: {"UTC_HOUR": datetime64[h], variable: values}} for UTC hours [start, end)
+        *** Values are views into the loaded columns (no copy) for stations stored in time order
+        """
+        if isinstance(stations, str):
+            stations = [stations]
+        stations = self.stations if stations is None else list(stations)
+        result = {}
+        for station in stations:
+            rows = self.getRowRange(station=station, start=start, end=end)
+            stationVariables = (
+                list(self.data[station].keys()) if variables is None else variables
+            )
+            result[station] = {
+                "UTC_HOUR": self.hours[station][rows].view("datetime64[h]")
+            }
+            for variable in stationVariables:
+                result[station][variable] = self.getStationColumn(
+                    station=station, variable=variable, rows=rows
+                )
+        return result
+
+    ######################################################
+    def getColumnBuffer(self, variable=""):
+        """
+        *** One variable of all stations back to back in index order (built once per variable)
+        """
+        if variable not in self.columnBuffers:
+            if isinstance(self.data, StationTable) and not self.orders:
+                # Already one contiguous buffer per column with the same station offsets
+                buffer = np.asarray(self.data.column(column=variable))
+                if variable in self.data.categories:
+                    buffer = self.data.categories[variable][buffer]
+                self.columnBuffers[variable] = buffer
+            else:
+                self.columnBuffers[variable] = np.concatenate(
+                    [
+                        np.asarray(self.getStationColumn(station=s, variable=variable))
+                        for s in self.stations
+                    ]
+                )
+        return self.columnBuffers[variable]
+
+    def pointInTime(self, stamp=None, variables=[]):
+        """
+        *** Value of every variable at one UTC hour for all stations
+        *** Returns {"stations": [...], "found": bool per station, variable: values (NaN if no row)}
+        """
+        targets = (
+            np.arange(len(self.stations), dtype=np.int64) << STATION_KEY_SHIFT
+        ) + toHourNumber(stamp)
+        if len(self.keys) == 0:
+            # No rows at all (no stations or only empty ones): nothing is found
+            result = {"stations": self.stations, "found": np.zeros(len(targets), bool)}
+            for variable in variables:
+                result[variable] = np.full(len(targets), np.nan)
+            return result
+        positions = np.minimum(np.searchsorted(self.keys, targets), len(self.keys) - 1)
+        found = self.keys[positions] == targets
+        result = {"stations": self.stations, "found": found}
+        for variable in variables:
+            values = self.getColumnBuffer(variable=variable)[positions]
+            if values.dtype.kind == "f":
+                values = np.where(found, values, np.nan)
+            result[variable] = values
+        return result
+
+    ######################################################
+    def getTimeBounds(self, station=""):
+        hours = self.hours[station]
+        if len(hours) == 0:
+            return None, None
+        return hours[0].astype("datetime64[h]"), hours[-1].astype("datetime64[h]")
+
+
+##########################################################
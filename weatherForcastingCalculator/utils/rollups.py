@@ -0,0 +1,466 @@
+##########################################################
+import os
+import json
+import numpy as np
+import pandas as pd
+from utils.timeIndex import getUtcHours
+from utils.stationFileParser import PRODUCT_MEASUREMENT_COLUMNS
+
+ROLLUP_MANIFEST_FILE_NAME = "rollups.json"
+ROLLUP_VERSION = 1
+# Level -> datetime64 unit of its buckets, finest first; every level is reduced from the one before it
+ROLLUP_LEVELS = {"daily": "D", "monthly": "M", "yearly": "Y"}
+ROLLUP_STATS = ["count", "sum", "min", "max"]
+# Bucket key of a (station, period) pair: station number in the high bits, period number in the low bits
+STATION_KEY_SHIFT = 32
+BUCKET_MASK = (1 << STATION_KEY_SHIFT) - 1
+
+
+##########################################################
+def getRollupDir(dirname=""):
+    return dirname + "/Data/weatherDataRollups"
+
+
+def rollupsExist(rollupDir=""):
+    return os.path.exists(os.path.join(rollupDir, ROLLUP_MANIFEST_FILE_NAME))
+
+
+##########################################################
+def reduceBuckets(keys=[], stats={}):
+    """
+    *** Collapse rows sharing a bucket key (keys sorted) into one row per bucket with reduceat
+    *** stats is {variable: {"count", "sum", "min", "max"}}, min/max are NaN for buckets without values
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    if len(keys) == 0:
+        return keys, {
+            variable: {stat: np.array(values) for stat, values in variableStats.items()}
+            for variable, variableStats in stats.items()
+        }
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    reduced = {}
+    for variable, variableStats in stats.items():
+        reduced[variable] = {
+            "count": np.add.reduceat(variableStats["count"], starts),
+            "sum": np.add.reduceat(variableStats["sum"], starts),
+            # fmin/fmax skip NaN unless the whole bucket is NaN
+            "min": np.fmin.reduceat(variableStats["min"], starts),
+            "max": np.fmax.reduceat(variableStats["max"], starts),
+        }
+    return keys[starts], reduced
+
+
+##########################################################
+def toBucketKeys(stationNumbers=[], periods=[]):
+    return (
+        np.asarray(stationNumbers, dtype=np.int64) << STATION_KEY_SHIFT
+    ) + np.asarray(periods).astype(np.int64)
+
+
+def splitBucketKeys(keys=[]):
+    keys = np.asarray(keys, dtype=np.int64)
+    return keys >> STATION_KEY_SHIFT, keys & BUCKET_MASK
+
+
+##########################################################
+def splitDayRange(start=None, end=None, units=("Y", "M", "D")):
+    """
+    *** Cover the days [start, end) with the fewest buckets: whole years, then whole months, then days
+    *** Returns [(unit, first bucket, end bucket)] as datetime64 of that unit, e.g. 2020-03-15 .. 2022-02-01
+    *** -> days 03-15..03-31, months 2020-04..2020-12, year 2021, month 2022-01
+    """
+    start = np.datetime64(start, "D")
+    end = np.datetime64(end, "D")
+    if start >= end:
+        return []
+    unit = units[0]
+    if unit == "D":
+        return [("D", start, end)]
+    lo = start.astype(f"datetime64[{unit}]")
+    if lo.astype("datetime64[D]") < start:
+        lo += 1
+    hi = end.astype(f"datetime64[{unit}]")
+    if lo >= hi:
+        return splitDayRange(start=start, end=end, units=units[1:])
+    return (
+        splitDayRange(start=start, end=lo.astype("datetime64[D]"), units=units[1:])
+        + [(unit, lo, hi)]
+        + splitDayRange(start=hi.astype("datetime64[D]"), end=end, units=units[1:])
+    )
+
+
+##########################################################
+class RollupPyramid:
+    """
+    *** Daily/monthly/yearly NaN-aware count/sum/min/max per station and variable (mean = sum/count)
+    *** Each level holds sorted (station, period) bucket keys and one array per variable and stat;
+    *** the daily level is reduced from the hourly rows once, coarser levels from the level below it
+    *** All stats are mergeable, so new hours only update (or insert) the buckets they fall into
+    """
+
+    def __init__(self, stations=[], variables=[], levels=None):
+        self.stations = list(stations)
+        self.stationIndex = {station: i for i, station in enumerate(self.stations)}
+        self.variables = list(variables)
+        if levels is None:
+            levels = {
+                level: (
+                    np.empty(0, dtype=np.int64),
+                    {
+                        variable: {
+                            "count": np.empty(0, dtype=np.int64),
+                            "sum": np.empty(0),
+                            "min": np.empty(0),
+                            "max": np.empty(0),
+                        }
+                        for variable in self.variables
+                    },
+                )
+                for level in ROLLUP_LEVELS
+            }
+        # {level: (keys, {variable: {stat: array}})}
+        self.levels = levels
+
+    ######################################################
+    @classmethod
+    def fromStationData(
+        cls, weatherDataDictObjectAll={}, variables=None, stations=None
+    ):
+        """
+        *** One pass over the hourly columns of every station, then reduce daily -> monthly -> yearly
+        """
+        stations = (
+            list(weatherDataDictObjectAll.keys()) if stations is None else stations
+        )
+        if variables is None:
+            firstStation = weatherDataDictObjectAll[stations[0]] if stations else {}
+            variables = [c for c in PRODUCT_MEASUREMENT_COLUMNS if c in firstStation]
+        keyChunks = []
+        valueChunks = {variable: [] for variable in variables}
+        for i, station in enumerate(stations):
+            stationData = weatherDataDictObjectAll[station]
+            days = getUtcHours(stationData=stationData).astype("datetime64[D]")
+            keyChunks.append(toBucketKeys(stationNumbers=i, periods=days))
+            for variable in variables:
+                valueChunks[variable].append(
+                    np.asarray(stationData[variable], dtype=np.float64)
+                )
+        keys = np.concatenate([np.empty(0, dtype=np.int64)] + keyChunks)
+        order = None
+        if len(keys) > 1 and (np.diff(keys) < 0).any():
+            order = np.argsort(keys, kind="stable")
+            keys = keys[order]
+        stats = {}
+        for variable in variables:
+            values = np.concatenate([np.empty(0)] + valueChunks[variable])
+            if order is not None:
+                values = values[order]
+            valid = ~np.isnan(values)
+            stats[variable] = {
+                "count": valid.astype(np.int64),
+                "sum": np.where(valid, values, 0.0),
+                "min": values,
+                "max": values,
+            }
+        levels = {}
+        previousUnit = "D"
+        for level, unit in ROLLUP_LEVELS.items():
+            stationNumbers, periods = splitBucketKeys(keys=keys)
+            periods = periods.astype(f"datetime64[{previousUnit}]")
+            keys = toBucketKeys(
+                stationNumbers=stationNumbers,
+                periods=periods.astype(f"datetime64[{unit}]"),
+            )
+            keys, stats = reduceBuckets(keys=keys, stats=stats)
+            levels[level] = (keys, stats)
+            previousUnit = unit
+        return cls(stations=stations, variables=variables, levels=levels)
+
+    @classmethod
+    def fromStationDataByStation(
+        cls, weatherDataDictObjectAll={}, variables=None, stations=None
+    ):
+        """
+        *** Same pyramid as fromStationData, reduced one station at a time: only one station's hourly
+        *** rows are in memory at once (e.g. for a memory-mapped store larger than memory)
+        """
+        stations = (
+            list(weatherDataDictObjectAll.keys()) if stations is None else stations
+        )
+        if variables is None:
+            firstStation = weatherDataDictObjectAll[stations[0]] if stations else {}
+            variables = [c for c in PRODUCT_MEASUREMENT_COLUMNS if c in firstStation]
+        keyChunks = {level: [np.empty(0, dtype=np.int64)] for level in ROLLUP_LEVELS}
+        statChunks = {
+            level: {
+                variable: {stat: [] for stat in ROLLUP_STATS} for variable in variables
+            }
+            for level in ROLLUP_LEVELS
+        }
+        for i, station in enumerate(stations):
+            part = cls.fromStationData(
+                weatherDataDictObjectAll=weatherDataDictObjectAll,
+                variables=variables,
+                stations=[station],
+            )
+            for level, (keys, stats) in part.levels.items():
+                # Station number 0 of the single-station pyramid becomes i; stations ascend, keys stay sorted
+                keyChunks[level].append(
+                    keys + toBucketKeys(stationNumbers=i, periods=0)
+                )
+                for variable in variables:
+                    for stat in ROLLUP_STATS:
+                        statChunks[level][variable][stat].append(stats[variable][stat])
+        levels = {
+            level: (
+                np.concatenate(keyChunks[level]),
+                {
+                    variable: {
+                        stat: np.concatenate(chunks) if chunks else np.empty(0)
+                        for stat, chunks in variableChunks.items()
+                    }
+                    for variable, variableChunks in statChunks[level].items()
+                },
+            )
+            for level in ROLLUP_LEVELS
+        }
+        return cls(stations=stations, variables=variables, levels=levels)
+
+    ######################################################
+    def merge(self, other=None):
+        """
+        *** Fold another pyramid (e.g. built from newly appended hours) into this one in place
+        *** Existing buckets are combined where the keys match, new buckets are inserted in key order
+        """
+        for station in other.stations:
+            if station not in self.stationIndex:
+                self.stationIndex[station] = len(self.stations)
+                self.stations.append(station)
+        stationMap = np.array(
+            [self.stationIndex[station] for station in other.stations], dtype=np.int64
+        )
+        for level in ROLLUP_LEVELS:
+            keys, stats = self.levels[level]
+            otherKeys, otherStats = other.levels[level]
+            stationNumbers, periods = splitBucketKeys(keys=otherKeys)
+            otherKeys = toBucketKeys(
+                stationNumbers=stationMap[stationNumbers], periods=periods
+            )
+            order = np.argsort(otherKeys, kind="stable")
+            otherKeys = otherKeys[order]
+            positions = np.searchsorted(keys, otherKeys)
+            hit = np.zeros(len(otherKeys), dtype=bool)
+            inRange = positions < len(keys)
+            hit[inRange] = keys[positions[inRange]] == otherKeys[inRange]
+            target = positions[hit]
+            for variable in self.variables:
+                current = stats[variable]
+                incoming = {
+                    stat: np.asarray(otherStats[variable][stat])[order]
+                    for stat in ROLLUP_STATS
+                }
+                current["count"][target] += incoming["count"][hit]
+                current["sum"][target] += incoming["sum"][hit]
+                current["min"][target] = np.fmin(
+                    current["min"][target], incoming["min"][hit]
+                )
+                current["max"][target] = np.fmax(
+                    current["max"][target], incoming["max"][hit]
+                )
+                for stat in ROLLUP_STATS:
+                    current[stat] = np.insert(
+                        current[stat], positions[~hit], incoming[stat][~hit]
+                    )
+            self.levels[level] = (
+                np.insert(keys, positions[~hit], otherKeys[~hit]),
+                stats,
+            )
+        return self
+
+    ######################################################
+    def getStationBuckets(self, level="monthly", station="", start=None, end=None):
+        """
+        *** Row slice of one station's buckets at a level for the periods [start, end)
+        """
+        keys = self.levels[level][0]
+        unit = ROLLUP_LEVELS[level]
+        i = self.stationIndex[station]
+        lo = toBucketKeys(
+            stationNumbers=i,
+            periods=0 if start is None else np.datetime64(start, unit),
+        )
+        hi = toBucketKeys(
+            stationNumbers=i + 1 if end is None else i,
+            periods=0 if end is None else np.datetime64(end, unit),
+        )
+        return slice(
+            int(np.searchsorted(keys, lo, "left")),
+            int(np.searchsorted(keys, hi, "left")),
+        )
+
+    def query(
+        self,
+        variable="",
+        stat="mean",
+        level="monthly",
+        stations=None,
+        start=None,
+        end=None,
+    ):
+        """
+        *** {station: (periods as datetime64 of the level, values)} of one stat for [start, end)
+        """
+        stations = self.stations if stations is None else stations
+        keys, stats = self.levels[level]
+        result = {}
+        for station in stations:
+            rows = self.getStationBuckets(
+                level=level, station=station, start=start, end=end
+            )
+            periods = splitBucketKeys(keys=keys[rows])[1].astype(
+                f"datetime64[{ROLLUP_LEVELS[level]}]"
+            )
+            variableStats = stats[variable]
+            if stat == "mean":
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    values = variableStats["sum"][rows] / variableStats["count"][rows]
+            else:
+                values = variableStats[stat][rows]
+            result[station] = (periods, values)
+        return result
+
+    ######################################################
+    def summarize(self, variable="", start=None, end=None, stations=None):
+        """
+        *** count/sum/mean/min/max per station over the days [start, end), answered from the coarsest
+        *** buckets that tile the range (open ends default to the years covered by the data)
+        """
+        stations = self.stations if stations is None else stations
+        yearlyPeriods = splitBucketKeys(keys=self.levels["yearly"][0])[1]
+        if start is None:
+            start = (
+                yearlyPeriods.min().astype("datetime64[Y]") if len(yearlyPeriods) else 0
+            )
+        if end is None:
+            end = (
+                (yearlyPeriods.max() + 1).astype("datetime64[Y]")
+                if len(yearlyPeriods)
+                else 0
+            )
+        levelOfUnit = {unit: level for level, unit in ROLLUP_LEVELS.items()}
+        pieces = splitDayRange(
+            start=np.datetime64(start, "D"), end=np.datetime64(end, "D")
+        )
+        rows = []
+        for station in stations:
+            count, total, low, high = 0, 0.0, np.nan, np.nan
+            for unit, lo, hi in pieces:
+                level = levelOfUnit[unit]
+                bucketRows = self.getStationBuckets(
+                    level=level, station=station, start=lo, end=hi
+                )
+                variableStats = self.levels[level][1][variable]
+                count += int(variableStats["count"][bucketRows].sum())
+                total += float(variableStats["sum"][bucketRows].sum())
+                if bucketRows.stop > bucketRows.start:
+                    low = np.fmin(low, np.fmin.reduce(variableStats["min"][bucketRows]))
+                    high = np.fmax(
+                        high, np.fmax.reduce(variableStats["max"][bucketRows])
+                    )
+            rows.append(
+                {
+                    "station": station,
+                    "count": count,
+                    "sum": total,
+                    "mean": total / count if count else np.nan,
+                    "min": low,
+                    "max": high,
+                }
+            )
+        return pd.DataFrame(rows)
+
+    ######################################################
+    def save(self, rollupDir=""):
+        """
+        *** One .npz per level (bucket keys + variable__stat arrays) and a json manifest written last
+        """
+        os.makedirs(rollupDir, exist_ok=True)
+        for level, (keys, stats) in self.levels.items():
+            arrays = {"keys": keys}
+            for variable in self.variables:
+                for stat in ROLLUP_STATS:
+                    arrays[f"{variable}__{stat}"] = stats[variable][stat]
+            levelPath = os.path.join(rollupDir, f"{level}.npz")
+            with open(levelPath + ".tmp", "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(levelPath + ".tmp", levelPath)
+        manifest = {
+            "version": ROLLUP_VERSION,
+            "stations": self.stations,
+            "variables": self.variables,
+            "levels": list(self.levels.keys()),
+        }
+        manifestPath = os.path.join(rollupDir, ROLLUP_MANIFEST_FILE_NAME)
+        with open(manifestPath + ".tmp", "w") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(manifestPath + ".tmp", manifestPath)
+
+    @classmethod
+    def load(cls, rollupDir=""):
+        with open(os.path.join(rollupDir, ROLLUP_MANIFEST_FILE_NAME), "r") as f:
+            manifest = json.load(f)
+        levels = {}
+        for level in manifest["levels"]:
+            with np.load(os.path.join(rollupDir, f"{level}.npz")) as arrays:
+                levels[level] = (
+                    arrays["keys"],
+                    {
+                        variable: {
+                            stat: arrays[f"{variable}__{stat}"] for stat in ROLLUP_STATS
+                        }
+                        for variable in manifest["variables"]
+                    },
+                )
+        return cls(
+            stations=manifest["stations"],
+            variables=manifest["variables"],
+            levels=levels,
+        )
+
+
+##########################################################
+def buildRollups(
+    weatherDataDictObjectAll={}, rollupDir="", variables=None, byStation=False
+):
+    """
+    *** byStation reduces one station at a time (bounded memory) instead of all hourly rows at once
+    """
+    if byStation:
+        pyramid = RollupPyramid.fromStationDataByStation(
+            weatherDataDictObjectAll=weatherDataDictObjectAll, variables=variables
+        )
+    else:
+        pyramid = RollupPyramid.fromStationData(
+            weatherDataDictObjectAll=weatherDataDictObjectAll, variables=variables
+        )
+    pyramid.save(rollupDir=rollupDir)
+    return pyramid
+
+
+##########################################################
+def updateRollups(rollupDir="", newData={}):
+    """
+    *** Fold newly appended hourly rows {station: {column: array}} into the saved pyramid
+    """
+    pyramid = RollupPyramid.load(rollupDir=rollupDir)
+    if newData:
+        pyramid.merge(
+            other=RollupPyramid.fromStationData(
+                weatherDataDictObjectAll=newData, variables=pyramid.variables
+            )
+        )
+        pyramid.save(rollupDir=rollupDir)
+    return pyramid
+
+
+##########################################################
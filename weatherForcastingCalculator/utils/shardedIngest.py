@@ -0,0 +1,346 @@
+##########################################################
+"""
+Sharded ingest: every shard downloads and parses its part of the backfill in its own process (or on
+its own machine) and writes it to a shared directory, one merge step then builds the store
+
+    python -m utils.shardedIngest shard --spec hash:0/4 --years 2015 2016 ... --shardDir /shared/shards
+    python -m utils.shardedIngest merge --shards 4 --shardDir /shared/shards --years 2015 2016 ...
+    python -m utils.shardedIngest run --shards 4 --mode years --years 2015 2016 ...   (all shards locally)
+
+Run from weatherForcastingCalculator/. A shard spec is either a year range (years:2015-2019) or a
+station-hash bucket (hash:k/n, stations whose label hashes to k out of n buckets, all years)
+"""
+import os
+import json
+import zlib
+import shutil
+import asyncio
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from os.path import dirname
+from utils.dataPrepAndParser import fetchAndParseYears, stackCleanAndWrite
+from utils.ingestManifest import IngestManifest
+from utils.stationFileParser import getStationLabel
+
+SHARD_MANIFEST_FILE_NAME = "shard.json"
+SHARD_VERSION = 1
+
+
+##########################################################
+def parseShardSpec(spec=""):
+    """
+    *** "years:2015-2019" / "years:2021" -> {"kind": "years", ...}, "hash:1/4" -> {"kind": "hash", ...}
+    """
+    kind, _, value = spec.partition(":")
+    if kind == "years":
+        first, _, last = value.partition("-")
+        return {"kind": "years", "first": int(first), "last": int(last or first)}
+    if kind == "hash":
+        index, _, count = value.partition("/")
+        index, count = int(index), int(count)
+        if not 0 <= index < count:
+            raise ValueError(f"Shard index out of range: {spec}")
+        return {"kind": "hash", "index": index, "count": count}
+    raise ValueError(f"Unknown shard spec {spec}, expected years:A-B or hash:k/n")
+
+
+def getShardName(spec=""):
+    shard = parseShardSpec(spec=spec)
+    if shard["kind"] == "years":
+        return f"years-{shard['first']}-{shard['last']}"
+    return f"hash-{shard['index']}-of-{shard['count']}"
+
+
+##########################################################
+def getStationHashBucket(stationLabel="", numBuckets=1):
+    # crc32 rather than hash(): the bucket has to be the same in every process and on every machine
+    return zlib.crc32(stationLabel.encode("utf-8")) % numBuckets
+
+
+##########################################################
+def getShardSpecs(inputData={}, numShards=1, mode="hash"):
+    """
+    *** Split a backfill into numShards specs: contiguous year ranges or station-hash buckets
+    """
+    if mode == "years":
+        years = sorted(int(year) for year in inputData["idealDates"])
+        return [
+            f"years:{int(chunk[0])}-{int(chunk[-1])}"
+            for chunk in np.array_split(years, min(numShards, len(years)))
+        ]
+    return [f"hash:{index}/{numShards}" for index in range(numShards)]
+
+
+##########################################################
+async def runIngestShard(inputData={}, dirname="", shardDir="", spec=""):
+    """
+    *** Download and parse one shard, then write {year}.npz (station/column arrays) and shard.json
+    *** under shardDir/<shard name>; shard.json is written last so a crashed shard is never merged
+    """
+    shard = parseShardSpec(spec=spec)
+    shardPath = os.path.join(shardDir, getShardName(spec=spec))
+    os.makedirs(shardPath, exist_ok=True)
+    # A rerun invalidates the previous result of this shard until it has finished again
+    manifestPath = os.path.join(shardPath, SHARD_MANIFEST_FILE_NAME)
+    if os.path.exists(manifestPath):
+        os.remove(manifestPath)
+    shardInputData = dict(inputData)
+    stationFilter = None
+    # Year shards still plan over all years, a station missing from another shard's years is not fetched
+    planYears = inputData["idealDates"]
+    if shard["kind"] == "years":
+        shardInputData["idealDates"] = [
+            year
+            for year in inputData["idealDates"]
+            if shard["first"] <= int(year) <= shard["last"]
+        ]
+    else:
+
+        def stationFilter(year, stationFile):
+            stationLabel = getStationLabel(stationFile=stationFile, year=year)
+            return (
+                getStationHashBucket(
+                    stationLabel=stationLabel, numBuckets=shard["count"]
+                )
+                == shard["index"]
+            )
+
+    # Own ingest manifest per shard, shards running side by side never write the same file
+    manifest = IngestManifest(
+        manifestPath=os.path.join(shardPath, "ingestManifest.json"),
+        resume=inputData.get("resumeIngest", 0) == 1,
+    )
+    dictAllData = await fetchAndParseYears(
+        inputData=shardInputData,
+        dirname=dirname,
+        stationFilter=stationFilter,
+        manifest=manifest,
+        planYears=planYears,
+    )
+    shardManifest = {"version": SHARD_VERSION, "spec": spec, "years": {}}
+    for year, yearData in dictAllData.items():
+        fileName = f"{year}.npz"
+        arrays = {
+            f"{station}/{column}": values
+            for station, stationData in yearData.items()
+            for column, values in stationData.items()
+        }
+        with open(os.path.join(shardPath, fileName + ".tmp"), "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(
+            os.path.join(shardPath, fileName + ".tmp"),
+            os.path.join(shardPath, fileName),
+        )
+        shardManifest["years"][str(year)] = {
+            "file": fileName,
+            "stations": sorted(yearData.keys()),
+        }
+    with open(manifestPath + ".tmp", "w") as f:
+        json.dump(shardManifest, f, indent=1)
+    os.replace(manifestPath + ".tmp", manifestPath)
+    print(f"Shard {spec} done:", manifest.summary())
+    return shardManifest
+
+
+def runIngestShardWorker(args=()):
+    inputData, dirname, shardDir, spec = args
+    return asyncio.run(
+        runIngestShard(
+            inputData=inputData, dirname=dirname, shardDir=shardDir, spec=spec
+        )
+    )
+
+
+##########################################################
+def loadShardManifests(shardDir="", specs=[]):
+    """
+    *** [(shard path, shard.json)] of the shards of specs, in name order; other directories under
+    *** shardDir (e.g. left over from an earlier run with another split) are ignored
+    *** Raises if any of the shards has not finished, a partial merge would silently lose stations
+    """
+    shards = []
+    missing = []
+    for name in sorted(getShardName(spec=spec) for spec in specs):
+        manifestPath = os.path.join(shardDir, name, SHARD_MANIFEST_FILE_NAME)
+        if not os.path.exists(manifestPath):
+            missing.append(name)
+            continue
+        with open(manifestPath, "r") as f:
+            shards.append((os.path.join(shardDir, name), json.load(f)))
+    if missing:
+        raise RuntimeError(f"Shards not finished in {shardDir}: {missing}")
+    return shards
+
+
+##########################################################
+def loadShardedYears(shardDir="", specs=[], years=None):
+    """
+    *** Reassemble {year: {station: columns}} from the shards of specs, independent of which shard finished
+    *** first: years ascending, stations sorted, a (year, station) found in several shards comes from the
+    *** first by name
+    """
+    locations = {}
+    for shardPath, shardManifest in loadShardManifests(shardDir=shardDir, specs=specs):
+        for year, info in shardManifest["years"].items():
+            for station in info["stations"]:
+                locations.setdefault(year, {}).setdefault(
+                    station, os.path.join(shardPath, info["file"])
+                )
+    if years is not None:
+        missing = sorted({str(year) for year in years} - set(locations))
+        if missing:
+            print("No shard covered years:", missing)
+        locations = {year: locations.get(str(year), {}) for year in map(str, years)}
+    dictAllData = {}
+    for year in sorted(locations, key=int):
+        dictAllData[year] = {}
+        stationsByFile = {}
+        for station in sorted(locations[year]):
+            stationsByFile.setdefault(locations[year][station], []).append(station)
+        for filePath, stations in stationsByFile.items():
+            with np.load(filePath) as arrays:
+                columnsByStation = {}
+                for key in arrays.files:
+                    station, _, column = key.partition("/")
+                    columnsByStation.setdefault(station, []).append(column)
+                for station in stations:
+                    dictAllData[year][station] = {
+                        column: arrays[f"{station}/{column}"]
+                        for column in columnsByStation[station]
+                    }
+        dictAllData[year] = dict(sorted(dictAllData[year].items()))
+    return dictAllData
+
+
+##########################################################
+def mergeIngestShards(
+    inputData={}, dirname="", shardDir="", specs=[], writeJson=False, writeStore=True
+):
+    """
+    *** Same result as a single process ingest: stations present in every year, years stacked in order,
+    *** cleaned and written to Data/ (weatherDataStore, station table)
+    *** Only the shards of specs (the current run) are merged
+    """
+    dictAllData = loadShardedYears(
+        shardDir=shardDir, specs=specs, years=inputData.get("idealDates")
+    )
+    return stackCleanAndWrite(
+        dictAllData=dictAllData,
+        inputData=inputData,
+        dirname=dirname,
+        writeJson=writeJson,
+        writeStore=writeStore,
+    )
+
+
+##########################################################
+def runShardedIngest(
+    inputData={},
+    dirname="",
+    shardDir="",
+    numShards=2,
+    mode="hash",
+    writeJson=False,
+    writeStore=True,
+):
+    """
+    *** Every shard in its own process on this machine, then the merge
+    *** shardDir is cleared first, shards of an earlier run never end up in this merge
+    """
+    specs = getShardSpecs(inputData=inputData, numShards=numShards, mode=mode)
+    shutil.rmtree(shardDir, ignore_errors=True)
+    shardInputData = dict(inputData)
+    # Each shard already is a process, split the parse workers between them instead of multiplying them
+    shardInputData["parseWorkers"] = inputData.get("parseWorkers", 0) // len(specs)
+    with ProcessPoolExecutor(max_workers=len(specs)) as executor:
+        list(
+            executor.map(
+                runIngestShardWorker,
+                [(shardInputData, dirname, shardDir, spec) for spec in specs],
+            )
+        )
+    return mergeIngestShards(
+        inputData=inputData,
+        dirname=dirname,
+        shardDir=shardDir,
+        specs=specs,
+        writeJson=writeJson,
+        writeStore=writeStore,
+    )
+
+
+##########################################################
+def getCliInputData(args=None):
+    inputData = {
+        "idealDates": args.years,
+        "batchSize": args.batchSize,
+        "parseWorkers": args.parseWorkers,
+        "useHttpCache": 1,
+        "maxRetries": 4,
+        "retryBaseDelay": 1.0,
+        "resumeIngest": args.resume,
+    }
+    if args.nceiBaseUrl:
+        inputData["nceiBaseUrl"] = args.nceiBaseUrl
+    if args.elevationServiceUrl:
+        inputData["elevationServiceUrl"] = args.elevationServiceUrl
+    return inputData
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("command", choices=["shard", "merge", "run"])
+    parser.add_argument("--spec", default="", help="years:A-B or hash:k/n (shard)")
+    parser.add_argument("--years", type=int, nargs="+", required=True)
+    parser.add_argument(
+        "--dirname", default=dirname(dirname(os.path.abspath(__file__)))
+    )
+    parser.add_argument("--shardDir", default="")
+    parser.add_argument(
+        "--shards", type=int, default=2, help="number of shards (run, merge)"
+    )
+    parser.add_argument(
+        "--specs",
+        nargs="+",
+        default=None,
+        help="shards to merge (default: the --shards/--mode split)",
+    )
+    parser.add_argument("--mode", choices=["hash", "years"], default="hash")
+    parser.add_argument("--batchSize", type=int, default=20)
+    parser.add_argument("--parseWorkers", type=int, default=0)
+    parser.add_argument("--resume", type=int, default=0)
+    parser.add_argument("--nceiBaseUrl", default="")
+    parser.add_argument("--elevationServiceUrl", default="")
+    args = parser.parse_args()
+    inputData = getCliInputData(args=args)
+    shardDir = args.shardDir or args.dirname + "/Data/ingestShards"
+    if args.command == "shard":
+        asyncio.run(
+            runIngestShard(
+                inputData=inputData,
+                dirname=args.dirname,
+                shardDir=shardDir,
+                spec=args.spec,
+            )
+        )
+    elif args.command == "merge":
+        specs = args.specs or getShardSpecs(
+            inputData=inputData, numShards=args.shards, mode=args.mode
+        )
+        mergeIngestShards(
+            inputData=inputData, dirname=args.dirname, shardDir=shardDir, specs=specs
+        )
+    else:
+        runShardedIngest(
+            inputData=inputData,
+            dirname=args.dirname,
+            shardDir=shardDir,
+            numShards=args.shards,
+            mode=args.mode,
+        )
+
+
+##########################################################
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+##########################################################
+import hashlib
+import numpy as np
+from scipy import sparse
+from scipy.spatial import cKDTree
+from utils.timeIndex import alignStationsOnHours, getHourRange, getUtcHours
+
+EARTH_RADIUS_KM = 6371.0
+
+
+##########################################################
+def toUnitSphere(longitude=[], latitude=[]):
+    """
+    *** Lon/lat in degrees -> xyz on the unit sphere, so Euclidean KD-tree distances follow great circles
+    """
+    lon = np.radians(np.asarray(longitude, dtype=np.float64))
+    lat = np.radians(np.asarray(latitude, dtype=np.float64))
+    return np.column_stack(
+        [np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)]
+    )
+
+
+##########################################################
+def chordToKilometers(chordDistance=[]):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chordDistance) / 2, 0, 1))
+
+
+##########################################################
+class StationRegistry:
+    """
+    *** Typed station coordinates (float64 lon/lat/elevation) with a KD-tree for neighbor lookups
+    """
+
+    def __init__(self, stations=[], longitude=[], latitude=[], elevation=None):
+        self.stations = list(stations)
+        self.stationIndex = {station: i for i, station in enumerate(self.stations)}
+        self.longitude = np.asarray(longitude, dtype=np.float64)
+        self.latitude = np.asarray(latitude, dtype=np.float64)
+        if elevation is None:
+            elevation = np.full(len(self.stations), np.nan)
+        self.elevation = np.asarray(elevation, dtype=np.float64)
+        self.tree = cKDTree(
+            toUnitSphere(longitude=self.longitude, latitude=self.latitude)
+        )
+
+    ######################################################
+    @classmethod
+    def fromDataFrame(cls, dfStations=None):
+        return cls(
+            stations=dfStations["City"].tolist(),
+            longitude=dfStations["Longitude"].values,
+            latitude=dfStations["Latitude"].values,
+            elevation=dfStations["Elevation"].values,
+        )
+
+    ######################################################
+    def query(self, longitude=[], latitude=[], numNeighbors=8):
+        """
+        *** (distances in km, station indices) of the numNeighbors closest stations to every point
+        """
+        numNeighbors = min(numNeighbors, len(self.stations))
+        chordDistance, indices = self.tree.query(
+            toUnitSphere(longitude=longitude, latitude=latitude), k=numNeighbors
+        )
+        if numNeighbors == 1:
+            chordDistance, indices = chordDistance[:, None], indices[:, None]
+        return chordToKilometers(chordDistance=chordDistance), indices
+
+    def signature(self):
+        digest = hashlib.sha1()
+        digest.update("\n".join(self.stations).encode("utf-8"))
+        digest.update(self.longitude.tobytes() + self.latitude.tobytes())
+        return digest.hexdigest()
+
+    def __len__(self):
+        return len(self.stations)
+
+
+##########################################################
+def getTargetGrid(registry=None, resolution=0.5, padding=0.5):
+    """
+    *** Regular lon/lat grid covering the registry's stations, returns (gridLon, gridLat) 2D arrays
+    """
+    lon = np.arange(
+        registry.longitude.min() - padding,
+        registry.longitude.max() + padding + resolution / 2,
+        resolution,
+    )
+    lat = np.arange(
+        registry.latitude.min() - padding,
+        registry.latitude.max() + padding + resolution / 2,
+        resolution,
+    )
+    return np.meshgrid(lon, lat)
+
+
+##########################################################
+class IdwInterpolator:
+    """
+    *** Inverse distance weighting onto fixed target points with the neighbor sets and weights computed once
+    *** The weights are a sparse targets x stations matrix W; for values V (timesteps x stations, NaN = missing)
+    ***   field = (V0 @ W.T) / (M @ W.T),  V0 = V with NaN -> 0,  M = 1 where V is valid
+    *** so every timestep is renormalized over the neighbors that actually reported, in one batched product
+    """
+
+    def __init__(
+        self,
+        registry=None,
+        targetLongitude=[],
+        targetLatitude=[],
+        numNeighbors=8,
+        power=2.0,
+        maxDistanceKm=None,
+    ):
+        self.registry = registry
+        self.targetShape = np.shape(targetLongitude)
+        distances, indices = registry.query(
+            longitude=np.ravel(targetLongitude),
+            latitude=np.ravel(targetLatitude),
+            numNeighbors=numNeighbors,
+        )
+        # A target sitting on a station takes that station's value
+        weights = 1.0 / np.maximum(distances, 1e-6) ** power
+        if maxDistanceKm is not None:
+            weights[distances > maxDistanceKm] = 0.0
+        numTargets = len(distances)
+        self.weights = sparse.csr_matrix(
+            (
+                weights.ravel(),
+                (np.repeat(np.arange(numTargets), indices.shape[1]), indices.ravel()),
+            ),
+            shape=(numTargets, len(registry)),
+        )
+
+    ######################################################
+    def interpolate(self, values=[]):
+        """
+        *** values: (stations,) or (timesteps x stations) in registry order -> (timesteps x *targetShape)
+        """
+        values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+        valid = ~np.isnan(values)
+        numerator = self.weights @ np.where(valid, values, 0.0).T
+        denominator = self.weights @ valid.T.astype(np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            field = np.where(denominator > 0, numerator / denominator, np.nan)
+        return field.T.reshape((len(values),) + self.targetShape)
+
+
+##########################################################
+# Interpolators keyed by (stations, grid, settings), weights are only computed the first time
+INTERPOLATOR_CACHE = {}
+
+
+def getIdwInterpolator(
+    registry=None,
+    targetLongitude=[],
+    targetLatitude=[],
+    numNeighbors=8,
+    power=2.0,
+    maxDistanceKm=None,
+):
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(targetLongitude, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(targetLatitude, dtype=np.float64).tobytes())
+    key = (
+        registry.signature(),
+        digest.hexdigest(),
+        np.shape(targetLongitude),
+        numNeighbors,
+        power,
+        maxDistanceKm,
+    )
+    if key not in INTERPOLATOR_CACHE:
+        INTERPOLATOR_CACHE[key] = IdwInterpolator(
+            registry=registry,
+            targetLongitude=targetLongitude,
+            targetLatitude=targetLatitude,
+            numNeighbors=numNeighbors,
+            power=power,
+            maxDistanceKm=maxDistanceKm,
+        )
+    return INTERPOLATOR_CACHE[key]
+
+
+##########################################################
+def mapStationVariable(weatherDataDictObjectAll={}, dfStations=None, inputData={}):
+    """
+    *** Interpolate inputData["mapVariable"] onto a lon/lat grid for the last inputData["mapHours"] hours
+    *** Returns (gridLon, gridLat, hours, field) with field shaped hours x lat x lon
+    """
+    registry = StationRegistry.fromDataFrame(dfStations=dfStations)
+    gridLon, gridLat = getTargetGrid(
+        registry=registry, resolution=inputData.get("gridResolution", 0.5)
+    )
+    interpolator = getIdwInterpolator(
+        registry=registry,
+        targetLongitude=gridLon,
+        targetLatitude=gridLat,
+        numNeighbors=inputData.get("idwNeighbors", 8),
+        power=inputData.get("idwPower", 2.0),
+    )
+    lastHour = max(
+        getUtcHours(stationData=weatherDataDictObjectAll[station]).max()
+        for station in registry.stations
+    )
+    hours = getHourRange(
+        start=lastHour - inputData.get("mapHours", 24) + 1, end=lastHour
+    )
+    values = alignStationsOnHours(
+        weatherDataDictObjectAll=weatherDataDictObjectAll,
+        stations=registry.stations,
+        variable=inputData.get("mapVariable", "T_HR_AVG"),
+        hours=hours,
+    )
+    return gridLon, gridLat, hours, interpolator.interpolate(values=values)
+
+
+##########################################################
+def generateInterpolatedMapPlot(
+    gridLon=[], gridLat=[], field=[], dfStations=None, title="", outFileName=""
+):
+    import matplotlib.pyplot as plt
+
+    ######################################################
+    plt.figure(figsize=(14, 8))
+    mesh = plt.pcolormesh(gridLon, gridLat, field, cmap="coolwarm", shading="auto")
+    plt.colorbar(mesh, label=title, shrink=0.8, aspect=30)
+    plt.scatter(
+        dfStations["Longitude"].values,
+        dfStations["Latitude"].values,
+        s=10,
+        c="black",
+        alpha=0.6,
+    )
+    plt.xlabel("Longitude (°W)", fontsize=12, fontweight="bold")
+    plt.ylabel("Latitude (°N)", fontsize=12, fontweight="bold")
+    plt.title(title, fontsize=14, fontweight="bold", pad=20)
+    plt.tight_layout()
+    plt.savefig(outFileName, dpi=150, bbox_inches="tight")
+    plt.close()
+    ######################################################
+
+
+##########################################################
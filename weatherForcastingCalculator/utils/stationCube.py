@@ -0,0 +1,242 @@
+##########################################################
+import numpy as np
+import xarray as xr
+from utils.timeIndex import getStationHourOffsets
+from utils.stationFileParser import HOURLY02_MEASUREMENT_COLUMNS
+
+CUBE_TITLE = "USCRN hourly02 stations on a common hourly UTC axis"
+
+
+##########################################################
+def getCubeStations(weatherDataDictObjectAll={}, dfStations=None):
+    """
+    *** Stations of the cube: dfStations order when given (continental stations), otherwise all of them
+    """
+    if dfStations is None:
+        return list(weatherDataDictObjectAll.keys())
+    return [
+        station
+        for station in dfStations["City"].tolist()
+        if station in weatherDataDictObjectAll
+    ]
+
+
+##########################################################
+def alignVariable(
+    weatherDataDictObjectAll={},
+    stations=[],
+    variable="",
+    rowOffsets=[],
+    numHours=0,
+    dtype=np.float64,
+):
+    """
+    *** station x time matrix of one variable (NaN where a station has no row for that hour)
+    """
+    matrix = np.full((len(stations), numHours), np.nan, dtype=dtype)
+    for j, (station, (offsets, inRange)) in enumerate(zip(stations, rowOffsets)):
+        values = np.asarray(weatherDataDictObjectAll[station][variable])
+        matrix[j, offsets] = values[inRange]
+    return matrix
+
+
+##########################################################
+def getFirstValue(values=None):
+    if values is None or len(values) == 0:
+        return np.nan
+    return np.asarray(values[:1], dtype=np.float64)[0]
+
+
+def getCubeCoordinates(
+    weatherDataDictObjectAll={}, stations=[], dfStations=None, hours=None
+):
+    """
+    *** Typed coordinates: station labels, datetime64 time axis and float64 lon/lat/elevation per station
+    """
+    if dfStations is not None:
+        dfInfo = dfStations.set_index("City").reindex(stations)
+        longitude = dfInfo["Longitude"].to_numpy(dtype=np.float64)
+        latitude = dfInfo["Latitude"].to_numpy(dtype=np.float64)
+        elevation = dfInfo["Elevation"].to_numpy(dtype=np.float64)
+    else:
+        # Coordinates as recorded in the station files (NaN when a station has no rows)
+        longitude, latitude = [
+            np.array(
+                [
+                    getFirstValue(values=weatherDataDictObjectAll[station].get(column))
+                    for station in stations
+                ],
+                dtype=np.float64,
+            )
+            for column in ["LONGITUDE", "LATITUDE"]
+        ]
+        elevation = np.full(len(stations), np.nan)
+    return {
+        "station": ("station", np.array(stations, dtype=str)),
+        "time": ("time", hours.astype("datetime64[ns]")),
+        "longitude": ("station", longitude, {"units": "degrees_east"}),
+        "latitude": ("station", latitude, {"units": "degrees_north"}),
+        "elevation": ("station", elevation),
+    }
+
+
+def getCubeVariables(weatherDataDictObjectAll={}, stations=[]):
+    firstStation = weatherDataDictObjectAll[stations[0]] if stations else {}
+    return [column for column in HOURLY02_MEASUREMENT_COLUMNS if column in firstStation]
+
+
+##########################################################
+def buildStationCube(
+    weatherDataDictObjectAll={},
+    dfStations=None,
+    variables=None,
+    start=None,
+    end=None,
+    dtype=np.float64,
+):
+    """
+    *** In-memory xarray.Dataset with one (station, time) data variable per measurement
+    *** (dataset.to_array("variable") gives the station x time x variable cube)
+    """
+    stations = getCubeStations(
+        weatherDataDictObjectAll=weatherDataDictObjectAll, dfStations=dfStations
+    )
+    if variables is None:
+        variables = getCubeVariables(
+            weatherDataDictObjectAll=weatherDataDictObjectAll, stations=stations
+        )
+    hours, rowOffsets = getStationHourOffsets(
+        weatherDataDictObjectAll=weatherDataDictObjectAll,
+        stations=stations,
+        start=start,
+        end=end,
+    )
+    dataVars = {
+        variable: (
+            ("station", "time"),
+            alignVariable(
+                weatherDataDictObjectAll=weatherDataDictObjectAll,
+                stations=stations,
+                variable=variable,
+                rowOffsets=rowOffsets,
+                numHours=len(hours),
+                dtype=dtype,
+            ),
+        )
+        for variable in variables
+    }
+    return xr.Dataset(
+        data_vars=dataVars,
+        coords=getCubeCoordinates(
+            weatherDataDictObjectAll=weatherDataDictObjectAll,
+            stations=stations,
+            dfStations=dfStations,
+            hours=hours,
+        ),
+        attrs={"title": CUBE_TITLE},
+    )
+
+
+##########################################################
+def getCubeEncoding(
+    numStations=0,
+    numHours=0,
+    chunkStations=16,
+    chunkHours=24 * 30,
+    complevel=4,
+    dtype="float32",
+):
+    """
+    *** zlib + shuffle compressed (station, time) chunks; a reader only decompresses the chunks it touches
+    """
+    return {
+        "zlib": True,
+        "shuffle": True,
+        "complevel": complevel,
+        "dtype": dtype,
+        "_FillValue": np.nan,
+        "chunksizes": (
+            max(1, min(chunkStations, numStations)),
+            max(1, min(chunkHours, numHours)),
+        ),
+    }
+
+
+##########################################################
+def writeStationCube(
+    weatherDataDictObjectAll={},
+    dfStations=None,
+    outFileName="",
+    variables=None,
+    start=None,
+    end=None,
+    chunkStations=16,
+    chunkHours=24 * 30,
+    complevel=4,
+    dtype="float32",
+):
+    """
+    *** Write the aligned cube to a compressed, chunked NetCDF file one variable at a time,
+    *** so only one station x time matrix is held in memory however many variables there are
+    """
+    stations = getCubeStations(
+        weatherDataDictObjectAll=weatherDataDictObjectAll, dfStations=dfStations
+    )
+    if variables is None:
+        variables = getCubeVariables(
+            weatherDataDictObjectAll=weatherDataDictObjectAll, stations=stations
+        )
+    hours, rowOffsets = getStationHourOffsets(
+        weatherDataDictObjectAll=weatherDataDictObjectAll,
+        stations=stations,
+        start=start,
+        end=end,
+    )
+    coords = getCubeCoordinates(
+        weatherDataDictObjectAll=weatherDataDictObjectAll,
+        stations=stations,
+        dfStations=dfStations,
+        hours=hours,
+    )
+    encoding = getCubeEncoding(
+        numStations=len(stations),
+        numHours=len(hours),
+        chunkStations=chunkStations,
+        chunkHours=chunkHours,
+        complevel=complevel,
+        dtype=dtype,
+    )
+    xr.Dataset(coords=coords, attrs={"title": CUBE_TITLE}).to_netcdf(
+        outFileName,
+        mode="w",
+        engine="netcdf4",
+        encoding={"time": {"units": "hours since 1970-01-01", "dtype": "int32"}},
+    )
+    for variable in variables:
+        matrix = alignVariable(
+            weatherDataDictObjectAll=weatherDataDictObjectAll,
+            stations=stations,
+            variable=variable,
+            rowOffsets=rowOffsets,
+            numHours=len(hours),
+        )
+        # Dimensions and coordinates are already in the file, only the new variable is added
+        xr.Dataset(data_vars={variable: (("station", "time"), matrix)}).to_netcdf(
+            outFileName,
+            mode="a",
+            engine="netcdf4",
+            encoding={variable: encoding},
+        )
+    return outFileName
+
+
+##########################################################
+def openStationCube(fileName="", chunks=None):
+    """
+    *** Lazy handle on a written cube: nothing is read until values are indexed, and then only the
+    *** chunks covering the selection (chunks={...} hands the variables to dask when it is installed)
+    """
+    return xr.open_dataset(fileName, engine="netcdf4", chunks=chunks)
+
+
+##########################################################
@@ -0,0 +1,238 @@
+##########################################################
+import io
+import numpy as np
+import pandas as pd
+
+
+##########################################################
+NCEI_HOURLY02_URL = "https://www.ncei.noaa.gov/pub/data/uscrn/products/hourly02/"
+NCEI_SUBHOURLY01_URL = "https://www.ncei.noaa.gov/pub/data/uscrn/products/subhourly01/"
+
+##########################################################
+# Fixed 38-column layout of the USCRN hourly02 station files, with the typed
+# dtype each column is parsed into (see Data/weatherDataColumnInfo.xlsx)
+HOURLY02_COLUMN_DTYPES = {
+    "WBANNO": np.int32,
+    "UTC_DATE": np.int32,
+    "UTC_TIME": np.int16,
+    "LST_DATE": np.int32,
+    "LST_TIME": np.int16,
+    "CRX_VN": str,  # datalogger version, should be treated as text
+    "LONGITUDE": np.float64,
+    "LATITUDE": np.float64,
+    "T_CALC": np.float64,
+    "T_HR_AVG": np.float64,
+    "T_MAX": np.float64,
+    "T_MIN": np.float64,
+    "P_CALC": np.float64,
+    "SOLARAD": np.float64,
+    "SOLARAD_FLAG": np.int8,
+    "SOLARAD_MAX": np.float64,
+    "SOLARAD_MAX_FLAG": np.int8,
+    "SOLARAD_MIN": np.float64,
+    "SOLARAD_MIN_FLAG": np.int8,
+    "SUR_TEMP_TYPE": str,  # 'R', 'C' or 'U'
+    "SUR_TEMP": np.float64,
+    "SUR_TEMP_FLAG": np.int8,
+    "SUR_TEMP_MAX": np.float64,
+    "SUR_TEMP_MAX_FLAG": np.int8,
+    "SUR_TEMP_MIN": np.float64,
+    "SUR_TEMP_MIN_FLAG": np.int8,
+    "RH_HR_AVG": np.float64,
+    "RH_HR_AVG_FLAG": np.int8,
+    "SOIL_MOISTURE_5": np.float64,
+    "SOIL_MOISTURE_10": np.float64,
+    "SOIL_MOISTURE_20": np.float64,
+    "SOIL_MOISTURE_50": np.float64,
+    "SOIL_MOISTURE_100": np.float64,
+    "SOIL_TEMP_5": np.float64,
+    "SOIL_TEMP_10": np.float64,
+    "SOIL_TEMP_20": np.float64,
+    "SOIL_TEMP_50": np.float64,
+    "SOIL_TEMP_100": np.float64,
+}
+HOURLY02_COLUMNS = list(HOURLY02_COLUMN_DTYPES.keys())
+# Measurement column -> the QC flag column that qualifies it (0 = good, 3 = erroneous)
+HOURLY02_FLAG_COLUMNS = {
+    "SOLARAD": "SOLARAD_FLAG",
+    "SOLARAD_MAX": "SOLARAD_MAX_FLAG",
+    "SOLARAD_MIN": "SOLARAD_MIN_FLAG",
+    "SUR_TEMP": "SUR_TEMP_FLAG",
+    "SUR_TEMP_MAX": "SUR_TEMP_MAX_FLAG",
+    "SUR_TEMP_MIN": "SUR_TEMP_MIN_FLAG",
+    "RH_HR_AVG": "RH_HR_AVG_FLAG",
+}
+# Numeric weather measurements (everything after the station id/time/location columns except flags and text)
+HOURLY02_MEASUREMENT_COLUMNS = [
+    column
+    for column in HOURLY02_COLUMNS[8:]
+    if HOURLY02_COLUMN_DTYPES[column] == np.float64
+]
+
+##########################################################
+# 23-column layout of the USCRN subhourly01 (5-minute) station files, about 12x the rows of hourly02
+SUBHOURLY01_COLUMN_DTYPES = {
+    "WBANNO": np.int32,
+    "UTC_DATE": np.int32,
+    "UTC_TIME": np.int16,
+    "LST_DATE": np.int32,
+    "LST_TIME": np.int16,
+    "CRX_VN": str,
+    "LONGITUDE": np.float64,
+    "LATITUDE": np.float64,
+    "AIR_TEMPERATURE": np.float64,
+    "PRECIPITATION": np.float64,
+    "SOLAR_RADIATION": np.float64,
+    "SR_FLAG": np.int8,
+    "SURFACE_TEMPERATURE": np.float64,
+    "ST_TYPE": str,  # 'R', 'C' or 'U'
+    "ST_FLAG": np.int8,
+    "RELATIVE_HUMIDITY": np.float64,
+    "RH_FLAG": np.int8,
+    "SOIL_MOISTURE_5": np.float64,
+    "SOIL_TEMPERATURE_5": np.float64,
+    "WETNESS": np.float64,
+    "WET_FLAG": np.int8,
+    "WIND_1_5": np.float64,
+    "WIND_FLAG": np.int8,
+}
+SUBHOURLY01_FLAG_COLUMNS = {
+    "SOLAR_RADIATION": "SR_FLAG",
+    "SURFACE_TEMPERATURE": "ST_FLAG",
+    "RELATIVE_HUMIDITY": "RH_FLAG",
+    "WETNESS": "WET_FLAG",
+    "WIND_1_5": "WIND_FLAG",
+}
+
+##########################################################
+# Everything the ingest needs to know about a product: where it lives, its column layout and QC flags
+PRODUCT_SCHEMAS = {
+    "hourly02": {
+        "url": NCEI_HOURLY02_URL,
+        "columnDtypes": HOURLY02_COLUMN_DTYPES,
+        "flagColumns": HOURLY02_FLAG_COLUMNS,
+    },
+    "subhourly01": {
+        "url": NCEI_SUBHOURLY01_URL,
+        "columnDtypes": SUBHOURLY01_COLUMN_DTYPES,
+        "flagColumns": SUBHOURLY01_FLAG_COLUMNS,
+    },
+}
+for schema in PRODUCT_SCHEMAS.values():
+    schema["columns"] = list(schema["columnDtypes"].keys())
+    schema["measurementColumns"] = [
+        column
+        for column in schema["columns"][8:]
+        if schema["columnDtypes"][column] == np.float64
+    ]
+# Measurement -> flag column and measurement columns over all products (column names do not collide
+# between products, so a store of either product finds its own columns here)
+PRODUCT_FLAG_COLUMNS = {
+    column: flagColumn
+    for schema in PRODUCT_SCHEMAS.values()
+    for column, flagColumn in schema["flagColumns"].items()
+}
+PRODUCT_MEASUREMENT_COLUMNS = list(
+    dict.fromkeys(
+        column
+        for schema in PRODUCT_SCHEMAS.values()
+        for column in schema["measurementColumns"]
+    )
+)
+
+
+##########################################################
+def getProductSchema(product="hourly02"):
+    if product not in PRODUCT_SCHEMAS:
+        raise ValueError(
+            f"Unknown product {product}, expected one of {list(PRODUCT_SCHEMAS)}"
+        )
+    return PRODUCT_SCHEMAS[product]
+
+
+##########################################################
+def getStationLabel(stationFile="", year=""):
+    """
+    *** Station label used as dictionary key, e.g. CRNH0203-2020-TX_Austin_33_NW.txt -> TX_Austin_33_NW
+    *** (CRNS0101-05-2020-TX_Austin_33_NW.txt of subhourly01 gives the same label)
+    """
+    stationLabel = stationFile.replace(".txt", "").split(f"-{year}-", 1)[-1]
+    if len(stationLabel) > 31:
+        stationLabel = stationLabel[:31]
+    return stationLabel
+
+
+##########################################################
+def getUtcTimestamps(stationData={}):
+    """
+    *** Sortable int64 UTC stamps YYYYMMDDHHMM built from the UTC_DATE and UTC_TIME columns
+    """
+    utcDate = np.asarray(stationData["UTC_DATE"]).astype(np.int64)
+    utcTime = np.asarray(stationData["UTC_TIME"]).astype(np.int64)
+    return utcDate * 10000 + utcTime
+
+
+##########################################################
+def getEmptyColumns(product="hourly02"):
+    return {
+        col: np.array([], dtype=dtype if dtype is not str else "U1")
+        for col, dtype in getProductSchema(product=product)["columnDtypes"].items()
+    }
+
+
+def toTypedColumns(dfTemp=None, product="hourly02"):
+    stationData = {}
+    for col, dtype in getProductSchema(product=product)["columnDtypes"].items():
+        if dtype is str:
+            stationData[col] = dfTemp[col].to_numpy().astype(str)
+        else:
+            stationData[col] = dfTemp[col].to_numpy()
+    return stationData
+
+
+def getReadCsvOptions(product="hourly02"):
+    schema = getProductSchema(product=product)
+    return {
+        "sep": r"\s+",
+        "header": None,
+        "names": schema["columns"],
+        "dtype": schema["columnDtypes"],
+        "engine": "c",
+        "na_filter": False,
+    }
+
+
+##########################################################
+def parseStationBytes(rawBytes=b"", product="hourly02"):
+    """
+    *** Parse the raw bytes of one station file of a product straight into typed numpy columns
+    *** Whitespace separated fixed layout, so no HTML parsing or python level splitting is needed
+    """
+    if not rawBytes or not rawBytes.strip():
+        return getEmptyColumns(product=product)
+    dfTemp = pd.read_csv(io.BytesIO(rawBytes), **getReadCsvOptions(product=product))
+    return toTypedColumns(dfTemp=dfTemp, product=product)
+
+
+def parseHourly02Bytes(rawBytes=b""):
+    return parseStationBytes(rawBytes=rawBytes, product="hourly02")
+
+
+##########################################################
+def iterStationFileChunks(filePath="", product="hourly02", chunkRows=100000):
+    """
+    *** Parse a station file on disk in chunks of at most chunkRows rows, yielding typed columns per chunk
+    *** Only one chunk is held in memory at a time, however large the file is
+    """
+    try:
+        reader = pd.read_csv(
+            filePath, chunksize=chunkRows, **getReadCsvOptions(product=product)
+        )
+    except pd.errors.EmptyDataError:  # empty (or whitespace only) file
+        return
+    with reader:
+        for dfTemp in reader:
+            yield toTypedColumns(dfTemp=dfTemp, product=product)
+
+
+##########################################################
@@ -0,0 +1,176 @@
+##########################################################
+import os
+import numpy as np
+import pandas as pd
+from collections.abc import Mapping
+from utils.stationFileParser import PRODUCT_FLAG_COLUMNS
+
+
+##########################################################
+# Compact in-memory dtype per hourly02/subhourly01 column (descriptions live in Data/weatherDataColumnInfo.xlsx)
+#   measurement -> float32 (NaN for missing), date/time -> int32/int16, flag -> uint8,
+#   categorical -> uint8 codes into a small table of categories
+INTEGER_FILL_VALUE = -1
+FLAG_FILL_VALUE = 255
+STATION_TABLE_SCHEMA = {
+    "WBANNO": {"kind": "integer", "dtype": np.int32},
+    "UTC_DATE": {"kind": "integer", "dtype": np.int32},
+    "UTC_TIME": {"kind": "integer", "dtype": np.int16},
+    "LST_DATE": {"kind": "integer", "dtype": np.int32},
+    "LST_TIME": {"kind": "integer", "dtype": np.int16},
+    "CRX_VN": {"kind": "categorical", "dtype": np.uint8},
+    "SUR_TEMP_TYPE": {"kind": "categorical", "dtype": np.uint8},
+    "ST_TYPE": {"kind": "categorical", "dtype": np.uint8},
+}
+for flagColumn in PRODUCT_FLAG_COLUMNS.values():
+    STATION_TABLE_SCHEMA[flagColumn] = {"kind": "flag", "dtype": np.uint8}
+DEFAULT_COLUMN_SCHEMA = {"kind": "measurement", "dtype": np.float32}
+
+
+##########################################################
+def getColumnSchema(column="", schema=STATION_TABLE_SCHEMA):
+    return schema.get(column, DEFAULT_COLUMN_SCHEMA)
+
+
+##########################################################
+def loadColumnDescriptions(dirname=""):
+    """
+    *** Column descriptions from Data/weatherDataColumnInfo.xlsx ({} if the sheet is not there)
+    """
+    filePath = dirname + "/Data/weatherDataColumnInfo.xlsx"
+    if not os.path.exists(filePath):
+        return {}
+    dfInfo = pd.read_excel(filePath).dropna()
+    return dict(zip(dfInfo["Variable"], dfInfo["Description"]))
+
+
+##########################################################
+def toCompactValues(values=[], columnSchema={}):
+    """
+    *** Cast one station column into the compact dtype of its schema entry
+    """
+    values = np.asarray(values).flatten()
+    if columnSchema["kind"] == "measurement":
+        return values.astype(np.float32)
+    values = values.astype(np.float64)
+    fillValue = (
+        FLAG_FILL_VALUE if columnSchema["kind"] == "flag" else INTEGER_FILL_VALUE
+    )
+    return np.where(np.isnan(values), fillValue, values).astype(columnSchema["dtype"])
+
+
+##########################################################
+class StationTableView(Mapping):
+    """
+    *** Dict-style access to one station: numeric columns are views into the shared buffers
+    """
+
+    def __init__(self, table=None, start=0, end=0):
+        self.table = table
+        self.start = start
+        self.end = end
+
+    def __getitem__(self, column):
+        values = self.table.buffers[column][self.start : self.end]
+        if column in self.table.categories:
+            return self.table.categories[column][values]
+        return values
+
+    def __iter__(self):
+        return iter(self.table.buffers)
+
+    def __len__(self):
+        return len(self.table.buffers)
+
+
+##########################################################
+class StationTable(Mapping):
+    """
+    *** All stations of the cleaned data in one contiguous buffer per column plus row offsets per station
+    *** Keeps the {station: {column: array}} access pattern, table[station][column] is a slice of the buffer
+    """
+
+    def __init__(self, stations=[], offsets=[], buffers={}, categories={}, schema={}):
+        self.stations = list(stations)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.stationIndex = {station: i for i, station in enumerate(self.stations)}
+        self.buffers = buffers
+        self.categories = categories
+        self.schema = schema
+
+    ######################################################
+    @classmethod
+    def fromStationDict(cls, weatherDataDictObjectAll={}, schema=STATION_TABLE_SCHEMA):
+        stations = list(weatherDataDictObjectAll.keys())
+        columns = list(weatherDataDictObjectAll[stations[0]].keys()) if stations else []
+        lengths = [len(weatherDataDictObjectAll[s][columns[0]]) for s in stations]
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        buffers = {}
+        categories = {}
+        tableSchema = {}
+        for column in columns:
+            columnSchema = getColumnSchema(column=column, schema=schema)
+            if columnSchema["kind"] == "measurement":
+                try:
+                    np.asarray(weatherDataDictObjectAll[stations[0]][column][:1], float)
+                except ValueError:  # text column without a schema entry
+                    columnSchema = {"kind": "categorical", "dtype": np.uint8}
+            tableSchema[column] = columnSchema
+            if columnSchema["kind"] == "categorical":
+                allValues = np.concatenate(
+                    [
+                        np.asarray(weatherDataDictObjectAll[s][column]).astype(str)
+                        for s in stations
+                    ]
+                )
+                categories[column], codes = np.unique(allValues, return_inverse=True)
+                codeDtype = np.uint8 if len(categories[column]) <= 256 else np.uint16
+                buffers[column] = codes.astype(codeDtype)
+                continue
+            buffers[column] = np.empty(offsets[-1], dtype=columnSchema["dtype"])
+            for i, station in enumerate(stations):
+                buffers[column][offsets[i] : offsets[i + 1]] = toCompactValues(
+                    values=weatherDataDictObjectAll[station][column],
+                    columnSchema=columnSchema,
+                )
+        return cls(
+            stations=stations,
+            offsets=offsets,
+            buffers=buffers,
+            categories=categories,
+            schema=tableSchema,
+        )
+
+    ######################################################
+    def stationSlice(self, station=""):
+        i = self.stationIndex[station]
+        return slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    def column(self, column=""):
+        """
+        *** Full buffer of one column across all stations (use offsets to split by station)
+        """
+        return self.buffers[column]
+
+    @property
+    def nbytes(self):
+        return sum(buffer.nbytes for buffer in self.buffers.values())
+
+    def toStationDict(self):
+        return {station: dict(self[station]) for station in self.stations}
+
+    ######################################################
+    def __getitem__(self, station):
+        stationSlice = self.stationSlice(station=station)
+        return StationTableView(
+            table=self, start=stationSlice.start, end=stationSlice.stop
+        )
+
+    def __iter__(self):
+        return iter(self.stations)
+
+    def __len__(self):
+        return len(self.stations)
+
+
+##########################################################
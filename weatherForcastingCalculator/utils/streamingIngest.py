@@ -0,0 +1,273 @@
+##########################################################
+"""
+Bounded-memory ingest for large products (subhourly01 has about 12x the rows of hourly02): station files
+are streamed to disk, parsed in chunks of streamChunkRows rows and every cleaned chunk is appended straight
+to Data/weatherDataStore. Peak memory is about batchSize x streamChunkRows rows, whatever the number of
+stations and years, and nothing is stacked in memory
+"""
+import os
+import random
+import shutil
+import asyncio
+from utils.columnarStore import (
+    appendToColumnarStore,
+    openColumnarStore,
+    replaceStoreDir,
+    writeColumnarStore,
+    writeManifest,
+)
+from utils.dataCleaning import (
+    ELEVATION_SERVICE_URL,
+    cleanStationColumns,
+    getElevationAndDataFrameOfDesiredWeatherStations,
+)
+from utils.dataPrepAndParser import (
+    fetchYearListing,
+    getNceiBaseUrl,
+    getRetryPolicy,
+    getStationFileUrl,
+    isRetryableStatus,
+)
+from utils.httpCache import getHttpCache
+from utils.ingestPlan import buildIngestPlan, formatIngestPlanReport
+from utils.metrics import getPipelineMetrics
+from utils.stationFileParser import getStationLabel, iterStationFileChunks
+
+
+##########################################################
+async def downloadToFile(session="", url="", filePath="", blockSize=1 << 16):
+    """
+    *** Stream the body of url into filePath block by block, returns the HTTP status (200 = the whole
+    *** body arrived)
+    """
+    async with session.get(url) as response:
+        if response.status != 200:
+            print("Failed to fetch:", url)
+            print("Status:", response.status)
+            return response.status
+        with open(filePath + ".tmp", "wb") as f:
+            async for block in response.content.iter_chunked(blockSize):
+                f.write(block)
+    os.replace(filePath + ".tmp", filePath)
+    return response.status
+
+
+##########################################################
+async def fetchStationFileToDisk(
+    session="", url="", spoolPath="", cache=None, retryPolicy={}
+):
+    """
+    *** Path of the station file on disk: the cached payload when an HttpCache is given, otherwise
+    *** spoolPath (the caller removes it after parsing); None when every attempt failed
+    """
+    import aiohttp
+
+    maxRetries = retryPolicy.get("maxRetries", 0)
+    if cache is not None and cache.offline:
+        maxRetries = 0
+    metrics = getPipelineMetrics()
+    for attempt in range(maxRetries + 1):
+        try:
+            with metrics.trackConcurrency("requestsInFlight"):
+                if cache is not None:
+                    status, filePath = await cache.fetchToFileWithStatus(
+                        session=session, url=url
+                    )
+                else:
+                    status = await downloadToFile(
+                        session=session, url=url, filePath=spoolPath
+                    )
+                    filePath = spoolPath if status == 200 else None
+            if filePath is not None:
+                metrics.incrementCounter("bytesFetched", os.path.getsize(filePath))
+                return filePath
+            if not isRetryableStatus(status=status):
+                return
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Error fetching {url}: {e!r}")
+        if attempt < maxRetries:
+            metrics.incrementCounter("fetchRetries")
+            delay = retryPolicy.get("retryBaseDelay", 1.0) * 2**attempt
+            await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+            print(f"Retrying ({attempt + 1}/{maxRetries}):", url)
+    return
+
+
+##########################################################
+def appendStationFileChunks(
+    filePath="",
+    storeDir="",
+    manifest={},
+    station="",
+    product="hourly02",
+    chunkRows=100000,
+    useQcFlags=True,
+):
+    """
+    *** Parse one station file chunk by chunk, clean each chunk and append it to the station's columns
+    *** Returns the number of rows appended; the manifest is saved by the caller
+    """
+    numRows = 0
+    for stationData in iterStationFileChunks(
+        filePath=filePath, product=product, chunkRows=chunkRows
+    ):
+        stationData = cleanStationColumns(
+            stationDict=stationData, useQcFlags=useQcFlags
+        )
+        appendToColumnarStore(
+            storeDir=storeDir,
+            newData={station: stationData},
+            manifest=manifest,
+            saveManifest=False,
+        )
+        numRows += len(stationData["UTC_DATE"])
+    return numRows
+
+
+##########################################################
+def dropIncompleteStations(storeDir="", manifest={}, failedStations=set()):
+    """
+    *** Remove stations with a failed file or without any rows, like stacking drops stations missing a year
+    """
+    dropped = []
+    for station, stationInfo in list(manifest["stations"].items()):
+        lengths = [info["length"] for info in stationInfo["columns"].values()]
+        if station in failedStations or not lengths or max(lengths) == 0:
+            shutil.rmtree(
+                os.path.join(storeDir, stationInfo["dir"]), ignore_errors=True
+            )
+            del manifest["stations"][station]
+            dropped.append(station)
+    return dropped
+
+
+##########################################################
+async def streamIngestToStore(inputData={}, dirname="", storeDir=""):
+    """
+    *** Plan the common stations from the year listings, then year by year download their files
+    *** (batchSize in flight) and append them chunk by chunk to a new store, which replaces storeDir
+    *** once every year is in; years are appended in order, so each station's rows stay chronological
+    *** Returns the memory-mapped store and the station table
+    """
+    import aiohttp
+
+    product = inputData.get("product", "hourly02")
+    chunkRows = inputData.get("streamChunkRows", 100000)
+    useQcFlags = inputData.get("useQcFlags", 1) == 1
+    years = [str(year) for year in inputData["idealDates"]]
+    cache = getHttpCache(inputData=inputData, dirname=dirname)
+    retryPolicy = getRetryPolicy(inputData=inputData)
+    baseUrl = getNceiBaseUrl(inputData=inputData)
+    metrics = getPipelineMetrics()
+    ######################################################
+    partialDir = storeDir + ".partial"
+    spoolDir = dirname + "/Data/ingestSpool"
+    shutil.rmtree(partialDir, ignore_errors=True)
+    os.makedirs(spoolDir, exist_ok=True)
+    semaphore = asyncio.Semaphore(inputData.get("batchSize", 20))
+    failedStations = set()
+
+    async def ingestStationFile(session, manifest, year, stationFile):
+        station = getStationLabel(stationFile=stationFile, year=year)
+        if station in failedStations:
+            return 0  # dropped anyway, no need to download its later years
+        url = getStationFileUrl(year=year, stationFile=stationFile, baseUrl=baseUrl)
+        spoolPath = os.path.join(spoolDir, f"{year}-{stationFile}")
+        async with semaphore:
+            with metrics.stage("stationFetch"):
+                filePath = await fetchStationFileToDisk(
+                    session=session,
+                    url=url,
+                    spoolPath=spoolPath,
+                    cache=cache,
+                    retryPolicy=retryPolicy,
+                )
+            if filePath is None:
+                failedStations.add(station)
+                return 0
+            try:
+                # Parsing runs in a thread so downloads keep flowing; every task appends to its own station
+                with metrics.stage("parse"):
+                    numRows = await asyncio.to_thread(
+                        appendStationFileChunks,
+                        filePath=filePath,
+                        storeDir=partialDir,
+                        manifest=manifest,
+                        station=station,
+                        product=product,
+                        chunkRows=chunkRows,
+                        useQcFlags=useQcFlags,
+                    )
+            except Exception as e:
+                print(f"Exception processing station {stationFile} in year {year}: {e}")
+                failedStations.add(station)
+                numRows = 0
+            finally:
+                if filePath == spoolPath:
+                    os.remove(spoolPath)
+        metrics.incrementCounter("stationsParsed")
+        metrics.incrementCounter("rowsParsed", numRows)
+        return numRows
+
+    ######################################################
+    async with aiohttp.ClientSession() as session:
+        listings = await asyncio.gather(
+            *[
+                fetchYearListing(
+                    session=session,
+                    year=year,
+                    cache=cache,
+                    retryPolicy=retryPolicy,
+                    baseUrl=baseUrl,
+                )
+                for year in years
+            ]
+        )
+        plan = buildIngestPlan(listings=dict(zip(years, listings)))
+        print(formatIngestPlanReport(plan=plan))
+        # Every planned station is registered up front, so the store order does not depend on timing
+        manifest = writeColumnarStore(
+            data={station: {} for station in plan["commonStations"]},
+            storeDir=partialDir,
+        )
+        manifest["product"] = product
+        for year in years:
+            stationFiles = [
+                stationFile for jobYear, stationFile in plan["jobs"] if jobYear == year
+            ]
+            rows = await asyncio.gather(
+                *[
+                    ingestStationFile(session, manifest, year, stationFile)
+                    for stationFile in stationFiles
+                ]
+            )
+            writeManifest(storeDir=partialDir, manifest=manifest)
+            print(
+                f"Completed streaming year {year}: {sum(rows)} rows from {len(stationFiles)} station files"
+            )
+    ######################################################
+    dropped = dropIncompleteStations(
+        storeDir=partialDir, manifest=manifest, failedStations=failedStations
+    )
+    if dropped:
+        print(f"Dropped {len(dropped)} stations with failed or empty files:", dropped)
+    writeManifest(storeDir=partialDir, manifest=manifest)
+    if not manifest["stations"]:
+        raise RuntimeError(
+            f"No station was ingested, keeping the previous store in {storeDir}"
+        )
+    # The previous store stays usable until the new one is complete
+    replaceStoreDir(partialDir=partialDir, storeDir=storeDir)
+    if cache is not None:
+        print("HTTP cache stats:", cache.stats)
+    store = openColumnarStore(storeDir=storeDir)
+    dfStations = getElevationAndDataFrameOfDesiredWeatherStations(
+        weatherDataDictObjectAll=store,
+        dirname=dirname,
+        elevationServiceUrl=inputData.get("elevationServiceUrl", ELEVATION_SERVICE_URL),
+    )
+    print(f"Streamed {len(store)} stations into {storeDir}")
+    return store, dfStations
+
+
+##########################################################
@@ -0,0 +1,74 @@
+##########################################################
+import numpy as np
+
+
+##########################################################
+def getUtcHours(stationData={}):
+    """
+    *** UTC hour of every row as datetime64[h], built arithmetically from the UTC_DATE (YYYYMMDD)
+    *** and UTC_TIME (HHMM) columns without any string formatting
+    """
+    utcDate = np.asarray(stationData["UTC_DATE"]).astype(np.int64)
+    utcTime = np.asarray(stationData["UTC_TIME"]).astype(np.int64)
+    months = (utcDate // 10000 - 1970) * 12 + (utcDate // 100) % 100 - 1
+    days = months.astype("datetime64[M]").astype("datetime64[D]") + (utcDate % 100 - 1)
+    return days.astype("datetime64[h]") + utcTime // 100
+
+
+##########################################################
+def getHourRange(start=None, end=None):
+    """
+    *** Inclusive hourly axis between two datetime64 (or ISO string) stamps
+    """
+    start = np.datetime64(start, "h")
+    end = np.datetime64(end, "h")
+    return np.arange(start, end + 1, dtype="datetime64[h]")
+
+
+##########################################################
+def alignStationsOnHours(
+    weatherDataDictObjectAll={}, stations=[], variable="", hours=None
+):
+    """
+    *** hours x stations float64 matrix of one variable on a common hourly axis (NaN where a station
+    *** has no row for that hour). Rows are placed by integer hour offset, no per-row lookups
+    """
+    hours = np.asarray(hours, dtype="datetime64[h]")
+    matrix = np.full((len(hours), len(stations)), np.nan)
+    if len(hours) == 0:
+        return matrix
+    for j, station in enumerate(stations):
+        stationData = weatherDataDictObjectAll[station]
+        offsets = (getUtcHours(stationData=stationData) - hours[0]).astype(np.int64)
+        inRange = (offsets >= 0) & (offsets < len(hours))
+        matrix[offsets[inRange], j] = np.asarray(stationData[variable])[inRange]
+    return matrix
+
+
+##########################################################
+def getStationHourOffsets(
+    weatherDataDictObjectAll={}, stations=[], start=None, end=None
+):
+    """
+    *** Shared hourly axis (first to last hour over all stations unless start/end are given) and the
+    *** row -> axis position of every station, computed once and reused for every variable
+    """
+    stationHours = [
+        getUtcHours(stationData=weatherDataDictObjectAll[station])
+        for station in stations
+    ]
+    nonEmpty = [hours for hours in stationHours if len(hours)]
+    if start is None:
+        start = min(hours.min() for hours in nonEmpty)
+    if end is None:
+        end = max(hours.max() for hours in nonEmpty)
+    hours = getHourRange(start=start, end=end)
+    rowOffsets = []
+    for stationHour in stationHours:
+        offsets = (stationHour - hours[0]).astype(np.int64)
+        inRange = (offsets >= 0) & (offsets < len(hours))
+        rowOffsets.append((offsets[inRange], inRange))
+    return hours, rowOffsets
+
+
+##########################################################
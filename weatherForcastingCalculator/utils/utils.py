@@ -1,6 +1,9 @@
 ##########################################################
+import os
+import re
 import json
 import numpy as np
+from collections.abc import Mapping
 
 
 ##########################################################
@@ -18,22 +21,255 @@ class NumpyEncoder(json.JSONEncoder):
 
 
 ##########################################################
-def writeToJson(data="", outFileName=""):
-    jsonOut = json.dumps(
-        data, cls=NumpyEncoder
-    )  # indent=2, ensure_ascii=False, sort_keys=True)
-    file1 = open(outFileName, "w")
-    file1.write(jsonOut)
-    file1.close()
+JSON_BLOCK_SIZE = 1 << 16  # array elements encoded at a time
+
+
+def writeJsonValue(f=None, value=None, blockSize=JSON_BLOCK_SIZE):
+    """
+    *** Write one value: mappings key by key and numpy arrays block by block, so no list copy or
+    *** string of more than blockSize elements is ever built; the output is what json.dumps gives
+    """
+    if isinstance(value, Mapping):
+        f.write("{")
+        for i, (key, item) in enumerate(value.items()):
+            f.write((", " if i else "") + json.dumps(str(key)) + ": ")
+            writeJsonValue(f=f, value=item, blockSize=blockSize)
+        f.write("}")
+    elif isinstance(value, np.ndarray) and value.ndim == 1:
+        f.write("[")
+        for start in range(0, len(value), blockSize):
+            block = value[start : start + blockSize].tolist()
+            f.write((", " if start else "") + json.dumps(block)[1:-1])
+        f.write("]")
+    else:
+        f.write(json.dumps(value, cls=NumpyEncoder))
+
+
+def writeToJson(data="", outFileName="", blockSize=JSON_BLOCK_SIZE):
+    """
+    *** Stream {station: {column: array}} to json station by station and column by column
+    *** Written to a temporary file first, an interrupted write never leaves a torn file behind
+    """
+    with open(outFileName + ".tmp", "w") as f:
+        writeJsonValue(f=f, value=data, blockSize=blockSize)
+    os.replace(outFileName + ".tmp", outFileName)
     return
 
 
+##########################################################
+class JsonStreamReader:
+    """
+    *** Minimal incremental reader of a {station: {column: [values]}} json file
+    *** The file is read in blocks; skipped values are scanned past without being decoded
+    """
+
+    STRUCTURE_PATTERN = re.compile(r'[\[\]{}"]')
+    STRING_BODY_PATTERN = re.compile(r'(?:[^"\\]|\\.)*')
+    SCALAR_END_PATTERN = re.compile(r"[,}\]\s]")
+
+    def __init__(self, f=None, blockSize=1 << 20):
+        self.f = f
+        self.blockSize = blockSize
+        self.buffer = ""
+        self.pos = 0
+
+    ######################################################
+    def fill(self):
+        """
+        *** Drop the consumed part of the buffer and read the next block, False at the end of the file
+        """
+        block = self.f.read(self.blockSize)
+        self.buffer = self.buffer[self.pos :] + block
+        self.pos = 0
+        return bool(block)
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                raise ValueError("Unexpected end of json file")
+
+    def expect(self, chars=""):
+        char = self.peek()
+        if char not in chars:
+            raise ValueError(f"Expected one of {chars!r} in json file, found {char!r}")
+        self.pos += 1
+        return char
+
+    ######################################################
+    def scan(self, pattern=None, capture=None):
+        """
+        *** Advance past the next match of pattern (refilling as needed), optionally keeping the text
+        """
+        while True:
+            match = pattern.search(self.buffer, self.pos)
+            if match is not None:
+                if capture is not None:
+                    capture.append(self.buffer[self.pos : match.end()])
+                self.pos = match.end()
+                return match.group()[-1]
+            if capture is not None:
+                capture.append(self.buffer[self.pos :])
+            self.pos = len(self.buffer)
+            if not self.fill():
+                raise ValueError("Unexpected end of json file")
+
+    def scanString(self, capture=None):
+        """
+        *** Advance past the closing quote of a string whose opening quote is already consumed
+        *** (a backslash at the end of a block stays in the buffer until the next block is read)
+        """
+        while True:
+            end = self.STRING_BODY_PATTERN.match(self.buffer, self.pos).end()
+            if capture is not None:
+                capture.append(self.buffer[self.pos : end])
+            self.pos = end
+            if end < len(self.buffer) and self.buffer[end] == '"':
+                self.pos += 1
+                if capture is not None:
+                    capture.append('"')
+                return
+            if not self.fill():
+                raise ValueError("Unexpected end of json file")
+
+    def readValueText(self, capture=None):
+        """
+        *** Scan one value; its text is appended to capture when given (None = skip it)
+        """
+        char = self.peek()
+        if char == '"':
+            self.pos += 1
+            if capture is not None:
+                capture.append('"')
+            self.scanString(capture=capture)
+        elif char in "[{":
+            depth = 0
+            while True:
+                char = self.scan(pattern=self.STRUCTURE_PATTERN, capture=capture)
+                if char == '"':
+                    self.scanString(capture=capture)
+                elif char in "[{":
+                    depth += 1
+                elif char in "]}":
+                    depth -= 1
+                    if depth == 0:
+                        return
+        else:
+            self.scan(pattern=self.SCALAR_END_PATTERN, capture=capture)
+            self.pos -= 1  # the delimiter belongs to the enclosing value
+            if capture is not None:
+                capture[-1] = capture[-1][:-1]
+
+    def readValue(self):
+        capture = []
+        self.readValueText(capture=capture)
+        return json.loads("".join(capture))
+
+    ######################################################
+    def iterObject(self):
+        """
+        *** Yield the keys of the object at the current position; the caller reads or skips each value
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            self.expect('"')
+            capture = ['"']
+            self.scanString(capture=capture)
+            key = json.loads("".join(capture))
+            self.expect(":")
+            yield key
+            if self.expect(",}") == "}":
+                return
+
+
+##########################################################
+def iterJsonStations(fileName="", stations=None, columns=None, blockSize=1 << 20):
+    """
+    *** Yield (station, {column: array}) from a file written by writeToJson, one station at a time
+    *** stations/columns restrict what is decoded, everything else is skipped without being parsed,
+    *** so memory stays around the size of one station whatever the size of the file
+    """
+    stations = None if stations is None else set(stations)
+    with open(fileName, "r") as f:
+        reader = JsonStreamReader(f=f, blockSize=blockSize)
+        for station in reader.iterObject():
+            if stations is not None and station not in stations:
+                reader.readValueText()
+                continue
+            stationData = {}
+            for column in reader.iterObject():
+                if columns is not None and column not in columns:
+                    reader.readValueText()
+                    continue
+                stationData[column] = np.asarray(reader.readValue())
+            yield station, stationData
+
+
+def readFromJson(fileName="", stations=None, columns=None):
+    """
+    *** {station: {column: array}} of the selected stations/columns (all of them by default)
+    """
+    return dict(iterJsonStations(fileName=fileName, stations=stations, columns=columns))
+
+
 ##########################################################
 def generateInputFileDict():
     # for later, can create a sandox.py for inputs to map
     inputData = {}
     inputData["booleanRunSeriesVsParallel"] = 0
-    inputData["parseDataBool"] = [0, 1][0]
+    # 0 = load cached store, 1 = full ingest, 2 = append only the new hours to the cached store
+    inputData["parseDataBool"] = [0, 1, 2][0]
+    # Per-stage timers/counters/histograms/gauges written to Data/pipelineMetrics.json at the end of a run
+    # metricsPort > 0 also serves them in Prometheus text format on http://metricsHost:metricsPort/metrics
+    # (127.0.0.1 = this machine only, "0.0.0.0" lets a remote Prometheus scrape it)
+    inputData["collectMetrics"] = 1
+    inputData["metricsPort"] = 0
+    inputData["metricsHost"] = "127.0.0.1"
+    # Figures are a separate step after loading: only redrawn when the station table changed
+    # (Data/figureCache.json), plotsInBackground = 1 draws them in a worker process next to the analysis
+    inputData["generatePlots"] = 1
+    inputData["plotsInBackground"] = 1
+    # Export Data/weatherStationCube.nc: station x time (x variable) on one hourly UTC axis, zlib compressed
+    # in (16 stations x cubeChunkHours) chunks so readers only decompress the chunks they select
+    inputData["exportStationCube"] = 0
+    inputData["cubeChunkHours"] = 24 * 30
+    # QC pass after cleaning: spikes (rolling median), stuck sensors, step changes and disagreement with the
+    # anomalyNeighbors closest stations (within anomalyMaxDistanceKm), one uint8 bitmask per value saved to
+    # Data/anomalyMasks.npz; thresholds are robust z-scores, the data itself is not modified
+    inputData["detectAnomalies"] = 0
+    inputData["anomalyThresholds"] = {"spike": 6.0, "step": 6.0, "spatial": 5.0}
+    inputData["anomalyNeighbors"] = 5
+    inputData["anomalyMaxDistanceKm"] = 400.0
+    # Daily/monthly/yearly count/sum/min/max per station saved to Data/weatherDataRollups after cleaning
+    # (built once from the cached store, refreshed bucket by bucket on parseDataBool = 2)
+    inputData["buildRollups"] = 1
+    # PROB01 feature analysis: processes analyzing stations in parallel (0 = in process) and the
+    # target variable features are ranked against
+    inputData["analysisWorkers"] = max(1, (os.cpu_count() or 2) - 1)
+    inputData["analysisTarget"] = "T_HR_AVG"
+    # PROB02 gridding: variable, number of most recent hours, grid spacing (degrees) and IDW settings
+    inputData["mapVariable"] = "T_HR_AVG"
+    inputData["mapHours"] = 24 * 7
+    inputData["gridResolution"] = 0.5
+    inputData["idwNeighbors"] = 8
+    inputData["idwPower"] = 2.0
+    # PROB03 forecasting: target, horizons (hours ahead), lag/rolling features, ridge penalty,
+    # rolling-origin backtest folds, worker processes and the wall time budget (seconds) for all stations
+    inputData["forecastVariable"] = "T_HR_AVG"
+    inputData["forecastHorizons"] = [1, 3, 6, 12, 24]
+    inputData["forecastLags"] = 24
+    inputData["forecastRollingWindows"] = [24, 168]
+    inputData["forecastRidge"] = 1.0
+    inputData["forecastFolds"] = 4
+    inputData["forecastFoldHours"] = 168
+    inputData["forecastWorkers"] = max(1, (os.cpu_count() or 2) - 1)
+    inputData["forecastTimeBudget"] = 3600
     if inputData["parseDataBool"] == 1:
         inputData["idealDates"] = [
             2020,
@@ -43,8 +279,37 @@ def generateInputFileDict():
             2024,
             2025,
         ]  # user specify years
+        # USCRN product to ingest: "hourly02" or "subhourly01" (5-minute, about 12x the rows)
+        inputData["product"] = "hourly02"
         if inputData["booleanRunSeriesVsParallel"] == 0:
+            # station downloads kept in flight across all years
             inputData["batchSize"] = 20
+            # processes parsing station files next to the downloads, 0 = parse on the event loop
+            inputData["parseWorkers"] = max(1, (os.cpu_count() or 2) - 1)
+            # > 1 splits the backfill into that many shard processes ("years" ranges or station "hash"
+            # buckets) writing to Data/ingestShards, then merges them (see utils/shardedIngest.py)
+            inputData["ingestShards"] = 0
+            inputData["shardMode"] = "hash"
+            # Plan from the year listings first and only download stations listed in every year
+            inputData["planIngest"] = 1
+            # 1 = parse files in chunks of streamChunkRows rows and append them straight to the store,
+            # peak memory no longer grows with the dataset (see utils/streamingIngest.py)
+            inputData["streamIngest"] = 0
+            inputData["streamChunkRows"] = 100000
+        # Raw payloads are kept under Data/httpCache and revalidated with ETag/Last-Modified
+        inputData["useHttpCache"] = 1
+        inputData["offlineMode"] = 0  # 1 = serve only from the cache, no network
+        # Per-file retries with exponential backoff (5xx, 429 and connection errors, a 404 is final);
+        # resumeIngest = 1 only re-fetches files the manifest (Data/ingestManifest.json) does not
+        # list as completed, the rest comes from the cache
+        inputData["maxRetries"] = 4
+        inputData["retryBaseDelay"] = 1.0
+        inputData["resumeIngest"] = 0
+        # Hold the freshly cleaned data as a compact StationTable (float32/int/uint8 columns)
+        inputData["useStationTable"] = 1
+    if inputData["parseDataBool"] == 2:
+        inputData["batchSize"] = 20
+        inputData["useHttpCache"] = 1
     return inputData
 
 